@@ -0,0 +1,237 @@
+# ASGI application, serves the same routes as main.py (WSGI) from a single event loop
+import asyncio
+import json
+import mimetypes
+import os
+from datetime import date
+from urllib.parse import parse_qs
+
+from jinja2 import Environment, FileSystemLoader, select_autoescape
+from werkzeug.http import http_date
+from werkzeug.security import safe_join
+
+import handlers
+from commons import DRAIN_TIMEOUT
+from components.logs.log_hub import STREAM_POLL
+from components.metrics.metrics import stage_seconds
+from utils.log import get_logger
+
+logger = get_logger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+STATIC_DIR = os.path.join(BASE_DIR, 'static')
+
+templates = Environment(
+    loader=FileSystemLoader(os.path.join(BASE_DIR, 'templates')),
+    autoescape=select_autoescape(),
+)
+
+
+async def read_body(receive):
+    """
+    Reads the full request body
+    :param receive: ASGI receive callable
+    :return: bytes
+    """
+    chunks = []
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            break
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body', False):
+            break
+    return b''.join(chunks)
+
+
+async def respond(send, status, body=b'', content_type='text/plain; charset=utf-8', headers=None):
+    """
+    Sends a complete response
+    :param send: ASGI send callable
+    :param status: status code
+    :param body: str or bytes
+    :param content_type: Content-Type header
+    :param headers: additional headers
+    """
+    if isinstance(body, str):
+        body = body.encode('utf-8')
+    raw_headers = [(b'content-type', content_type.encode()), (b'content-length', str(len(body)).encode())]
+    raw_headers += [(k.lower().encode(), str(v).encode()) for k, v in (headers or {}).items()]
+    await send({'type': 'http.response.start', 'status': status, 'headers': raw_headers})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+def json_default(value):
+    # dates are serialized the same way as Flask's jsonify
+    if isinstance(value, date):
+        return http_date(value)
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+
+async def respond_json(send, status, data, headers=None):
+    await respond(send, status, json.dumps(data, default=json_default), 'application/json', headers)
+
+
+async def dashboard(scope, receive, send, query):
+    if not handlers.gui_access(query.get('guiKey')):
+        return await respond(send, 401, 'Access Denied')
+
+    # serve the dashboard
+    html = templates.get_template('dashboard.html').render(**handlers.dashboard_context())
+    await respond(send, 200, html, 'text/html; charset=utf-8')
+
+
+async def webhook(scope, receive, send, query):
+    headers = dict(scope['headers'])
+    content_type = headers.get(b'content-type', b'').decode('latin-1') or None
+    with stage_seconds.time(stage='read'):
+        body = await read_body(receive)
+
+    # off the loop: the write-ahead log append waits for its group commit (fsync), actions run on the dispatcher
+    status, data, response_headers = await asyncio.get_running_loop().run_in_executor(
+        None, handlers.handle_webhook, content_type, body)
+    if isinstance(data, list):
+        return await respond_json(send, status, data, response_headers)
+    await respond(send, status, data, headers=response_headers)
+
+
+async def dispatch_stats(scope, receive, send, query):
+    await respond_json(send, 200, handlers.dispatch_stats())
+
+
+async def get_metrics(scope, receive, send, query):
+    await respond(send, 200, handlers.render_metrics(), 'text/plain; version=0.0.4; charset=utf-8')
+
+
+async def get_logs(scope, receive, send, query):
+    headers = dict(scope['headers'])
+    if_none_match = headers.get(b'if-none-match', b'').decode('latin-1') or None
+    status, data, response_headers = await asyncio.get_running_loop().run_in_executor(
+        None, handlers.read_logs, query.get('since'), query.get('limit'), if_none_match)
+    if isinstance(data, list):
+        return await respond_json(send, status, data, response_headers)
+    await respond(send, status, data, headers=response_headers)
+
+
+async def stream_logs(scope, receive, send, query):
+    loop = asyncio.get_running_loop()
+    wake = asyncio.Event()
+    last_event_id = dict(scope['headers']).get(b'last-event-id', b'').decode('latin-1') or None
+    stream = handlers.open_log_stream(last_event_id, lambda: loop.call_soon_threadsafe(wake.set))
+    if stream is None:
+        # EventSource does not reconnect on 204, the dashboard falls back to polling /logs
+        return await respond(send, 204)
+
+    disconnected = False
+
+    async def watch():
+        nonlocal disconnected
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+        disconnected = True
+        wake.set()
+
+    watcher = asyncio.ensure_future(watch())
+    try:
+        first = stream.start()
+        if not first:
+            return await respond(send, 204)
+        headers = [(b'content-type', b'text/event-stream'), (b'cache-control', b'no-cache')]
+        await send({'type': 'http.response.start', 'status': 200, 'headers': headers})
+        await send({'type': 'http.response.body', 'body': first.encode(), 'more_body': True})
+        while stream.open and not disconnected:
+            try:
+                await asyncio.wait_for(wake.wait(), STREAM_POLL)
+            except asyncio.TimeoutError:
+                pass
+            wake.clear()
+            chunk = stream.read()
+            if chunk and not disconnected:
+                await send({'type': 'http.response.body', 'body': chunk.encode(), 'more_body': True})
+        if not disconnected:
+            await send({'type': 'http.response.body', 'body': b''})
+    finally:
+        watcher.cancel()
+        stream.close()
+
+
+async def query_journal(scope, receive, send, query):
+    # alert payloads and broker responses, behind the GUI key
+    if not handlers.gui_access(query.get('guiKey')):
+        return await respond(send, 401, 'Access Denied')
+    status, data = await asyncio.get_running_loop().run_in_executor(None, handlers.query_journal, query)
+    if isinstance(data, list):
+        return await respond_json(send, status, data)
+    await respond(send, status, data)
+
+
+async def activate_event(scope, receive, send, query):
+    status, data = handlers.set_event_active(query.get('event'), query.get('active'))
+    if isinstance(data, dict):
+        return await respond_json(send, status, data)
+    await respond(send, status, data)
+
+
+async def static(scope, receive, send, path):
+    file_path = safe_join(STATIC_DIR, path)
+    if file_path is None or not os.path.isfile(file_path):
+        return await respond(send, 404, 'Not Found')
+
+    def read():
+        with open(file_path, 'rb') as static_file:
+            return static_file.read()
+
+    content = await asyncio.get_running_loop().run_in_executor(None, read)
+    content_type = mimetypes.guess_type(file_path)[0] or 'application/octet-stream'
+    await respond(send, 200, content, content_type, {'Cache-Control': 'public, max-age=3600'})
+
+
+ROUTES = {
+    '/': {'GET': dashboard},
+    '/webhook': {'POST': webhook},
+    '/dispatch/stats': {'GET': dispatch_stats},
+    '/metrics': {'GET': get_metrics},
+    '/logs': {'GET': get_logs},
+    '/logs/stream': {'GET': stream_logs},
+    '/journal': {'GET': query_journal},
+    '/event/active': {'POST': activate_event},
+}
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            # reads and rewrites the write-ahead log, off the loop
+            await asyncio.get_running_loop().run_in_executor(None, handlers.replay_wal)
+            logger.info('ASGI app started')
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            # runs the accepted alerts, closes the write-ahead log and flushes the journal, off the loop
+            drained = await asyncio.get_running_loop().run_in_executor(None, handlers.drain, DRAIN_TIMEOUT)
+            logger.info('ASGI app stopped' + ('' if drained else ', alerts left to replay'))
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await lifespan(receive, send)
+    if scope['type'] != 'http':
+        return
+
+    path = scope['path']
+    method = scope['method']
+
+    if path.startswith('/static/') and method == 'GET':
+        return await static(scope, receive, send, path[len('/static/'):])
+
+    methods = ROUTES.get(path)
+    if methods is None:
+        return await respond(send, 404, 'Not Found')
+    route = methods.get(method)
+    if route is None:
+        return await respond(send, 405, 'Method Not Allowed', headers={'Allow': ', '.join(methods)})
+
+    query = {k: v[0] for k, v in parse_qs(scope['query_string'].decode('latin-1')).items()}
+    await route(scope, receive, send, query)
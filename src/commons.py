@@ -1,14 +1,86 @@
 # settings
+import os
 import uuid
 
-LOG_LOCATION = 'components/logs/log.log'
+from dotenv import load_dotenv
+
+load_dotenv()
+
+LOG_LOCATION = os.getenv('LOG_LOCATION', 'components/logs/log.log')
 LOG_LIMIT = 100
+# the log file is trimmed a segment at a time: once past LOG_SEGMENT_BYTES it is moved to log.log.1 (replacing it)
+LOG_SEGMENT_BYTES = int(os.getenv('LOG_SEGMENT_BYTES', str(64 * 1024)))
+# live log streams (GET /logs/stream) per process, each holds a waitress thread (added to --workers by tvwb start),
+# and buffers at most LOG_STREAM_BUFFER entries for a slow client
+LOG_STREAM_CLIENTS = int(os.getenv('LOG_STREAM_CLIENTS', '4'))
+LOG_STREAM_BUFFER = int(os.getenv('LOG_STREAM_BUFFER', '100'))
+
+# dispatch (webhooks are acknowledged once queued, actions run on the worker pool)
+DISPATCH_WORKERS = int(os.getenv('DISPATCH_WORKERS', '4'))
+DISPATCH_QUEUE_SIZE = int(os.getenv('DISPATCH_QUEUE_SIZE', '100'))
+
+# priority lanes, each with its own queue and workers (events pick a lane with their `priority`), a lane runs as many
+# (broker, account, symbol) shards at once as it has workers: alerts are ordered within a shard, not across shards
+DISPATCH_CRITICAL_WORKERS = int(os.getenv('DISPATCH_CRITICAL_WORKERS', '4'))
+DISPATCH_CRITICAL_QUEUE_SIZE = int(os.getenv('DISPATCH_CRITICAL_QUEUE_SIZE', '100'))
+DISPATCH_LOW_WORKERS = int(os.getenv('DISPATCH_LOW_WORKERS', '2'))
+DISPATCH_LOW_QUEUE_SIZE = int(os.getenv('DISPATCH_LOW_QUEUE_SIZE', '100'))
+
+# threads running actions without a backend, independent actions of an event run concurrently
+DISPATCH_ACTION_WORKERS = int(os.getenv('DISPATCH_ACTION_WORKERS', '8'))
+# actions waiting for a thread before new ones fail as saturated, 0 for no limit
+ACTION_QUEUE_SIZE = int(os.getenv('ACTION_QUEUE_SIZE', '100'))
+
+# bulkheads: actions declaring a `backend` run on that backend's own threads and queue,
+# so a hung terminal or exchange only saturates its own pool
+BACKEND_MT5_WORKERS = int(os.getenv('BACKEND_MT5_WORKERS', '2'))
+BACKEND_MT5_QUEUE_SIZE = int(os.getenv('BACKEND_MT5_QUEUE_SIZE', '50'))
+BACKEND_NT_WORKERS = int(os.getenv('BACKEND_NT_WORKERS', '4'))
+BACKEND_NT_QUEUE_SIZE = int(os.getenv('BACKEND_NT_QUEUE_SIZE', '50'))
+BACKEND_CCXT_WORKERS = int(os.getenv('BACKEND_CCXT_WORKERS', '4'))
+BACKEND_CCXT_QUEUE_SIZE = int(os.getenv('BACKEND_CCXT_QUEUE_SIZE', '50'))
+# any other backend
+BACKEND_WORKERS = int(os.getenv('BACKEND_WORKERS', '4'))
+BACKEND_QUEUE_SIZE = int(os.getenv('BACKEND_QUEUE_SIZE', '50'))
+
+# default action deadline (seconds, 0 disables), actions can set their own with `timeout`
+ACTION_TIMEOUT = float(os.getenv('ACTION_TIMEOUT', '30'))
+# threads stuck in abandoned actions that are replaced, beyond this new actions wait for a free thread
+ACTION_MAX_ABANDONED = int(os.getenv('ACTION_MAX_ABANDONED', '16'))
+
+# duplicate alerts inside this window (seconds) are not triggered again, 0 disables: off by default, identical
+# payloads can be legitimate (i.e. two entries on the same bar), send an alert_id to tell them apart
+DEDUPE_WINDOW = float(os.getenv('DEDUPE_WINDOW', '0'))
+DEDUPE_MAX_ENTRIES = int(os.getenv('DEDUPE_MAX_ENTRIES', '10000'))
+
+# admission control (alerts per second and burst size), webhooks over the limit are answered with 429, 0 disables
+RATE_LIMIT_PER_KEY = float(os.getenv('RATE_LIMIT_PER_KEY', '0'))
+RATE_LIMIT_PER_KEY_BURST = float(os.getenv('RATE_LIMIT_PER_KEY_BURST', '0'))
+RATE_LIMIT_GLOBAL = float(os.getenv('RATE_LIMIT_GLOBAL', '0'))
+RATE_LIMIT_GLOBAL_BURST = float(os.getenv('RATE_LIMIT_GLOBAL_BURST', '0'))
+
+# write-ahead log of accepted alerts, fsynced before the webhook is acknowledged and replayed at startup
+# until their actions have run, empty WAL_PATH disables
+WAL_PATH = os.getenv('WAL_PATH', 'components/logs/wal.log')
+WAL_FSYNC = os.getenv('WAL_FSYNC', 'true').lower() != 'false'
+# the log is compacted down to the alerts still pending once it grows past this size (bytes)
+WAL_MAX_BYTES = int(os.getenv('WAL_MAX_BYTES', str(4 * 1024 * 1024)))
+
+# audit journal (SQLite) of alerts, action runs and broker calls, written in the background, empty JOURNAL_PATH disables
+JOURNAL_PATH = os.getenv('JOURNAL_PATH', 'components/logs/journal.db')
+JOURNAL_QUEUE_SIZE = int(os.getenv('JOURNAL_QUEUE_SIZE', '10000'))
+JOURNAL_BATCH_SIZE = int(os.getenv('JOURNAL_BATCH_SIZE', '500'))
+
+# reloads (tvwb start --supervised): a new worker generation must warm up within READY_TIMEOUT seconds,
+# then the old one gets DRAIN_TIMEOUT seconds to finish in-flight requests and queued alerts
+READY_TIMEOUT = float(os.getenv('READY_TIMEOUT', '60'))
+DRAIN_TIMEOUT = float(os.getenv('DRAIN_TIMEOUT', '30'))
+
+# maximum number of alerts in a single batch webhook
+WEBHOOK_BATCH_LIMIT = int(os.getenv('WEBHOOK_BATCH_LIMIT', '50'))
 
 # ensure log file exists
-try:
-    open(LOG_LOCATION, 'r')
-except FileNotFoundError:
-    open(LOG_LOCATION, 'w').close()
+open(LOG_LOCATION, 'a').close()
 
 # DO NOT CHANGE
 VERSION_NUMBER = '0.6'
@@ -1,17 +1,24 @@
-from time import sleep
+import asyncio
+
 from components.actions.base.action import Action
 
+
 class AsyncDemo(Action):
     def __init__(self):
         super().__init__()
 
-    def run(self, *args, **kwargs):
-        super().run(*args, **kwargs)  # this is required
+    async def run(self, context=None, *args, **kwargs):
+        super().run(context, *args, **kwargs)  # this is required
         """
-        Custom run method. Add your custom logic here.
+        Custom async run method. Add your custom logic here.
         """
         print(self.name, '---> action has started...')
-        for i in range(5):
-            print(f'{self.name} ---> {i}')
-            sleep(1)
+        try:
+            for i in range(5):
+                print(f'{self.name} ---> {i}')
+                # awaiting frees the event loop for other actions, and is where a missed deadline cancels the action
+                await asyncio.sleep(1)
+        except asyncio.CancelledError:
+            print(self.name, '---> action was cancelled!')
+            raise
         print(self.name, '---> action has completed!')
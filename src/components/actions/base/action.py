@@ -1,6 +1,12 @@
 import datetime
+import inspect
+import time
+import uuid
+from contextvars import ContextVar
 from logging import getLogger, DEBUG
 
+from components.dispatch.deadline import CancelToken
+from components.dispatch.dispatcher import dispatcher
 from components.logs.log_event import LogEvent
 from utils.log import get_logger
 
@@ -10,6 +16,18 @@ logger = get_logger(__name__)
 class ActionManager:
     def __init__(self):
         self._actions = []
+        self._by_name = {}
+
+    def add(self, action):
+        """
+        Adds action to manager and indexes it by name
+        :param action: Action()
+        """
+        existing = self._by_name.get(action.name)
+        if existing is not None:
+            self._actions.remove(existing)
+        self._actions.append(action)
+        self._by_name[action.name] = action
 
     def get_all(self):
         """
@@ -24,11 +42,10 @@ class ActionManager:
         :param action_name: name of action
         :return: Action()
         """
-        for action in self._actions:
-            if action.name == action_name:
-                return action
-
-        raise ValueError(f'Cannot find action with name {action_name}')
+        try:
+            return self._by_name[action_name]
+        except KeyError:
+            raise ValueError(f'Cannot find action with name {action_name}')
 
 
 am = ActionManager()
@@ -41,13 +58,89 @@ class ActionLogEvent:
         self.msg = msg
 
 
+def new_correlation_id():
+    return uuid.uuid4().hex[:12]
+
+
+class ActionContext:
+    """
+    State of a single action invocation: the webhook payload, timing, deadline and the alert's correlation id.
+    Actions are shared by every dispatch worker, anything specific to one alert lives here rather than on the action.
+    """
+
+    __slots__ = ('data', 'event', 'correlation_id', 'received_at', 'started_at', 'deadline', 'cancel_token')
+
+    def __init__(self, data, event: str = None, correlation_id: str = None, received_at: float = None,
+                 timeout: float = None):
+        self.data = data
+        self.event = event
+        self.correlation_id = correlation_id or new_correlation_id()
+        self.received_at = time.monotonic() if received_at is None else received_at  # monotonic, when triggered
+        self.started_at = None  # monotonic, when the action started running
+        self.deadline = time.monotonic() + timeout if timeout else None  # monotonic
+        self.cancel_token = CancelToken()  # cancelled when the action is abandoned past its deadline
+
+    @property
+    def cancelled(self):
+        return self.cancel_token.cancelled
+
+    def remaining(self):
+        """
+        Gets the time left before the deadline, i.e. to cap a broker call's own timeout
+        :return: seconds (0 if past), None without a deadline
+        """
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.monotonic())
+
+    def elapsed(self):
+        """
+        Gets the time since the alert was triggered
+        :return: seconds
+        """
+        return time.monotonic() - self.received_at
+
+    def __repr__(self):
+        return f'ActionContext(event={self.event}, correlation_id={self.correlation_id})'
+
+
+# context of the action running on the current thread (or task)
+_current_context = ContextVar('action_context', default=None)
+
+
+def current_context():
+    """
+    Gets the context of the action invocation running on the current thread
+    :return: ActionContext(), None outside of an action
+    """
+    return _current_context.get()
+
+
+def _takes_context(run):
+    # custom actions written as run(self) (no arguments) are called without the context
+    parameters = list(inspect.signature(run).parameters.values())
+    return any(p.kind in (p.POSITIONAL_ONLY, p.POSITIONAL_OR_KEYWORD, p.VAR_POSITIONAL) for p in parameters)
+
+
 class Action:
     objects = am
 
+    # deadline in seconds, None uses ACTION_TIMEOUT, 0 disables
+    timeout = None
+
+    # broker backend the action calls (i.e. mt5, nt, ccxt), it runs on that backend's own pool, None for the default pool
+    backend = None
+
     def __init__(self):
         self.name = self.get_name()
         self.logs = []
         self._raw_data = None
+        self._run_takes_context = _takes_context(self.run)
+
+    @property
+    def is_async(self):
+        """True if run is a coroutine (async def run), such actions run on the dispatcher's event loop"""
+        return inspect.iscoroutinefunction(self.run)
 
     def get_name(self):
         return type(self).__name__
@@ -66,24 +159,80 @@ class Action:
         """
         Registers action with manager
         """
-        self.objects._actions.append(self)
+        self.objects.add(self)
         logger.info(f'ACTION REGISTERED --->\t{str(self)}')
 
+    def warm_up(self):
+        """
+        Called in each worker before it serves requests (i.e. before a reloaded generation takes over),
+        override to open or check broker connections
+        """
+
     def set_data(self, data):
-        """Sets data for action"""
+        """
+        Sets data used by validate_data() outside of invoke(), kept for custom code calling set_data() then run().
+        Not safe with concurrent alerts, the data is shared by every worker.
+        """
         self._raw_data = data
 
+    @property
+    def context(self):
+        """
+        Context of the invocation running on the current thread
+        :return: ActionContext(), None outside of invoke()
+        """
+        return _current_context.get()
+
     def validate_data(self):
-        """Ensures data is valid"""
-        if not self._raw_data:
+        """Ensures data is valid, reads the data of the invocation running on the current thread"""
+        context = _current_context.get()
+        data = context.data if context is not None else self._raw_data
+        if not data:
             raise ValueError('No data provided to action')
-        return self._raw_data
+        return data
 
-    def run(self, *args, **kwargs):
+    def invoke(self, context: ActionContext):
+        """
+        Runs the action for a single alert. Safe to call concurrently, each call sees its own context.
+        Async actions are run on the dispatcher's event loop, and waited for.
+        :param context: ActionContext()
+        """
+        if self.is_async:
+            return dispatcher.loop.submit(self.invoke_async(context)).result()
+
+        token = _current_context.set(context)
+        context.started_at = time.monotonic()
+        try:
+            if self._run_takes_context:
+                return self.run(context)
+            return self.run()
+        finally:
+            _current_context.reset(token)
+
+    async def invoke_async(self, context: ActionContext):
+        """
+        Runs an async action for a single alert, on the event loop.
+        The context is set for the task running the action only, concurrent actions on the loop see their own.
+        :param context: ActionContext()
+        """
+        token = _current_context.set(context)
+        context.started_at = time.monotonic()
+        try:
+            if self._run_takes_context:
+                return await self.run(context)
+            return await self.run()
+        finally:
+            _current_context.reset(token)
+
+    def run(self, context: ActionContext = None, *args, **kwargs):
         """
-        Runs, logs action
+        Runs, logs action.
+        Async actions (async def run) call it without awaiting it: super().run(context, *args, **kwargs)
+        :param context: ActionContext() of the invocation, also available as self.context
         """
+        context = context if isinstance(context, ActionContext) else _current_context.get()
+        correlation_id = context.correlation_id if context is not None else None
         self.logs.append(ActionLogEvent('INFO', 'action run'))
         log_event = LogEvent(self.name, 'action_run', datetime.datetime.now(), f'{self.name} triggered')
         log_event.write()
-        logger.info(f'ACTION TRIGGERED --->\t{str(self)}')
+        logger.info(f'ACTION TRIGGERED --->\t{str(self)} ({correlation_id})')
@@ -5,8 +5,8 @@ class TemplateActionClass(Action):
     def __init__(self):
         super().__init__()
 
-    def run(self, *args, **kwargs):
-        super().run(*args, **kwargs)  # this is required
+    def run(self, context=None, *args, **kwargs):
+        super().run(context, *args, **kwargs)  # this is required
         """
         Custom run method. Add your custom logic here.
         """
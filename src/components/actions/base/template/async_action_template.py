@@ -0,0 +1,17 @@
+import asyncio
+
+from components.actions.base.action import Action
+
+
+class TemplateActionClass(Action):
+    def __init__(self):
+        super().__init__()
+
+    async def run(self, context=None, *args, **kwargs):
+        super().run(context, *args, **kwargs)  # this is required (not awaited)
+        """
+        Custom async run method, runs on the dispatcher's event loop. Add your custom logic here.
+        Await I/O (i.e. aiohttp, asyncio.sleep) rather than blocking, a blocking call stalls every async action.
+        """
+        await asyncio.sleep(0)
+        print(self.name, '---> action has run!')
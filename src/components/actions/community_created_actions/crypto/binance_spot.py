@@ -2,6 +2,8 @@ from components.actions.base.action import Action
 import ccxt as ccxt
 
 class BinanceSpot(Action):
+    backend = 'ccxt'
+
     #Add your API_KEY from Binance Testnet or Mainnet
     API_KEY = ''
     #Add your API_SECRET from Binance Testnet or Mainnet
@@ -13,6 +13,7 @@ load_dotenv()
 
 
 class MtAccountBalance(Action, MtUtils):
+    backend = 'mt5'
 
     def __init__(self):
         super().__init__()
@@ -22,6 +23,9 @@ class MtAccountBalance(Action, MtUtils):
     def __del__(self):
         self.logout()
 
+    def warm_up(self):
+        self.ensure_connected()
+
     def run(self, *args, **kwargs):
         super().run(*args, **kwargs)  # required
 
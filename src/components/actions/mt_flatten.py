@@ -2,7 +2,7 @@ import os
 from components.actions.base.action import Action
 import MetaTrader5 as mt5
 from dotenv import load_dotenv
-from utils.formatting import _convert_to_float, _convert_to_int
+from components.metrics.metrics import broker_call
 from utils.log import get_logger
 from .mt_utils import MtUtils
 
@@ -14,6 +14,7 @@ load_dotenv()
 
 
 class MtFlatten(Action, MtUtils):
+    backend = 'mt5'
 
     def __init__(self):
         super().__init__()
@@ -22,14 +23,16 @@ class MtFlatten(Action, MtUtils):
     def __del__(self):
         self.logout()
 
+    def warm_up(self):
+        self.ensure_connected()
+
     def __flatten(self, magic, symbol):
         # Vérifier que le symbole existe
         if not mt5.symbol_select(symbol, True):
             logger.error(f"Symbol {symbol} not found")
             return None
 
-        magic = _convert_to_int(magic)
-
+        # magic is already an int, decoded by the event
         if magic is None or not isinstance(magic, int):
             logger.error("Magic number is missing or invalid")
             return None
@@ -77,7 +80,8 @@ class MtFlatten(Action, MtUtils):
             }
 
             # Envoyer la requête
-            result = mt5.order_send(request)
+            with broker_call("mt5", "order_send", request) as call:
+                result = call.response = mt5.order_send(request)
             if result.retcode != mt5.TRADE_RETCODE_DONE:
                 logger.error(
                     f"Failed to close position {position.ticket}: {result.comment}"
@@ -3,7 +3,7 @@ import logging
 from components.actions.base.action import Action
 import MetaTrader5 as mt5
 from dotenv import load_dotenv
-from utils.formatting import _convert_to_float, _convert_to_int
+from components.metrics.metrics import broker_call
 from utils.log import get_logger
 from .mt_utils import MtUtils
 
@@ -15,6 +15,7 @@ load_dotenv()
 
 
 class MtPlaceOrder(Action, MtUtils):
+    backend = 'mt5'
 
     def __init__(self):
         super().__init__()
@@ -23,6 +24,9 @@ class MtPlaceOrder(Action, MtUtils):
     def __del__(self):
         self.logout()
 
+    def warm_up(self):
+        self.ensure_connected()
+
     def __place_order(
         self,
         magic,
@@ -40,8 +44,7 @@ class MtPlaceOrder(Action, MtUtils):
             logger.error(f"Symbol {symbol} not found")
             return None
 
-        magic = _convert_to_int(magic)
-
+        # magic, volume, price and tp/sl are already typed, decoded by the event
         if magic is None or not isinstance(magic, int):
             logger.error("Magic number is missing or invalid")
             return None
@@ -56,7 +59,6 @@ class MtPlaceOrder(Action, MtUtils):
             logger.error(f"Failed to get symbol info for {symbol}")
             return None
 
-        volume = _convert_to_float(volume)
         if volume is None:
             logger.error("Volume is missing or invalid")
             return None
@@ -65,7 +67,7 @@ class MtPlaceOrder(Action, MtUtils):
 
         # Calculer le prix d'entrée
         if price is not None:
-            entry_price = _convert_to_float(price)
+            entry_price = price
         else:
             tick = mt5.symbol_info_tick(symbol)
             if tick is None:
@@ -123,7 +125,8 @@ class MtPlaceOrder(Action, MtUtils):
                 request["sl"] = sl
 
             # Send order to MT5
-            result = mt5.order_send(request)
+            with broker_call("mt5", "order_send", request) as call:
+                result = call.response = mt5.order_send(request)
             print("Order result:", result)
             return result
 
@@ -49,6 +49,15 @@ class MtUtils:
             self.connected = False
             return False
 
+    def ensure_connected(self) -> bool:
+        """Logs in again if the terminal lost its connection"""
+        if os.getenv("MT5_ENABLED", "false").lower() == "false":
+            return False
+        terminal_info = mt5.terminal_info()
+        if terminal_info is None or not terminal_info.connected:
+            return self.login()
+        return True
+
     def logout(self):
         if os.getenv("MT5_ENABLED", "false").lower() == "false":
             return
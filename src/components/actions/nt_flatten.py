@@ -12,6 +12,7 @@ load_dotenv()
 
 
 class NtFlatten(Action):
+    backend = 'nt'
 
     def __init__(self):
         super().__init__()
@@ -23,6 +24,10 @@ class NtFlatten(Action):
         if hasattr(self, 'nt'):
             self.nt.shutdown()
 
+    def warm_up(self):
+        if hasattr(self, 'nt'):
+            self.nt.initialize()
+
     def __flatten(self, symbol, account=None):
         """
         Close all positions for a symbol using the configured mode (ATI or AddOn)
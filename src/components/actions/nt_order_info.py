@@ -12,6 +12,7 @@ load_dotenv()
 
 
 class NtOrderInfo(Action):
+    backend = 'nt'
 
     def __init__(self):
         super().__init__()
@@ -23,6 +24,10 @@ class NtOrderInfo(Action):
         if hasattr(self, 'nt'):
             self.nt.shutdown()
 
+    def warm_up(self):
+        if hasattr(self, 'nt'):
+            self.nt.initialize()
+
     def __get_orders(self, account=None):
         """
         Get all working orders using the configured mode (AddOn only)
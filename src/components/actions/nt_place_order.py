@@ -13,6 +13,7 @@ load_dotenv()
 
 
 class NtPlaceOrder(Action):
+    backend = 'nt'
 
     def __init__(self):
         super().__init__()
@@ -24,6 +25,10 @@ class NtPlaceOrder(Action):
         if hasattr(self, 'nt'):
             self.nt.shutdown()
 
+    def warm_up(self):
+        if hasattr(self, 'nt'):
+            self.nt.initialize()
+
     def __place_order(
         self,
         symbol,
@@ -12,6 +12,7 @@ load_dotenv()
 
 
 class NtPositionInfo(Action):
+    backend = 'nt'
 
     def __init__(self):
         super().__init__()
@@ -23,6 +24,10 @@ class NtPositionInfo(Action):
         if hasattr(self, 'nt'):
             self.nt.shutdown()
 
+    def warm_up(self):
+        if hasattr(self, 'nt'):
+            self.nt.initialize()
+
     def __get_positions(self, account=None):
         """
         Get all positions using the configured mode (AddOn only)
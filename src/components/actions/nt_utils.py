@@ -2,6 +2,7 @@ import os
 import uuid
 import winreg
 import psutil
+from components.metrics.metrics import broker_call
 from utils.log import get_logger
 
 # Initialize logger
@@ -128,7 +129,7 @@ class NtUtils:
             logger.debug(f"Command: {command}")
             
             # Write command to file
-            with open(file_name, 'w') as f:
+            with broker_call("nt_ati", "write_command", command), open(file_name, 'w') as f:
                 f.write(command)
             
             logger.info("Command executed successfully")
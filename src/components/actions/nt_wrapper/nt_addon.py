@@ -1,8 +1,9 @@
 import os
 import logging
 import requests
+from components.actions.base.action import current_context
+from components.metrics.metrics import broker_call
 from utils.log import get_logger
-from utils.formatting import _convert_to_float, _convert_to_int
 
 logger = get_logger(__name__)
 
@@ -21,7 +22,7 @@ class NtAddOn:
     def initialize(self):
         """Check if AddOn is available"""
         try:
-            response = requests.get(f"{self.base_url}/health", timeout=2)
+            response = self._request("health", "GET", "/health", timeout=2)
             if response.status_code == 200:
                 self.connected = True
                 logger.info(f"Connected to NinjaTrader AddOn at {self.base_url}")
@@ -37,6 +38,18 @@ class NtAddOn:
     def shutdown(self):
         """Cleanup"""
         self.connected = False
+
+    def _request(self, call, method, path, **kwargs):
+        """Send a request to the AddOn, timed as a broker call"""
+        # never wait on the AddOn past the running action's deadline
+        context = current_context()
+        remaining = context.remaining() if context is not None else None
+        if remaining is not None:
+            kwargs["timeout"] = max(0.1, min(kwargs.get("timeout", remaining), remaining))
+        request = {"method": method, "path": path, "params": kwargs.get("params"), "json": kwargs.get("json")}
+        with broker_call("nt_addon", call, request) as record:
+            record.response = requests.request(method, f"{self.base_url}{path}", **kwargs)
+            return record.response
     
     def place_order(
         self,
@@ -70,8 +83,7 @@ class NtAddOn:
             logger.error(f"Invalid order type: {order_type}")
             return False
         
-        # Convert quantity to int
-        quantity = _convert_to_int(quantity)
+        # quantity is already an int, decoded by the event
         if quantity is None or quantity <= 0:
             logger.error(f"Invalid quantity: {quantity}")
             return False
@@ -103,8 +115,10 @@ class NtAddOn:
         logger.info(f"Placing {order_type} order: {quantity} {symbol} @ {order_kind}")
         
         try:
-            response = requests.post(
-                f"{self.base_url}/order/place",
+            response = self._request(
+                "order_place",
+                "POST",
+                "/order/place",
                 json=payload,
                 timeout=10
             )
@@ -141,8 +155,10 @@ class NtAddOn:
         logger.info(f"Closing all positions for {symbol} on account {account}")
         
         try:
-            response = requests.post(
-                f"{self.base_url}/position/flatten",
+            response = self._request(
+                "flatten",
+                "POST",
+                "/position/flatten",
                 json=payload,
                 timeout=10
             )
@@ -170,8 +186,10 @@ class NtAddOn:
             account = self.account
         
         try:
-            response = requests.get(
-                f"{self.base_url}/positions",
+            response = self._request(
+                "positions",
+                "GET",
+                "/positions",
                 params={"account": account},
                 timeout=5
             )
@@ -199,8 +217,10 @@ class NtAddOn:
             account = self.account
         
         try:
-            response = requests.get(
-                f"{self.base_url}/account",
+            response = self._request(
+                "account",
+                "GET",
+                "/account",
                 params={"account": account},
                 timeout=5
             )
@@ -228,8 +248,10 @@ class NtAddOn:
             account = self.account
         
         try:
-            response = requests.get(
-                f"{self.base_url}/orders",
+            response = self._request(
+                "orders",
+                "GET",
+                "/orders",
                 params={"account": account},
                 timeout=5
             )
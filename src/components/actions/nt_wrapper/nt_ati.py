@@ -2,7 +2,6 @@ import os
 import uuid
 import logging
 from utils.log import get_logger
-from utils.formatting import _convert_to_float, _convert_to_int
 from ..nt_utils import NtUtils
 
 logger = get_logger(__name__)
@@ -48,8 +47,7 @@ class NtATI(NtUtils):
             logger.error(f"Invalid order type: {order_type}")
             return False
         
-        # Convert quantity to int
-        quantity = _convert_to_int(quantity)
+        # quantity and tp/sl are already typed, decoded by the event
         if quantity is None or quantity <= 0:
             logger.error(f"Invalid quantity: {quantity}")
             return False
@@ -106,25 +104,21 @@ class NtATI(NtUtils):
                 
                 # Place Take Profit order (LIMIT)
                 if tp is not None:
-                    tp_price = _convert_to_float(tp)
-                    if tp_price is not None:
-                        tp_command = f"PLACE;{account};{symbol};{tp_action};{quantity};LIMIT;{tp_price};;{tif};{oco_id};;{strategy};{strategy_id}"
-                        tp_result = self.execute_command(tp_command)
-                        if tp_result:
-                            logger.info(f"Take Profit order placed: {tp_command}")
-                        else:
-                            logger.error(f"Failed to place Take Profit order")
+                    tp_command = f"PLACE;{account};{symbol};{tp_action};{quantity};LIMIT;{tp};;{tif};{oco_id};;{strategy};{strategy_id}"
+                    tp_result = self.execute_command(tp_command)
+                    if tp_result:
+                        logger.info(f"Take Profit order placed: {tp_command}")
+                    else:
+                        logger.error(f"Failed to place Take Profit order")
                 
                 # Place Stop Loss order (STOPMARKET)
                 if sl is not None:
-                    sl_price = _convert_to_float(sl)
-                    if sl_price is not None:
-                        sl_command = f"PLACE;{account};{symbol};{sl_action};{quantity};STOPMARKET;;{sl_price};{tif};{oco_id};;{strategy};{strategy_id}"
-                        sl_result = self.execute_command(sl_command)
-                        if sl_result:
-                            logger.info(f"Stop Loss order placed: {sl_command}")
-                        else:
-                            logger.error(f"Failed to place Stop Loss order")
+                    sl_command = f"PLACE;{account};{symbol};{sl_action};{quantity};STOPMARKET;;{sl};{tif};{oco_id};;{strategy};{strategy_id}"
+                    sl_result = self.execute_command(sl_command)
+                    if sl_result:
+                        logger.info(f"Stop Loss order placed: {sl_command}")
+                    else:
+                        logger.error(f"Failed to place Stop Loss order")
         else:
             logger.error(f"Failed to place order: {command}")
         
@@ -0,0 +1,107 @@
+import threading
+
+from commons import (
+    DISPATCH_ACTION_WORKERS, ACTION_QUEUE_SIZE, ACTION_MAX_ABANDONED,
+    BACKEND_WORKERS, BACKEND_QUEUE_SIZE,
+    BACKEND_MT5_WORKERS, BACKEND_MT5_QUEUE_SIZE,
+    BACKEND_NT_WORKERS, BACKEND_NT_QUEUE_SIZE,
+    BACKEND_CCXT_WORKERS, BACKEND_CCXT_QUEUE_SIZE,
+)
+from components.dispatch.deadline import DeadlinePool
+from components.metrics.metrics import metrics
+from utils.log import get_logger
+
+logger = get_logger(__name__)
+
+# pool of the actions that don't declare a backend
+DEFAULT_BACKEND = 'default'
+
+
+class Bulkheads:
+    """
+    One action pool per broker backend, each with its own threads and queue limit.
+    Actions pick their pool with their `backend` attribute, so a hung MT5 terminal only ties up the MT5 threads
+    while NinjaTrader and ccxt actions keep running.
+    """
+
+    def __init__(self, default: tuple, backends: dict, backend_default: tuple):
+        """
+        :param default: (workers, queue size) of the pool running actions without a backend
+        :param backends: dict of backend -> (workers, queue size)
+        :param backend_default: (workers, queue size) of backends not listed in backends
+        """
+        self.backend_default = backend_default
+        self.sizes = {DEFAULT_BACKEND: default, **backends}
+        self._pools = {}  # backend -> DeadlinePool
+        self._lock = threading.Lock()
+
+    def pool(self, backend: str = None) -> DeadlinePool:
+        """
+        Gets (or creates) the pool of a backend
+        :param backend: backend name, None for the default pool
+        :return: DeadlinePool()
+        """
+        backend = backend or DEFAULT_BACKEND
+        pool = self._pools.get(backend)
+        if pool is None:
+            with self._lock:
+                pool = self._pools.get(backend)
+                if pool is None:
+                    workers, queue_size = self.sizes.get(backend, self.backend_default)
+                    name = 'action' if backend == DEFAULT_BACKEND else f'action-{backend}'
+                    pool = self._pools[backend] = DeadlinePool(workers, ACTION_MAX_ABANDONED, queue_size, name)
+                    logger.debug(f'Action pool for {backend}: {workers} worker(s), queue size {queue_size}')
+        return pool
+
+    def submit(self, backend, fn, *args, **kwargs):
+        """
+        Runs fn on the pool of a backend, see DeadlinePool.submit()
+        :param backend: backend name, None for the default pool
+        :raises ActionPoolFull: if the backend's queue is full for the job's priority, and admission is reject
+        """
+        return self.pool(backend).submit(fn, *args, **kwargs)
+
+    def stats(self) -> dict:
+        """
+        Gets the counters of every pool
+        :return: dict of backend -> DeadlinePool.stats()
+        """
+        with self._lock:
+            pools = dict(self._pools)
+        return {backend: pool.stats() for backend, pool in pools.items()}
+
+
+bulkheads = Bulkheads(
+    default=(DISPATCH_ACTION_WORKERS, ACTION_QUEUE_SIZE),
+    backends={
+        'mt5': (BACKEND_MT5_WORKERS, BACKEND_MT5_QUEUE_SIZE),
+        'nt': (BACKEND_NT_WORKERS, BACKEND_NT_QUEUE_SIZE),
+        'ccxt': (BACKEND_CCXT_WORKERS, BACKEND_CCXT_QUEUE_SIZE),
+    },
+    backend_default=(BACKEND_WORKERS, BACKEND_QUEUE_SIZE),
+)
+
+metrics.gauge(
+    'tvwb_backend_busy_threads', 'Action threads running an action, by backend',
+    lambda: {(backend,): stats['busy'] for backend, stats in bulkheads.stats().items()},
+    labels=('backend',))
+metrics.gauge(
+    'tvwb_backend_workers', 'Action threads of each backend pool',
+    lambda: {(backend,): stats['workers'] for backend, stats in bulkheads.stats().items()},
+    labels=('backend',))
+metrics.gauge(
+    'tvwb_backend_queue_depth', 'Actions waiting for a thread, by backend',
+    lambda: {(backend,): stats['queued'] for backend, stats in bulkheads.stats().items()},
+    labels=('backend',))
+metrics.gauge(
+    'tvwb_backend_waiting_workers', 'Dispatch lane workers waiting for room in a saturated backend pool, by backend',
+    lambda: {(backend,): stats['waiting'] for backend, stats in bulkheads.stats().items()},
+    labels=('backend',))
+metrics.gauge(
+    'tvwb_action_threads_abandoned', 'Action threads still running an action abandoned past its deadline, by backend',
+    lambda: {(backend,): stats['abandoned'] for backend, stats in bulkheads.stats().items()},
+    labels=('backend',))
+metrics.callback_counter(
+    'tvwb_backend_rejected_total', 'Actions rejected because their backend pool was saturated',
+    lambda: {(backend,): stats['rejected'] for backend, stats in bulkheads.stats().items()},
+    labels=('backend',))
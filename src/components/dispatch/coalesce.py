@@ -0,0 +1,207 @@
+import math
+import threading
+
+from components.dispatch.dispatcher import DispatchQueueFull
+from components.metrics.metrics import metrics
+from components.schemas.payload import Payload
+from utils.log import get_logger
+
+logger = get_logger(__name__)
+
+COALESCE_MODES = ('latest', 'sum')
+
+# attempts at queueing a merged alert while its dispatch lane is full, and seconds between them (doubling), its alerts
+# stay pending in the write-ahead log (replayed at the next start) if every attempt fails
+TRIGGER_ATTEMPTS = 5
+TRIGGER_RETRY = 0.5
+
+
+class _Window:
+    __slots__ = ('event', 'data', 'correlation_ids', 'net', 'callbacks')
+
+    def __init__(self, event, data, correlation_id=None):
+        self.event = event
+        self.data = data
+        self.correlation_ids = [correlation_id]
+        self.net = _signed_quantity(data, event.coalesce_quantity) if event.coalesce_mode == 'sum' else None
+        self.callbacks = []  # called once the merged intent has run (or was not triggered)
+
+    @property
+    def alerts(self):
+        return len(self.correlation_ids)
+
+    def merge(self, data, correlation_id=None):
+        self.correlation_ids.append(correlation_id)
+        self.data = data
+        if self.net is not None:
+            quantity = _signed_quantity(data, self.event.coalesce_quantity)
+            # rounded, so that i.e. 0.1 + 0.2 - 0.3 lot nets to exactly nothing
+            # alerts without a usable side or quantity can't be netted, the latest one then wins
+            self.net = round(self.net + quantity, 8) if quantity is not None else None
+
+    def intent(self):
+        """
+        Gets the merged alert
+        :return: Payload(), None if buy and sell quantities cancel out
+        """
+        if self.event.coalesce_mode != 'sum' or self.net is None or self.alerts == 1:
+            return self.data
+        if self.net == 0:
+            return None
+        side = 'buy' if self.net > 0 else 'sell'
+        order_type = self.data['order_type']
+        return Payload({
+            **self.data,
+            'order_type': side.upper() if order_type.isupper() else side,
+            self.event.coalesce_quantity: abs(self.net),
+        })
+
+
+def _signed_quantity(data, field):
+    order_type = str(data.get('order_type') or '').lower()
+    if order_type not in ('buy', 'sell'):
+        return None
+    # already a number once decoded (see Event.__init__), but the latest alert wins rather than failing the request
+    try:
+        quantity = float(data.get(field))
+    except (TypeError, ValueError):
+        return None
+    if not math.isfinite(quantity):
+        return None
+    return quantity if order_type == 'buy' else -quantity
+
+
+class Coalescer:
+    """
+    Merges alerts for the same symbol (and magic or strategy) arriving within an event's coalescing window into one
+    net intent, triggered once the window closes. 'latest' keeps the last alert, 'sum' nets buy and sell quantities:
+    for orders adding to a position only, nothing is triggered when they cancel out.
+    """
+
+    def __init__(self):
+        self._windows = {}  # (event name, symbol, magic or strategy) -> _Window
+        self._retrying = 0  # closed windows waiting to be queued again, their lane was full
+        self._lock = threading.Lock()
+
+        # counters
+        self._opened = 0
+        self._merged = 0
+        self._cancelled = 0
+        self._failed = 0
+
+    @staticmethod
+    def key(event, data):
+        """
+        Gets the coalescing key of an alert
+        :param event: Event()
+        :param data: Payload()
+        :return: tuple
+        """
+        strategy = data.get('magic') or data.get('strategy_id') or data.get('strategy') or ''
+        return event.name, str(data.get('symbol') or ''), str(strategy)
+
+    def add(self, event, data, on_done=None, correlation_id=None):
+        """
+        Adds an alert to its window, opening one (triggered when it closes) if none is open
+        :param event: Event() with a coalesce_window
+        :param data: Payload()
+        :param on_done: called without arguments once the window's merged intent has run, or was not triggered
+        :param correlation_id: id of the alert, the merged alert runs with the id of the alert that opened the window
+        :return: True if merged into an open window, False if a window was opened
+        """
+        key = self.key(event, data)
+        with self._lock:
+            window = self._windows.get(key)
+            if window is not None:
+                window.merge(data, correlation_id)
+                if on_done is not None:
+                    window.callbacks.append(on_done)
+                self._merged += 1
+                return True
+            window = self._windows[key] = _Window(event, data, correlation_id)
+            if on_done is not None:
+                window.callbacks.append(on_done)
+            self._opened += 1
+
+        timer = threading.Timer(event.coalesce_window, self.flush, (key,))
+        timer.daemon = True
+        timer.start()
+        return False
+
+    def flush(self, key):
+        """
+        Closes a window and triggers its event with the merged alert
+        :param key: key()
+        """
+        with self._lock:
+            window = self._windows.pop(key, None)
+            if window is None:
+                return
+        data = window.intent()
+
+        if data is None:
+            with self._lock:
+                self._cancelled += 1
+            logger.info(f'COALESCED --->\t{window.alerts} alerts for {key} net to nothing, not triggered')
+            self._done(window)
+            return
+
+        logger.info(f'COALESCED --->\t{window.alerts} alert(s) for {key} into one ({window.correlation_ids[0]})')
+        self._trigger(key, window, data)
+
+    def _trigger(self, key, window, data, attempt=1):
+        if attempt > 1:
+            with self._lock:
+                self._retrying -= 1
+        try:
+            future = window.event.trigger(data=data, correlation_id=window.correlation_ids[0])
+        except DispatchQueueFull as e:
+            if attempt < TRIGGER_ATTEMPTS:
+                delay = TRIGGER_RETRY * 2 ** (attempt - 1)
+                logger.warning(f'Coalesced alert for {key} not queued ({e}), retrying in {delay}s')
+                with self._lock:
+                    self._retrying += 1
+                timer = threading.Timer(delay, self._trigger, (key, window, data, attempt + 1))
+                timer.daemon = True
+                timer.start()
+            else:
+                # not completed: the merged alerts stay in the write-ahead log, replayed at the next start
+                with self._lock:
+                    self._failed += 1
+                logger.error(f'Coalesced alert for {key} not queued after {attempt} attempts, '
+                             f'{window.alerts} alert(s) left to replay: {e}')
+            return
+        if future is None:
+            self._done(window)
+        else:
+            future.add_done_callback(lambda _: self._done(window))
+
+    @staticmethod
+    def _done(window):
+        for callback in window.callbacks:
+            try:
+                callback()
+            except Exception as e:
+                logger.exception(f'Coalescing callback failed: {e}')
+
+    def stats(self) -> dict:
+        """
+        Gets window counters
+        :return: dict
+        """
+        with self._lock:
+            return {
+                'open': len(self._windows),
+                'retrying': self._retrying,
+                'opened': self._opened,
+                'merged': self._merged,
+                'cancelled': self._cancelled,
+                'failed': self._failed,
+            }
+
+
+coalescer = Coalescer()
+
+metrics.callback_counter(
+    'tvwb_coalesced_alerts_total', 'Alerts merged into an open coalescing window',
+    lambda: coalescer.stats()['merged'])
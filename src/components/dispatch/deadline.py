@@ -0,0 +1,271 @@
+import heapq
+import itertools
+import threading
+import time
+from concurrent.futures import Future
+
+from utils.log import get_logger
+
+logger = get_logger(__name__)
+
+# job priorities, the dispatcher's lanes: a waiting job is picked up before any job of a lower priority
+PRIORITIES = ('critical', 'normal', 'low')
+
+# share of a bounded queue the jobs of a priority may fill, the rest is kept for the priorities above it
+QUEUE_SHARES = {'critical': 1.0, 'normal': 0.75, 'low': 0.5}
+
+
+class ActionTimeout(Exception):
+    """Raised (on the waiting side) when a job misses its deadline, the job itself is abandoned"""
+
+    def __init__(self, message: str, returned: Future = None):
+        """
+        :param message: error message
+        :param returned: Future resolved once the abandoned job actually returns, None if it never started
+        """
+        super().__init__(message)
+        self.returned = returned
+
+
+class ActionPoolFull(Exception):
+    """Raised when an action is submitted while its pool's queue is at capacity"""
+
+
+class ActionCancelled(Exception):
+    """Raised by CancelToken.raise_if_cancelled() once the job was abandoned"""
+
+
+class CancelToken:
+    """
+    Cooperative cancellation, set when a job misses its deadline.
+    Jobs check it between steps, or wait on it instead of sleeping.
+    """
+
+    __slots__ = ('_event',)
+
+    def __init__(self):
+        self._event = threading.Event()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def cancel(self):
+        self._event.set()
+
+    def wait(self, timeout: float = None):
+        """
+        Sleeps until cancelled or timeout seconds have passed
+        :return: True if cancelled
+        """
+        return self._event.wait(timeout)
+
+    def raise_if_cancelled(self):
+        """
+        :raises ActionCancelled: if cancelled
+        """
+        if self._event.is_set():
+            raise ActionCancelled('Action was cancelled, its deadline has passed')
+
+
+class _Task:
+    __slots__ = ('fn', 'args', 'kwargs', 'future', 'on_timeout', 'state', 'returned')
+
+    def __init__(self, fn, args, kwargs, on_timeout):
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.future = Future()
+        self.on_timeout = on_timeout
+        self.state = 'queued'  # queued -> running -> done, or timed out (while queued) / abandoned (while running)
+        self.returned = None  # Future of an abandoned job, resolved once its thread returns
+
+
+class DeadlinePool:
+    """
+    Thread pool whose jobs can have a deadline.
+    A job that misses its deadline is abandoned: its future fails with ActionTimeout right away and its thread is
+    replaced, so a hung broker call holds on to one thread instead of a slot of the pool.
+    Python threads cannot be killed, abandoned threads return to the pool once the hung call returns, which
+    ActionTimeout.returned tells.
+
+    Waiting jobs are picked up by priority, then in submission order. A bounded queue keeps room for critical jobs:
+    low jobs may only fill half of it and normal jobs three quarters (QUEUE_SHARES), so a backlog of info queries
+    never keeps a flatten out.
+    """
+
+    def __init__(self, workers: int, max_abandoned: int, queue_size: int = 0, name: str = 'action'):
+        """
+        :param workers: threads running jobs
+        :param max_abandoned: threads stuck in abandoned jobs that are replaced
+        :param queue_size: jobs waiting for a thread before submit() rejects (or waits), 0 for no limit
+        :param name: prefix of the thread names
+        """
+        self.workers = max(1, workers)
+        self.max_abandoned = max_abandoned
+        self.queue_size = queue_size
+        self.name = name
+        self._tasks = []  # heap of (priority, sequence, task) waiting for a thread, including timed out tasks
+        self._queued = 0  # jobs waiting for a thread
+        self._lock = threading.Lock()
+        self._ready = threading.Condition(self._lock)  # a job was queued
+        self._room = threading.Condition(self._lock)  # a job left the queue
+        self._waiting = 0  # submit() calls waiting for room in the queue
+        self._threads = 0
+        self._idle = 0
+        self._abandoned = 0  # threads still running an abandoned job
+        self._ids = itertools.count()
+
+        # deadlines, watched by a single thread
+        self._deadlines = []  # heap of (deadline, sequence, task)
+        self._deadlines_changed = threading.Condition(self._lock)
+        self._watcher = None
+
+        # counters
+        self._timeouts = 0
+        self._rejected = 0
+
+    def submit(self, fn, *args, timeout: float = None, on_timeout=None, priority: str = 'normal',
+               admission: str = 'reject', **kwargs) -> Future:
+        """
+        Runs fn on a pool thread
+        :param fn: callable
+        :param timeout: seconds from now before the job is abandoned, None or 0 for no deadline
+        :param on_timeout: called (from the watcher thread) when the job is abandoned, i.e. to cancel a CancelToken
+        :param priority: critical, normal or low
+        :param admission: when the priority's share of the queue is full: reject raises ActionPoolFull, wait blocks
+            until jobs leave the queue, always queues the job anyway
+        :return: Future resolved with the result of fn, or failed with ActionTimeout
+        :raises ActionPoolFull: if the queue is full for the priority, and admission is reject
+        """
+        if priority not in QUEUE_SHARES:
+            raise ValueError(f'Unknown priority {priority}, choose from {list(PRIORITIES)}')
+        task = _Task(fn, args, kwargs, on_timeout)
+        with self._lock:
+            limit = max(1, int(self.queue_size * QUEUE_SHARES[priority])) if self.queue_size else 0
+            if admission != 'always':
+                while limit and self._queued >= limit:
+                    if admission != 'wait':
+                        self._rejected += 1
+                        raise ActionPoolFull(f'{self.name} pool is saturated ({self._queued} actions waiting)')
+                    self._waiting += 1
+                    self._room.wait()
+                    self._waiting -= 1
+            self._queued += 1
+
+            # a thread per waiting job, idle threads already have a job each once their queued ones are counted
+            if self._queued > self._idle:
+                # abandoned threads don't count towards the pool size: up to max_abandoned threads on top of it, each
+                # replacing a stuck one
+                if self._threads < self.workers + min(self._abandoned, self.max_abandoned):
+                    self._spawn()
+                elif self._threads - self._abandoned < self.workers:
+                    logger.warning(f'{self._abandoned} {self.name} threads are stuck past their deadline, '
+                                   f'not replacing them')
+
+            if timeout:
+                heapq.heappush(self._deadlines, (time.monotonic() + timeout, next(self._ids), task))
+                if self._watcher is None:
+                    self._watcher = threading.Thread(target=self._watch, name=f'{self.name}-deadlines', daemon=True)
+                    self._watcher.start()
+                self._deadlines_changed.notify()
+            heapq.heappush(self._tasks, (PRIORITIES.index(priority), next(self._ids), task))
+            self._ready.notify()
+        return task.future
+
+    def _spawn(self):
+        # called with lock held
+        self._threads += 1
+        threading.Thread(target=self._work, name=f'{self.name}-{next(self._ids)}', daemon=True).start()
+
+    def _work(self):
+        while True:
+            with self._lock:
+                self._idle += 1
+                while not self._tasks:
+                    self._ready.wait()
+                self._idle -= 1
+                _, _, task = heapq.heappop(self._tasks)
+                if task.state != 'queued':
+                    # missed its deadline before a thread picked it up
+                    continue
+                task.state = 'running'
+                self._queued -= 1
+                self._room.notify_all()
+
+            try:
+                result, error = task.fn(*task.args, **task.kwargs), None
+            except BaseException as e:
+                result, error = None, e
+
+            with self._lock:
+                abandoned = task.state == 'abandoned'
+                task.state = 'done'
+                if abandoned:
+                    self._abandoned -= 1
+                # threads spawned as replacements retire once the pool is back to size
+                retire = self._threads - self._abandoned > self.workers
+                if retire:
+                    self._threads -= 1
+
+            if abandoned:
+                logger.warning(f'Abandoned action finished {"with an error" if error else ""} after its deadline')
+                task.returned.set_result(None)
+            elif error is not None:
+                task.future.set_exception(error)
+            else:
+                task.future.set_result(result)
+            if retire:
+                return
+
+    def _watch(self):
+        while True:
+            expired = []
+            with self._lock:
+                while not self._deadlines:
+                    self._deadlines_changed.wait()
+                now = time.monotonic()
+                while self._deadlines and self._deadlines[0][0] <= now:
+                    _, _, task = heapq.heappop(self._deadlines)
+                    if task.state == 'running':
+                        task.state = 'abandoned'
+                        task.returned = Future()
+                        self._abandoned += 1
+                    elif task.state == 'queued':
+                        task.state = 'timed out'
+                        self._queued -= 1
+                        self._room.notify_all()
+                    else:
+                        continue
+                    self._timeouts += 1
+                    expired.append(task)
+                if not expired and self._deadlines:
+                    # only finished jobs were popped, the heap may be empty: then wait for a deadline again
+                    self._deadlines_changed.wait(self._deadlines[0][0] - now)
+
+            for task in expired:
+                task.future.set_exception(ActionTimeout('Action missed its deadline and was abandoned', task.returned))
+                if task.on_timeout is not None:
+                    try:
+                        task.on_timeout()
+                    except Exception as e:
+                        logger.exception(f'Action timeout callback failed: {e}')
+
+    def stats(self) -> dict:
+        """
+        Gets thread counters
+        :return: dict
+        """
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'queue_size': self.queue_size,
+                'threads': self._threads,
+                'idle': self._idle,
+                'busy': self._threads - self._idle - self._abandoned,
+                'queued': self._queued,
+                'waiting': self._waiting,
+                'abandoned': self._abandoned,
+                'timeouts': self._timeouts,
+                'rejected': self._rejected,
+            }
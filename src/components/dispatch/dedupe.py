@@ -0,0 +1,211 @@
+import multiprocessing
+import threading
+import time
+from collections import OrderedDict
+from ctypes import c_double, c_int, c_uint64
+from hashlib import blake2b
+from http import HTTPStatus
+from multiprocessing.sharedctypes import RawArray
+
+from commons import DEDUPE_WINDOW, DEDUPE_MAX_ENTRIES
+from components.metrics.metrics import metrics
+from utils.log import get_logger
+
+logger = get_logger(__name__)
+
+
+class DedupeCache:
+    """
+    TTL bounded LRU cache of recently accepted alerts.
+    Alerts seen again inside the window are answered from the cache instead of being triggered twice.
+    """
+
+    def __init__(self, window: float = DEDUPE_WINDOW, max_entries: int = DEDUPE_MAX_ENTRIES):
+        self.window = window
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # alert id -> (expires at, response)
+        self._lock = threading.Lock()
+        self._shared = None  # SharedDedupeTable once forked workers share the cache
+
+        # counters
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    @property
+    def enabled(self):
+        return self.window > 0 and self.max_entries > 0
+
+    @staticmethod
+    def alert_id(payload):
+        """
+        Gets the id used to detect duplicates of an alert
+        :param payload: Payload()
+        :return: client supplied alert_id (scoped to the event key) or a hash of the payload
+        """
+        alert_id = payload.get('alert_id')
+        if alert_id:
+            return f'{payload.get("key")}:{alert_id}'
+        return payload.digest()
+
+    def claim(self, alert_id, response):
+        """
+        Records an alert as accepted, unless it was already accepted inside the window
+        :param alert_id: id from alert_id()
+        :param response: response to answer duplicates with
+        :return: cached response if the alert is a duplicate, otherwise None
+        """
+        if self._shared is not None:
+            return self._shared.claim(alert_id, response)
+        now = time.monotonic()
+        with self._lock:
+            self._purge(now)
+            entry = self._entries.get(alert_id)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(alert_id)
+                self._hits += 1
+                return entry[1]
+
+            self._misses += 1
+            self._entries[alert_id] = (now + self.window, response)
+            self._entries.move_to_end(alert_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._evictions += 1
+            return None
+
+    def release(self, alert_id):
+        """
+        Forgets an alert, i.e. when it could not be queued and a retry should go through
+        :param alert_id: id from alert_id()
+        """
+        if self._shared is not None:
+            return self._shared.release(alert_id)
+        with self._lock:
+            self._entries.pop(alert_id, None)
+
+    def share(self):
+        """
+        Moves the cache to shared memory, so a duplicate is caught whichever forked worker receives it
+        """
+        if self.enabled:
+            self._shared = SharedDedupeTable(self.window, self.max_entries)
+
+    def _purge(self, now):
+        # entries are (mostly) in expiry order, stop at the first live one
+        while self._entries:
+            alert_id, (expires_at, _) = next(iter(self._entries.items()))
+            if expires_at > now:
+                break
+            del self._entries[alert_id]
+
+    def stats(self) -> dict:
+        """
+        Gets hit/miss counters
+        :return: dict
+        """
+        if self._shared is not None:
+            return {'window_seconds': self.window, 'max_entries': self.max_entries, **self._shared.stats()}
+        with self._lock:
+            return {
+                'window_seconds': self.window,
+                'max_entries': self.max_entries,
+                'entries': len(self._entries),
+                'hits': self._hits,
+                'misses': self._misses,
+                'evictions': self._evictions,
+            }
+
+
+class SharedDedupeTable:
+    """
+    Fixed size, open addressing hash table of accepted alerts in shared memory, for forked workers.
+    Alerts are stored by a 64 bit hash of their id, expired slots are reused and, when every slot probed for an alert
+    is live, the one closest to expiry is evicted.
+    """
+
+    PROBES = 32
+
+    def __init__(self, window: float, max_entries: int):
+        self.window = window
+        self.slots = 1 << max(6, (2 * max_entries - 1).bit_length())  # at most half full
+        self._hashes = RawArray(c_uint64, self.slots)  # 0 = never used
+        self._expires = RawArray(c_double, self.slots)
+        self._statuses = RawArray(c_int, self.slots)
+        self._counters = RawArray(c_uint64, 3)  # hits, misses, evictions
+        self._lock = multiprocessing.Lock()
+
+    @staticmethod
+    def _hash(alert_id):
+        return int.from_bytes(blake2b(alert_id.encode(), digest_size=8).digest(), 'little') or 1
+
+    def _probe(self, alert_hash):
+        mask = self.slots - 1
+        start = alert_hash & mask
+        for i in range(self.PROBES):
+            yield (start + i) & mask
+
+    def claim(self, alert_id, response):
+        """
+        Same as DedupeCache.claim(), duplicates are answered with the cached status code
+        """
+        alert_hash = self._hash(alert_id)
+        now = time.monotonic()
+        free = None
+        oldest = None
+        with self._lock:
+            for slot in self._probe(alert_hash):
+                expires_at = self._expires[slot]
+                if expires_at > now:
+                    if self._hashes[slot] == alert_hash:
+                        self._counters[0] += 1
+                        status = self._statuses[slot]
+                        return status, HTTPStatus(status).phrase
+                    if oldest is None or expires_at < self._expires[oldest]:
+                        oldest = slot
+                    continue
+                if free is None:
+                    free = slot
+                # nothing was ever stored past a never used slot
+                if self._hashes[slot] == 0:
+                    break
+
+            self._counters[1] += 1
+            if free is None:
+                free = oldest
+                self._counters[2] += 1
+            self._hashes[free] = alert_hash
+            self._expires[free] = now + self.window
+            self._statuses[free] = response[0]
+        return None
+
+    def release(self, alert_id):
+        alert_hash = self._hash(alert_id)
+        with self._lock:
+            for slot in self._probe(alert_hash):
+                if self._hashes[slot] == alert_hash:
+                    # keep the hash so probes for other alerts carry on past this slot
+                    self._expires[slot] = 0.0
+                    return
+                if self._hashes[slot] == 0:
+                    return
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        with self._lock:
+            return {
+                'entries': sum(1 for expires_at in self._expires if expires_at > now),
+                'hits': self._counters[0],
+                'misses': self._counters[1],
+                'evictions': self._counters[2],
+            }
+
+
+dedupe = DedupeCache()
+
+metrics.callback_counter(
+    'tvwb_dedupe_lookups_total', 'Duplicate alert cache lookups, by result',
+    lambda: {(result,): dedupe.stats()[key] for result, key in (('hit', 'hits'), ('miss', 'misses'))},
+    labels=('result',), shared=True)
+metrics.gauge(
+    'tvwb_dedupe_entries', 'Alerts held in the duplicate alert cache', lambda: dedupe.stats()['entries'], shared=True)
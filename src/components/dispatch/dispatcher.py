@@ -0,0 +1,432 @@
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from ctypes import c_int, c_uint64
+from hashlib import blake2b
+from multiprocessing.sharedctypes import RawArray
+
+from commons import (
+    DISPATCH_WORKERS, DISPATCH_QUEUE_SIZE,
+    DISPATCH_CRITICAL_WORKERS, DISPATCH_CRITICAL_QUEUE_SIZE,
+    DISPATCH_LOW_WORKERS, DISPATCH_LOW_QUEUE_SIZE,
+)
+from components.dispatch.loop import EventLoopThread
+from components.metrics.metrics import metrics
+from utils.log import get_logger
+
+logger = get_logger(__name__)
+
+
+class DispatchQueueFull(Exception):
+    """Raised when a job is submitted while the dispatch queue is at capacity"""
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class SharedShardTable:
+    """
+    Shards running in forked workers, an open addressing hash table in shared memory.
+    A worker claims a job's shard before running it and releases it once the job is done. The table's lock is only held
+    while claiming or releasing, and shards are told apart by a 64 bit hash of their key, so a shard only ever waits for
+    the same shard. A shard claimed by a worker that died is taken over.
+    """
+
+    # seconds between two attempts to claim a shard running in another worker
+    RETRY = 0.005
+
+    def __init__(self, slots: int = 4096):
+        self.slots = 1 << max(6, (slots - 1).bit_length())
+        self._hashes = RawArray(c_uint64, self.slots)  # 0 = never used, released slots keep their hash
+        self._owners = RawArray(c_int, self.slots)  # pid of the worker running the shard, 0 = free
+        self._lock = multiprocessing.Lock()
+
+    @staticmethod
+    def _hash(shard):
+        return int.from_bytes(blake2b(repr(shard).encode(), digest_size=8).digest(), 'little') or 1
+
+    def claim(self, shard) -> int:
+        """
+        Waits until the shard does not run in another worker, and claims it
+        :param shard: shard key
+        :return: hash of the shard, to release it
+        """
+        shard_hash = self._hash(shard)
+        while not self._try_claim(shard_hash):
+            time.sleep(self.RETRY)
+        return shard_hash
+
+    def _try_claim(self, shard_hash):
+        pid = os.getpid()
+        mask = self.slots - 1
+        free = None
+        with self._lock:
+            for i in range(self.slots):
+                slot = (shard_hash + i) & mask
+                owner = self._owners[slot]
+                if self._hashes[slot] == shard_hash:
+                    if owner and owner != pid and _alive(owner):
+                        return False
+                    if owner and owner != pid:
+                        logger.warning(f'Shard held by worker {owner}, which is gone, taken over')
+                    self._owners[slot] = pid
+                    return True
+                if owner == 0 and free is None:
+                    free = slot
+                # the shard was never stored past a never used slot
+                if self._hashes[slot] == 0:
+                    break
+            if free is None:
+                raise RuntimeError(f'Shard table is full ({self.slots} shards running)')
+            self._hashes[free] = shard_hash
+            self._owners[free] = pid
+        return True
+
+    def release(self, shard_hash: int):
+        """
+        Releases a shard claimed by this worker
+        :param shard_hash: from claim()
+        """
+        pid = os.getpid()
+        mask = self.slots - 1
+        with self._lock:
+            for i in range(self.slots):
+                slot = (shard_hash + i) & mask
+                if self._hashes[slot] == shard_hash and self._owners[slot] == pid:
+                    self._owners[slot] = 0
+                    return
+                if self._hashes[slot] == 0:
+                    return
+
+
+class Job:
+    __slots__ = ('fn', 'args', 'kwargs', 'shard', 'enqueued_at', 'future')
+
+    def __init__(self, fn, args, kwargs, shard=None):
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.shard = shard
+        self.enqueued_at = time.monotonic()
+        self.future = Future()
+
+
+class Dispatcher:
+    """
+    Bounded job queue drained by a pool of worker threads.
+    Webhooks enqueue work here and return immediately, actions run on the workers.
+
+    Jobs submitted with a shard key (i.e. (broker, account, symbol)) run strictly in arrival order with other jobs of
+    the same shard, only one at a time, while jobs of different shards run in parallel.
+
+    A job returning a Future (an event's action graph) is done when that Future is: its worker moves on to the next
+    job right away, so a slow backend never holds the lane's workers.
+    """
+
+    def __init__(self, workers: int = DISPATCH_WORKERS, queue_size: int = DISPATCH_QUEUE_SIZE, lane: str = 'normal'):
+        self.lane = lane
+        self.workers = max(1, workers)
+        self.queue_size = queue_size
+        self._queue = queue.Queue()  # jobs ready to run, capacity is enforced on _pending
+        self._shards = {}  # shard key -> deque of jobs waiting behind the shard's running (or ready) job
+        self._pending = 0  # submitted jobs not yet started, ready or waiting on their shard
+        self._shard_table = None  # SharedShardTable, once workers are forked
+        self._threads = []
+        self._lock = threading.Lock()
+
+        # counters
+        self._enqueued = 0
+        self._started = 0
+        self._completed = 0
+        self._failed = 0
+        self._rejected = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    def start(self):
+        """
+        Starts worker threads, if not already running.
+        Workers are started lazily so that importing the app (i.e. from the cli) does not spawn threads.
+        """
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._work, name=f'dispatch-{self.lane}-{i}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+        logger.info(f'DISPATCHER STARTED --->\t{self.lane} lane, {self.workers} worker(s), queue size {self.queue_size}')
+
+    def submit(self, fn, *args, shard=None, **kwargs) -> Future:
+        """
+        Enqueues a job for the worker pool
+        :param fn: callable to run on a worker
+        :param shard: hashable shard key, jobs of the same shard run one at a time in arrival order
+        :return: Future resolved with the result of fn
+        :raises DispatchQueueFull: if the queue is at capacity
+        """
+        if not self._threads:
+            self.start()
+
+        job = Job(fn, args, kwargs, shard)
+        with self._lock:
+            if self._pending >= self.queue_size:
+                self._rejected += 1
+                full = True
+            else:
+                full = False
+                self._pending += 1
+                self._enqueued += 1
+                if shard is not None and shard in self._shards:
+                    # shard is busy, the job is handed to a worker when the jobs ahead of it are done
+                    self._shards[shard].append(job)
+                    return job.future
+                if shard is not None:
+                    self._shards[shard] = deque()
+
+        if full:
+            logger.warning(f'Dispatch queue full ({self.lane} lane, {self.queue_size}), job rejected')
+            raise DispatchQueueFull(f'Dispatch queue is full ({self.lane} lane, {self.queue_size} jobs)')
+
+        self._queue.put(job)
+        return job.future
+
+    def _work(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                break
+
+            waited = time.monotonic() - job.enqueued_at
+            wait_seconds.observe(waited, lane=self.lane)
+            with self._lock:
+                self._pending -= 1
+                self._started += 1
+                self._wait_total += waited
+                self._wait_max = max(self._wait_max, waited)
+
+            claimed = None
+            try:
+                if job.shard is not None and self._shard_table is not None:
+                    # forked workers each have their own queue, don't run the same shard in two of them at once
+                    claimed = self._shard_table.claim(job.shard)
+                result = job.fn(*job.args, **job.kwargs)
+            except Exception as e:
+                self._finish(job, claimed, error=e)
+                continue
+            if isinstance(result, Future):
+                # the job goes on off this worker (an event's actions, on their backend pools): it is done, and its
+                # shard released, once the future is, while this worker moves on to the next job
+                result.add_done_callback(lambda future, job=job, claimed=claimed: self._settle(job, claimed, future))
+            else:
+                self._finish(job, claimed, result)
+
+    def _settle(self, job, claimed, future):
+        error = future.exception()
+        self._finish(job, claimed, None if error is not None else future.result(), error)
+
+    def _finish(self, job, claimed, result=None, error=None):
+        if claimed is not None:
+            self._shard_table.release(claimed)
+        try:
+            if error is not None:
+                logger.error(f'Dispatched job failed: {error}', exc_info=error)
+                # callbacks (i.e. marking the alert complete in the write-ahead log) run before the job counts as done
+                job.future.set_exception(error)
+                with self._lock:
+                    self._failed += 1
+            else:
+                job.future.set_result(result)
+                with self._lock:
+                    self._completed += 1
+        finally:
+            if job.shard is not None:
+                self._release_shard(job.shard)
+            self._queue.task_done()
+
+    def _release_shard(self, shard):
+        # hand the shard's next job to the pool, or retire the shard when it has no more work
+        with self._lock:
+            waiting = self._shards[shard]
+            if not waiting:
+                del self._shards[shard]
+                return
+            job = waiting.popleft()
+        self._queue.put(job)
+
+    def join(self):
+        """Blocks until every queued job has been processed"""
+        self._queue.join()
+
+    def idle(self) -> bool:
+        """True when every submitted job has run"""
+        with self._lock:
+            return self._enqueued == self._completed + self._failed
+
+    def stats(self) -> dict:
+        """
+        Gets queue depth and wait time counters
+        :return: dict
+        """
+        with self._lock:
+            started = self._started
+            return {
+                'workers': self.workers,
+                'queue_size': self.queue_size,
+                'queue_depth': self._pending,
+                'enqueued': self._enqueued,
+                'started': self._started,
+                'completed': self._completed,
+                'failed': self._failed,
+                'rejected': self._rejected,
+                'wait_seconds_total': round(self._wait_total, 6),
+                'wait_seconds_avg': round(self._wait_total / started, 6) if started else 0.0,
+                'wait_seconds_max': round(self._wait_max, 6),
+                'active_shards': len(self._shards),
+            }
+
+    def shard_stats(self) -> dict:
+        """
+        Gets the depth of every active shard, counting its running (or ready) job
+        :return: dict of shard key -> jobs
+        """
+        with self._lock:
+            return {shard: len(waiting) + 1 for shard, waiting in self._shards.items()}
+
+
+def format_shard(shard):
+    """
+    Formats a shard key for stats and metric labels, i.e. ('nt', 'Sim101', 'ES') -> 'nt/Sim101/ES'
+    """
+    return '/'.join(str(part) for part in shard) if isinstance(shard, tuple) else str(shard)
+
+
+class LaneDispatcher:
+    """
+    Priority lanes, each a Dispatcher with its own queue and workers.
+    A backlog in one lane (i.e. info queries) never delays jobs of another (i.e. a flatten).
+    Also owns the event loop running `async def run` actions.
+    """
+
+    PRIORITIES = ('critical', 'normal', 'low')
+
+    def __init__(self, lanes: dict):
+        self.lanes = {name: Dispatcher(workers, queue_size, lane=name) for name, (workers, queue_size) in lanes.items()}
+        self.loop = EventLoopThread()
+
+    def lane(self, priority: str) -> Dispatcher:
+        """
+        Gets the lane of a priority class
+        :param priority: critical, normal or low
+        :return: Dispatcher()
+        """
+        try:
+            return self.lanes[priority]
+        except KeyError:
+            raise ValueError(f'Unknown priority {priority}, choose from {list(self.lanes)}')
+
+    def submit(self, fn, *args, priority: str = 'normal', shard=None, **kwargs) -> Future:
+        """
+        Enqueues a job on the lane of its priority
+        :param fn: callable to run on a worker
+        :param priority: critical, normal or low
+        :param shard: hashable shard key, jobs of the same shard (and lane) run one at a time in arrival order
+        :return: Future resolved with the result of fn
+        :raises DispatchQueueFull: if the lane's queue is at capacity
+        """
+        return self.lane(priority).submit(fn, *args, shard=shard, **kwargs)
+
+    def start(self):
+        for lane in self.lanes.values():
+            lane.start()
+
+    def share(self, slots: int = 4096):
+        """
+        Creates a process shared shard table for every lane (before forking workers),
+        a shard then runs in one worker at a time
+        :param slots: shards running at once per lane, over every worker
+        """
+        for lane in self.lanes.values():
+            lane._shard_table = SharedShardTable(slots)
+
+    def join(self):
+        """Blocks until every queued job of every lane has been processed"""
+        for lane in self.lanes.values():
+            lane.join()
+
+    def drain(self, timeout: float) -> bool:
+        """
+        Waits until every job submitted so far, on every lane, has run, i.e. before a worker exits
+        :param timeout: seconds
+        :return: True if drained, False if jobs were still queued or running at the timeout
+        """
+        deadline = time.monotonic() + timeout
+        while not all(lane.idle() for lane in self.lanes.values()):
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(0.05)
+        return True
+
+    def stats(self) -> dict:
+        """
+        Gets counters summed over all lanes, and per lane counters
+        :return: dict
+        """
+        lanes = {name: lane.stats() for name, lane in self.lanes.items()}
+        totals = {key: sum(stats[key] for stats in lanes.values()) for key in (
+            'workers', 'queue_size', 'queue_depth', 'enqueued', 'started', 'completed', 'failed', 'rejected',
+            'active_shards')}
+        wait_total = sum(stats['wait_seconds_total'] for stats in lanes.values())
+        return {
+            **totals,
+            'wait_seconds_total': round(wait_total, 6),
+            'wait_seconds_avg': round(wait_total / totals['started'], 6) if totals['started'] else 0.0,
+            'wait_seconds_max': max(stats['wait_seconds_max'] for stats in lanes.values()),
+            'lanes': lanes,
+        }
+
+    def shard_stats(self) -> dict:
+        """
+        Gets the depth of every active shard, by lane
+        :return: dict of lane -> {shard: jobs}
+        """
+        return {name: {format_shard(shard): depth for shard, depth in lane.shard_stats().items()}
+                for name, lane in self.lanes.items()}
+
+
+dispatcher = LaneDispatcher({
+    'critical': (DISPATCH_CRITICAL_WORKERS, DISPATCH_CRITICAL_QUEUE_SIZE),
+    'normal': (DISPATCH_WORKERS, DISPATCH_QUEUE_SIZE),
+    'low': (DISPATCH_LOW_WORKERS, DISPATCH_LOW_QUEUE_SIZE),
+})
+
+wait_seconds = metrics.histogram(
+    'tvwb_dispatch_wait_seconds', 'Time jobs spent queued before a worker picked them up', labels=('lane',))
+metrics.gauge(
+    'tvwb_dispatch_queue_depth', 'Jobs waiting in the dispatch queue, by lane',
+    lambda: {(name,): stats['queue_depth'] for name, stats in dispatcher.stats()['lanes'].items()},
+    labels=('lane',))
+metrics.gauge(
+    'tvwb_dispatch_shard_depth', 'Jobs queued or running on each active shard, by lane and shard',
+    lambda: {(name, shard): depth for name, shards in dispatcher.shard_stats().items() for shard, depth in shards.items()},
+    labels=('lane', 'shard'))
+metrics.gauge(
+    'tvwb_async_actions_running', 'Async actions running on the shared event loop',
+    lambda: dispatcher.loop.stats()['running'])
+metrics.callback_counter(
+    'tvwb_dispatch_jobs_total', 'Dispatch jobs, by lane and outcome',
+    lambda: {(name, outcome): stats[outcome]
+             for name, stats in dispatcher.stats()['lanes'].items()
+             for outcome in ('enqueued', 'completed', 'failed', 'rejected')},
+    labels=('lane', 'outcome'))
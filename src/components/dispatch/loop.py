@@ -0,0 +1,121 @@
+import asyncio
+import threading
+from concurrent.futures import Future
+
+from components.dispatch.deadline import ActionTimeout, ActionCancelled
+from utils.log import get_logger
+
+logger = get_logger(__name__)
+
+
+class EventLoopThread:
+    """
+    A single asyncio event loop, running on its own thread, shared by every `async def run` action.
+    I/O bound actions await instead of holding a thread, and one that misses its deadline is really cancelled
+    (CancelledError is raised at the await it is stuck on) rather than abandoned.
+    The loop is started on the first submit, so forked workers each start their own.
+    """
+
+    def __init__(self, name: str = 'action-loop'):
+        self.name = name
+        self._loop = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+        # counters, only updated from the loop thread
+        self._running = 0
+        self._completed = 0
+        self._failed = 0
+        self._timeouts = 0
+
+    def start(self):
+        """
+        Starts the loop thread, if not started yet
+        :return: asyncio loop
+        """
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(target=self._loop.run_forever, name=self.name, daemon=True)
+                self._thread.start()
+                logger.info(f'EVENT LOOP STARTED --->\t{self.name}')
+            return self._loop
+
+    def submit(self, coro, timeout: float = None, on_timeout=None) -> Future:
+        """
+        Runs a coroutine on the loop
+        :param coro: coroutine
+        :param timeout: seconds from now before the coroutine is cancelled, None or 0 for no deadline
+        :param on_timeout: called (from the loop thread) when the coroutine is cancelled past its deadline
+        :return: Future resolved with the result of the coroutine, or failed with ActionTimeout
+        """
+        loop = self.start()
+        future, returned = Future(), Future()
+
+        def schedule():
+            task = loop.create_task(coro)
+            handle = loop.call_later(timeout, expire, task) if timeout else None
+            task.add_done_callback(lambda t: finished(t, handle))
+            self._running += 1
+
+        def expire(task):
+            if task.done():
+                return
+            self._timeouts += 1
+            task.cancel()
+            future.set_exception(ActionTimeout('Action missed its deadline and was cancelled', returned))
+            if on_timeout is not None:
+                try:
+                    on_timeout()
+                except Exception as e:
+                    logger.exception(f'Action timeout callback failed: {e}')
+
+        def finished(task, handle):
+            self._running -= 1
+            returned.set_result(None)
+            if handle is not None:
+                handle.cancel()
+            if task.cancelled():
+                self._failed += 1
+                if not future.done():
+                    future.set_exception(ActionCancelled('Action was cancelled'))
+                return
+            error = task.exception()
+            if error is not None:
+                self._failed += 1
+            else:
+                self._completed += 1
+            if future.done():
+                # missed its deadline, but caught the cancellation and returned anyway
+                return
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(task.result())
+
+        loop.call_soon_threadsafe(schedule)
+        return future
+
+    def stop(self):
+        """
+        Stops the loop, coroutines still running are dropped
+        """
+        with self._lock:
+            loop, self._loop = self._loop, None
+        if loop is not None:
+            loop.call_soon_threadsafe(loop.stop)
+            self._thread.join()
+            loop.close()
+
+    def stats(self) -> dict:
+        """
+        Gets coroutine counters
+        :return: dict
+        """
+        return {
+            'started': self._loop is not None,
+            'running': self._running,
+            'completed': self._completed,
+            'failed': self._failed,
+            'timeouts': self._timeouts,
+        }
@@ -0,0 +1,162 @@
+import multiprocessing
+import threading
+import time
+from multiprocessing.sharedctypes import RawArray
+
+from commons import RATE_LIMIT_PER_KEY, RATE_LIMIT_PER_KEY_BURST, RATE_LIMIT_GLOBAL, RATE_LIMIT_GLOBAL_BURST
+from components.metrics.metrics import metrics
+from utils.log import get_logger
+
+logger = get_logger(__name__)
+
+
+class TokenBucket:
+    """
+    Token bucket refilled at `rate` tokens per second, holding at most `burst` tokens.
+    A rate of 0 disables the bucket (every take succeeds).
+    """
+
+    __slots__ = ('rate', 'burst', '_state', '_lock')
+
+    def __init__(self, rate: float, burst: float = None):
+        self.rate = rate
+        self.burst = max(1.0, burst if burst else rate)
+        self._state = [self.burst, time.monotonic()]  # tokens, updated at
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.rate > 0
+
+    def take(self):
+        """
+        Takes a token if one is available
+        :return: 0 if a token was taken, otherwise seconds until the next token
+        """
+        if not self.enabled:
+            return 0
+        with self._lock:
+            state = self._state
+            now = time.monotonic()
+            tokens = min(self.burst, state[0] + (now - state[1]) * self.rate)
+            state[1] = now
+            if tokens >= 1:
+                state[0] = tokens - 1
+                return 0
+            state[0] = tokens
+            return (1 - tokens) / self.rate
+
+    def refund(self):
+        """
+        Gives back a token taken for a request that was rejected further on
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            self._state[0] = min(self.burst, self._state[0] + 1)
+
+    def share(self):
+        """
+        Moves the bucket to shared memory, so forked workers draw from the same tokens
+        """
+        with self._lock:
+            self._state = RawArray('d', self._state)
+        self._lock = multiprocessing.Lock()
+
+
+class RateLimiter:
+    """
+    Admission control for webhooks: a token bucket per event key plus one global bucket.
+    Events can override the per key rate with `rate_limit` / `rate_burst` attributes.
+    """
+
+    def __init__(self, per_key: float = RATE_LIMIT_PER_KEY, per_key_burst: float = RATE_LIMIT_PER_KEY_BURST,
+                 global_rate: float = RATE_LIMIT_GLOBAL, global_burst: float = RATE_LIMIT_GLOBAL_BURST):
+        self.per_key = per_key
+        self.per_key_burst = per_key_burst
+        self.global_bucket = TokenBucket(global_rate, global_burst)
+        self._buckets = {}  # event key -> TokenBucket
+        self._lock = threading.Lock()
+
+        # counters, event name -> rejected count
+        self._admitted = 0
+        self._rejected = {'key': {}, 'global': {}}
+
+    def bucket(self, event):
+        """
+        Gets (or creates) the token bucket of an event's key
+        :param event: Event()
+        :return: TokenBucket()
+        """
+        bucket = self._buckets.get(event.key)
+        if bucket is None:
+            rate = getattr(event, 'rate_limit', None)
+            burst = getattr(event, 'rate_burst', None)
+            with self._lock:
+                bucket = self._buckets.setdefault(event.key, TokenBucket(
+                    self.per_key if rate is None else rate,
+                    self.per_key_burst if burst is None else burst,
+                ))
+        return bucket
+
+    def admit(self, event):
+        """
+        Takes a token from the event key's bucket and from the global bucket
+        :param event: Event()
+        :return: (scope, seconds until retry) if rejected, otherwise None
+        """
+        bucket = self.bucket(event)
+        wait = bucket.take()
+        if wait:
+            return self._reject('key', event, wait)
+
+        wait = self.global_bucket.take()
+        if wait:
+            # the alert never ran, don't charge its key
+            bucket.refund()
+            return self._reject('global', event, wait)
+
+        with self._lock:
+            self._admitted += 1
+        return None
+
+    def share(self, events):
+        """
+        Moves the buckets of every webhook event, and the global bucket, to shared memory (before forking workers)
+        :param events: list of Event()
+        """
+        for event in events:
+            if event.webhook:
+                self.bucket(event).share()
+        self.global_bucket.share()
+
+    def _reject(self, scope, event, wait):
+        with self._lock:
+            rejected = self._rejected[scope]
+            rejected[event.name] = rejected.get(event.name, 0) + 1
+        return scope, wait
+
+    def stats(self) -> dict:
+        """
+        Gets admission counters
+        :return: dict
+        """
+        with self._lock:
+            return {
+                'per_key_rate': self.per_key,
+                'per_key_burst': self.per_key_burst,
+                'global_rate': self.global_bucket.rate,
+                'global_burst': self.global_bucket.burst,
+                'admitted': self._admitted,
+                'rejected': {scope: dict(rejected) for scope, rejected in self._rejected.items()},
+            }
+
+
+rate_limiter = RateLimiter()
+
+metrics.callback_counter(
+    'tvwb_rate_limited_total', 'Webhook items rejected with 429, by event and bucket',
+    lambda: {(event, scope): count
+             for scope, rejected in rate_limiter.stats()['rejected'].items()
+             for event, count in rejected.items()},
+    labels=('event', 'scope'))
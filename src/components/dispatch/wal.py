@@ -0,0 +1,388 @@
+import glob
+import json
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+from commons import WAL_PATH, WAL_FSYNC, WAL_MAX_BYTES
+from components.metrics.metrics import metrics
+from utils.log import get_logger
+
+logger = get_logger(__name__)
+
+
+class WalError(Exception):
+    """Raised when an accepted alert could not be written to the write-ahead log"""
+
+
+def _try_lock(lock_file) -> bool:
+    # exclusive, non blocking, held until the file is closed (or the process dies)
+    try:
+        if fcntl is not None:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            lock_file.seek(0)
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_NBLCK, 1)
+        return True
+    except OSError:
+        return False
+
+
+def _lock(path):
+    """
+    Locks a log through its lock file (path.lock), which is never renamed, unlike the log when compacted
+    :param path: log file
+    :return: open lock file, None if another process holds the log
+    """
+    lock_file = open(f'{path}.lock', 'a+')
+    try:
+        if _try_lock(lock_file):
+            # the previous holder may have deleted the lock file after adopting its log, between open and lock
+            if os.path.exists(lock_file.name) and os.path.samestat(os.fstat(lock_file.fileno()), os.stat(lock_file.name)):
+                return lock_file
+    except OSError:
+        pass
+    lock_file.close()
+    return None
+
+
+def _read(path):
+    """
+    Reads the alerts of a log that were accepted but never completed
+    :param path: log file
+    :return: dict of id -> accepted record, in the order they were accepted
+    """
+    accepted = {}
+    try:
+        with open(path, 'r', encoding='utf-8') as wal_file:
+            for number, line in enumerate(wal_file, 1):
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # torn write of the last batch before a crash, it was never acknowledged
+                    logger.warning(f'Skipping unreadable line {number} of write-ahead log {path}')
+                    continue
+                if record.get('ok'):
+                    accepted.pop(record['id'], None)
+                else:
+                    accepted[record['id']] = record
+    except FileNotFoundError:
+        pass
+    return accepted
+
+
+class _Batch:
+    __slots__ = ('lines', 'written', 'error')
+
+    def __init__(self):
+        self.lines = []
+        self.written = threading.Event()
+        self.error = None
+
+
+class WriteAheadLog:
+    """
+    Append only log (JSON lines) of accepted alerts, written before the webhook is acknowledged.
+    Alerts are marked complete once their actions have run, alerts still pending when the process dies are replayed
+    at the next startup, so every acknowledged alert runs at least once.
+    Appends are group committed: a single writer thread writes (and fsyncs) every alert waiting at that time at once.
+
+    Every process (prefork worker, or worker generation during a reload) locks a log of its own: WAL_PATH, or the first
+    of WAL_PATH.1, WAL_PATH.2... that no live process holds. Logs left by processes that are gone are adopted.
+
+    Records are {"id", "ev" (event name), "d" (decoded data), "at" (epoch)} when accepted, {"id", "ok": 1} when complete.
+    """
+
+    def __init__(self, path: str = WAL_PATH, fsync: bool = WAL_FSYNC, max_bytes: int = WAL_MAX_BYTES):
+        self.base = path
+        self.path = None  # log locked by this process, once opened
+        self.fsync = fsync
+        self.max_bytes = max_bytes
+        self._file = None
+        self._lock_file = None
+        self._size = 0
+        self._compact_at = max_bytes
+        self._pending = {}  # id -> accepted record line, alerts whose actions have not run yet
+        self._batch = _Batch()
+        self._changed = threading.Condition()
+        self._writer = None
+        self._closing = False
+
+        # counters
+        self._appended = 0
+        self._completed = 0
+        self._commits = 0
+        self._compactions = 0
+        self._replayed = 0
+
+    @property
+    def enabled(self):
+        return bool(self.base)
+
+    @property
+    def opened(self):
+        return self._file is not None
+
+    def open(self, path: str = None) -> list:
+        """
+        Locks a log of this process and opens it for appending, after reading back the alerts accepted but never
+        completed, in it and in the logs of processes that are gone (which are then removed).
+        The log is compacted down to those alerts, and they stay pending until complete() is called.
+        :param path: base log file, defaults to WAL_PATH
+        :return: list of accepted records ({"id", "ev", "d", "at"}) to replay, in the order they were accepted
+        """
+        if path is not None:
+            self.base = path
+        if not self.enabled:
+            return []
+
+        for number in range(1024):
+            candidate = self.base if number == 0 else f'{self.base}.{number}'
+            lock_file = _lock(candidate)
+            if lock_file is not None:
+                break
+        else:
+            raise WalError(f'No free write-ahead log next to {self.base}')
+
+        accepted = _read(candidate)
+        adopted = self._orphans(exclude=candidate)
+        for orphan_path, orphan_lock in adopted:
+            for entry_id, record in _read(orphan_path).items():
+                accepted.setdefault(entry_id, record)
+
+        with self._changed:
+            self.path, self._lock_file = candidate, lock_file
+            self._pending = {entry_id: self._encode(record) for entry_id, record in accepted.items()}
+            self._replayed += len(accepted)
+            self._closing = False
+        self._rewrite()
+        self._remove(adopted)
+
+        if accepted:
+            logger.warning(f'WRITE-AHEAD LOG --->\t{len(accepted)} accepted alert(s) did not complete, replaying them')
+        return list(accepted.values())
+
+    def adopt(self) -> list:
+        """
+        Takes over the logs of processes that are gone (i.e. the previous worker generation, once it has drained)
+        :return: list of accepted records to replay, they are pending in this process' log
+        """
+        if self._file is None:
+            return []
+        adopted = self._orphans(exclude=self.path)
+        records = []
+        for orphan_path, _ in adopted:
+            for entry_id, record in _read(orphan_path).items():
+                if entry_id in self._pending:
+                    continue
+                line = self._encode(record)
+                with self._changed:
+                    if self._closing:
+                        # closed meanwhile: the orphans stay on disk, for the next process to replay
+                        for _, orphan_lock in adopted:
+                            orphan_lock.close()
+                        return []
+                    self._pending[entry_id] = line
+                    batch = self._add(line)
+                records.append(record)
+        if records:
+            # on disk in this log before the orphans are removed
+            batch.written.wait()
+            with self._changed:
+                self._replayed += len(records)
+            logger.warning(f'WRITE-AHEAD LOG --->\tadopted {len(records)} pending alert(s) of a stopped process')
+        self._remove(adopted)
+        return records
+
+    def _orphans(self, exclude):
+        # logs next to this one that no live process holds, locked for adoption
+        numbered = [path for path in glob.glob(f'{glob.escape(self.base)}.*') if path[len(self.base) + 1:].isdigit()]
+        orphans = []
+        for candidate in [self.base] + sorted(numbered):
+            if candidate == exclude or not os.path.exists(candidate):
+                continue
+            lock_file = _lock(candidate)
+            if lock_file is not None:
+                orphans.append((candidate, lock_file))
+        return orphans
+
+    @staticmethod
+    def _remove(adopted):
+        for orphan_path, orphan_lock in adopted:
+            for name in (orphan_path, orphan_lock.name):
+                try:
+                    os.remove(name)
+                except OSError:
+                    pass
+            orphan_lock.close()
+
+    def append(self, entry_id: str, event: str, data):
+        """
+        Records an accepted alert, returns once it is on disk (fsynced with the other alerts of its batch)
+        :param entry_id: id of the alert, i.e. its correlation id
+        :param event: event name
+        :param data: decoded data (Payload() or dict)
+        :raises WalError: if the alert could not be written
+        """
+        line = self._encode({'id': entry_id, 'ev': event, 'd': dict(data), 'at': round(time.time(), 3)})
+        with self._changed:
+            if self._file is None or self._closing:
+                raise WalError('Write-ahead log is not open')
+            self._pending[entry_id] = line
+            batch = self._add(line)
+            self._appended += 1
+
+        batch.written.wait()
+        if batch.error is not None:
+            with self._changed:
+                self._pending.pop(entry_id, None)
+            raise WalError(f'Could not write to the write-ahead log: {batch.error}')
+
+    def complete(self, entry_id: str):
+        """
+        Marks an alert complete, it won't be replayed. Does not wait for the disk, a completion lost in a crash only
+        means the alert is replayed (caught as a duplicate only if DEDUPE_WINDOW is set and the alert is still in it).
+        :param entry_id: id given to append()
+        """
+        with self._changed:
+            if self._pending.pop(entry_id, None) is None or self._file is None or self._closing:
+                return
+            self._add(self._encode({'id': entry_id, 'ok': 1}))
+            self._completed += 1
+
+    def close(self):
+        """
+        Writes what is left, stops the writer and closes the log
+        """
+        with self._changed:
+            self._closing = True
+            self._changed.notify()
+            writer, self._writer = self._writer, None
+        if writer is not None:
+            # the writer exits once every queued line is written (and fsynced), never mid-write
+            writer.join()
+        with self._changed:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+                if not self._pending and self._lock_file is not None:
+                    # nothing left to replay, removed while still locked so no other process adopts it meanwhile
+                    self._remove([(self.path, self._lock_file)])
+                    self._lock_file = None
+            if self._lock_file is not None:
+                self._lock_file.close()
+                self._lock_file = None
+
+    @staticmethod
+    def _encode(record):
+        return json.dumps(record, separators=(',', ':'), default=str) + '\n'
+
+    def _add(self, line):
+        # called with lock held, queues a line for the writer
+        if self._writer is None:
+            self._writer = threading.Thread(target=self._write, name='wal-writer', daemon=True)
+            self._writer.start()
+        self._batch.lines.append(line)
+        self._changed.notify()
+        return self._batch
+
+    def _write(self):
+        while True:
+            with self._changed:
+                while not self._batch.lines and not self._closing:
+                    self._changed.wait()
+                if not self._batch.lines:
+                    # closing, everything is written
+                    return
+                batch, self._batch = self._batch, _Batch()
+                wal_file = self._file
+
+            try:
+                chunk = ''.join(batch.lines)
+                wal_file.write(chunk)
+                wal_file.flush()
+                if self.fsync:
+                    os.fsync(wal_file.fileno())
+            except Exception as e:
+                logger.exception(f'Write-ahead log write failed: {e}')
+                batch.error = e
+            batch.written.set()
+
+            with self._changed:
+                self._commits += 1
+                if batch.error is None:
+                    self._size += len(chunk.encode('utf-8'))
+                compact = self._size > self._compact_at
+            if compact:
+                try:
+                    self._rewrite()
+                    with self._changed:
+                        self._compactions += 1
+                except OSError as e:
+                    logger.exception(f'Write-ahead log compaction failed: {e}')
+
+    def _rewrite(self):
+        # replaces the log with the alerts still pending, called from the writer (or open(), before it starts), which
+        # alone writes to the log: appenders wait for the lock while the pending alerts are copied, not for the fsyncs
+        with self._changed:
+            lines = list(self._pending.values())
+            wal_file = self._file
+        temporary = f'{self.path}.tmp'
+        with open(temporary, 'w', encoding='utf-8') as temporary_file:
+            temporary_file.writelines(lines)
+            temporary_file.flush()
+            os.fsync(temporary_file.fileno())
+        if wal_file is not None:
+            wal_file.close()
+        os.replace(temporary, self.path)
+        if self.fsync and os.name != 'nt':
+            # make the rename itself durable
+            directory = os.open(os.path.dirname(os.path.abspath(self.path)), os.O_RDONLY)
+            try:
+                os.fsync(directory)
+            finally:
+                os.close(directory)
+
+        wal_file = open(self.path, 'a', encoding='utf-8')
+        with self._changed:
+            self._file = wal_file
+            self._size = wal_file.tell()
+            # with many alerts still pending, don't compact again until the log has doubled
+            self._compact_at = max(self.max_bytes, 2 * self._size)
+
+    def stats(self) -> dict:
+        """
+        Gets log counters
+        :return: dict
+        """
+        with self._changed:
+            return {
+                'enabled': self.enabled and self.opened,
+                'path': self.path,
+                'pending': len(self._pending),
+                'size_bytes': self._size,
+                'appended': self._appended,
+                'completed': self._completed,
+                'commits': self._commits,
+                'compactions': self._compactions,
+                'replayed': self._replayed,
+            }
+
+
+wal = WriteAheadLog()
+
+metrics.gauge(
+    'tvwb_wal_pending', 'Accepted alerts whose actions have not run yet',
+    lambda: wal.stats()['pending'])
+metrics.callback_counter(
+    'tvwb_wal_commits_total', 'Write-ahead log group commits (one write and fsync each)',
+    lambda: wal.stats()['commits'])
+metrics.callback_counter(
+    'tvwb_wal_appended_total', 'Alerts written to the write-ahead log',
+    lambda: wal.stats()['appended'])
@@ -1,10 +1,24 @@
 # configure logging
+import os
+import threading
+import time
+from ctypes import c_bool
 from datetime import datetime
+from multiprocessing.sharedctypes import RawValue
 from hashlib import md5
 from logging import getLogger, DEBUG
 
-from commons import LOG_LOCATION, UNIQUE_KEY
+from commons import UNIQUE_KEY, ACTION_TIMEOUT
+from components.actions.base.action import ActionContext, new_correlation_id
+from components.dispatch.bulkhead import bulkheads
+from components.dispatch.coalesce import COALESCE_MODES
+from components.dispatch.dispatcher import dispatcher
+from components.events.base.graph import ActionGraph
+from components.journal.journal import journal
 from components.logs.log_event import LogEvent
+from components.logs.log_store import log_store
+from components.metrics.metrics import action_seconds, action_errors_total, action_timeouts_total
+from components.schemas.payload import Field, PayloadDecoder
 from utils.log import get_logger
 
 logger = get_logger(__name__)
@@ -13,6 +27,22 @@ logger = get_logger(__name__)
 class EventManager:
     def __init__(self):
         self._events = []
+        self._by_name = {}
+        self._by_key = {}
+
+    def add(self, event):
+        """
+        Adds event to manager and indexes it by name and, for webhook events, by key
+        :param event: Event()
+        """
+        existing = self._by_name.get(event.name)
+        if existing is not None:
+            self._events.remove(existing)
+            self._by_key.pop(existing.key, None)
+        self._events.append(event)
+        self._by_name[event.name] = event
+        if event.webhook:
+            self._by_key[event.key] = event
 
     def get_all(self):
         """
@@ -27,11 +57,21 @@ class EventManager:
         :param event_name: name of event
         :return: Event()
         """
-        for event in self._events:
-            if event.name == event_name:
-                return event
+        try:
+            return self._by_name[event_name]
+        except KeyError:
+            raise ValueError(f'Cannot find event with name {event_name}')
 
-        raise ValueError(f'Cannot find event with name {event_name}')
+    def get_by_key(self, key: str):
+        """
+        Gets webhook event from manager that matches given key
+        :param key: webhook key
+        :return: Event()
+        """
+        try:
+            return self._by_key[key]
+        except (KeyError, TypeError):
+            raise ValueError(f'Cannot find event with key {key}')
 
 
 em = EventManager()
@@ -40,26 +80,114 @@ em = EventManager()
 class Event:
     objects = em
 
+    # expected webhook fields, i.e. {'symbol': Field(str, required=True), 'volume': Field(float)}
+    # undeclared fields are passed to actions as is
+    fields = {}
+
+    # per key admission control (alerts per second, burst size), None uses RATE_LIMIT_PER_KEY(_BURST)
+    rate_limit = None
+    rate_burst = None
+
+    # dispatch lane: critical (flatten, orders), normal or low (info queries)
+    priority = 'normal'
+
+    # broker the linked actions trade on, alerts for the same (broker, account, symbol) run in arrival order
+    # account_env names the environment variable holding the account used when the alert has none
+    broker = None
+    account_env = None
+
+    # optional coalescing window (seconds, 0 disables): alerts for the same symbol and magic / strategy arriving
+    # within it are merged into one, 'latest' keeps the last alert, 'sum' nets buy and sell coalesce_quantity
+    coalesce_window = 0
+    coalesce_mode = 'latest'
+    coalesce_quantity = 'quantity'
+    # alerts give the position to hold (i.e. flatten, then order) rather than an order adding to it: they can't be
+    # netted, 'sum' is refused
+    position_target = False
+
     def __init__(self):
         self.name = self.get_name()
-        self.active = True
+        self._active = c_bool(True)
         self.webhook = True  # all events are webhooks by default
         self.key = f'{self.name}:{md5(f"{self.name + UNIQUE_KEY}".encode()).hexdigest()[:6]}'
+        fields = {'key': Field(str, required=True), **self.fields}
+        if self.coalesce_mode == 'sum' and self.coalesce_quantity not in fields:
+            # netted quantities must be numbers, alerts with anything else are answered with 400
+            fields[self.coalesce_quantity] = Field(float)
+        self.decoder = PayloadDecoder(fields)
         self._actions = []
-        self.logs = [LogEvent().from_line(line) for line in open(LOG_LOCATION, 'r') if line.split(',')[0] == self.name]
+        self._after = {}  # action name -> names of the actions it runs after
+        self._graph = None
 
     def get_name(self):
         return type(self).__name__
 
-    def add_action(self, action):
-        self._actions.append(action)
+    def add_action(self, action, after=()):
+        """
+        Links an action to the event
+        :param action: Action()
+        :param after: names of linked actions that must complete before this one runs
+        """
+        if action not in self._actions:
+            self._actions.append(action)
+        self._after[action.name] = tuple(after)
+        self._graph = None
+
+    def build_graph(self):
+        """
+        Builds the dependency graph of the linked actions, done once after links are registered
+        :return: ActionGraph()
+        :raises ValueError: if a dependency is not linked to the event, or dependencies form a cycle
+        """
+        self._graph = ActionGraph({action.name: self._after.get(action.name, ()) for action in self._actions})
+        return self._graph
+
+    @property
+    def active(self):
+        return self._active.value
+
+    @active.setter
+    def active(self, value):
+        self._active.value = bool(value)
+
+    def share(self):
+        """
+        Moves the active flag to shared memory, so a toggle in one forked worker is seen by all of them
+        """
+        self._active = RawValue(c_bool, self.active)
 
     def register(self):
-        self.objects._events.append(self)
+        # fail at registration rather than on the first webhook
+        dispatcher.lane(self.priority)
+        if self.coalesce_mode not in COALESCE_MODES:
+            raise ValueError(f'Unknown coalesce mode {self.coalesce_mode}, choose from {COALESCE_MODES}')
+        if self.coalesce_mode == 'sum' and self.position_target:
+            raise ValueError(f'{self.name} alerts are position targets, their quantities can\'t be summed, '
+                             f'use coalesce_mode = \'latest\'')
+        self.objects.add(self)
 
     def __str__(self):
         return f'{self.name}'
 
+    def shard_key(self, data):
+        """
+        Gets the dispatch shard of an alert, alerts of the same shard run one at a time in arrival order
+        :param data: Payload()
+        :return: (broker, account, symbol), None if the event does not trade on a broker
+        """
+        if self.broker is None:
+            return None
+        account = data.get('account') or (os.getenv(self.account_env, '') if self.account_env else '')
+        return self.broker, str(account), str(data.get('symbol') or '')
+
+    @property
+    def logs(self):
+        """
+        Logs of the event, oldest first, from the log index shared by every event (the log file is read once)
+        :return: list of LogEvent()
+        """
+        return [LogEvent().from_line(entry.line) for entry in log_store.history(self.name)]
+
     def get_last_log_time(self):
         return self.logs[-1].get_event_time()
 
@@ -68,20 +196,106 @@ class Event:
         Will implement checking here eventually (tm)
         :param action: Action() to register
         """
-        self._actions.append(action)
+        self.add_action(action)
 
     def trigger(self, *args, **kwargs):
+        """
+        Queues linked actions on the dispatcher, returns without waiting for them to run
+        :param data: webhook data (keyword)
+        :param correlation_id: id of the alert (keyword), generated when not given
+        :return: Future of the queued job, None if event is inactive
+        :raises DispatchQueueFull: if the dispatch queue is at capacity
+        """
         if self.active:
-            logger.info(f'EVENT TRIGGERED --->\t{str(self)}')
-            log_event = LogEvent(self.name, 'triggered', datetime.now(), f'{self.name} was triggered')
-            log_event.write()
-
             # pass data
             data = kwargs.get('data')
+            correlation_id = kwargs.get('correlation_id') or new_correlation_id()
+            future = dispatcher.submit(
+                self.run_actions, data, correlation_id, time.monotonic(),
+                priority=self.priority, shard=self.shard_key(data))
 
-            self.logs.append(log_event)
-            for action in self._actions:
-                action.set_data(data)
-                action.run()
+            logger.info(f'EVENT TRIGGERED --->\t{str(self)} ({correlation_id})')
+            log_event = LogEvent(self.name, 'triggered', datetime.now(), f'{self.name} was triggered')
+            log_event.write()
+            return future
         else:
             logger.info(f'EVENT NOT TRIGGERED (event is inactive) --->\t{str(self)}')
+
+    def run_actions(self, data, correlation_id=None, received_at=None):
+        """
+        Starts linked actions, called from a dispatcher worker, which moves on to the next alert meanwhile.
+        Each action runs once the actions it runs after are done, independent actions run concurrently:
+        async actions on the dispatcher's event loop, the others on their backend's pool, ahead of the actions of
+        lower priority events.
+        The worker waits for room in a saturated backend pool, holding back its own lane: the alerts behind it then
+        wait in the lane's queue, which rejects new alerts before they are acknowledged, instead of being dropped.
+        :param data: webhook data
+        :param correlation_id: id of the alert, shared by the contexts of every action it runs
+        :param received_at: time.monotonic() when the event was triggered
+        :return: Future resolved once every action has run, the dispatcher then releases the alert's shard
+        """
+        graph = self._graph or self.build_graph()
+        actions = {action.name: action for action in self._actions}
+        worker = threading.get_ident()
+
+        def start_action(name):
+            action = actions[name]
+            timeout = ACTION_TIMEOUT if action.timeout is None else action.timeout
+            context = ActionContext(data, self.name, correlation_id, received_at, timeout=timeout)
+            if action.is_async:
+                return dispatcher.loop.submit(
+                    self.run_action_async(action, context), timeout=timeout,
+                    on_timeout=lambda: self.abandon_action(action, context, timeout))
+            # actions started once the ones they run after are done (from a pool thread or the event loop, which
+            # must not block) belong to an alert already running, they are always queued
+            return bulkheads.submit(
+                action.backend, self.run_action, action, context, timeout=timeout,
+                on_timeout=lambda: self.abandon_action(action, context, timeout), priority=self.priority,
+                admission='wait' if threading.get_ident() == worker else 'always')
+
+        return graph.run(start_action)
+
+    def run_action(self, action, context):
+        """
+        Runs a single action, called from a thread of its backend's pool
+        :param action: Action()
+        :param context: ActionContext()
+        """
+        start = time.perf_counter()
+        try:
+            with action_seconds.time(event=self.name, action=action.name):
+                action.invoke(context)
+        except Exception as e:
+            action_errors_total.inc(event=self.name, action=action.name)
+            journal.record_action(context, action.name, 'error', time.perf_counter() - start, e)
+            raise
+        journal.record_action(context, action.name, 'ok', time.perf_counter() - start)
+
+    async def run_action_async(self, action, context):
+        """
+        Runs a single async action, called on the dispatcher's event loop
+        :param action: Action() with an async def run
+        :param context: ActionContext()
+        """
+        start = time.perf_counter()
+        try:
+            with action_seconds.time(event=self.name, action=action.name):
+                await action.invoke_async(context)
+        except Exception as e:
+            action_errors_total.inc(event=self.name, action=action.name)
+            journal.record_action(context, action.name, 'error', time.perf_counter() - start, e)
+            raise
+        journal.record_action(context, action.name, 'ok', time.perf_counter() - start)
+
+    def abandon_action(self, action, context, timeout):
+        """
+        Records an action abandoned (or, for async actions, cancelled) past its deadline, and asks it to stop
+        :param action: Action()
+        :param context: ActionContext()
+        :param timeout: deadline in seconds
+        """
+        context.cancel_token.cancel()
+        action_timeouts_total.inc(event=self.name, action=action.name)
+        journal.record_action(context, action.name, 'timeout', timeout)
+        logger.error(f'ACTION TIMED OUT --->\t{action.name} ({context.correlation_id}), abandoned after {timeout}s')
+        LogEvent(action.name, 'action_timeout', datetime.now(), f'{action.name} timed out after {timeout}s').write()
@@ -0,0 +1,119 @@
+import threading
+from concurrent.futures import Future
+
+from components.dispatch.deadline import ActionTimeout
+from utils.log import get_logger
+
+logger = get_logger(__name__)
+
+
+class ActionGraph:
+    """
+    Dependency graph of the actions linked to an event, built once at registration.
+    Actions run as soon as the actions they run after are done, independent actions run concurrently.
+    """
+
+    def __init__(self, after: dict):
+        """
+        :param after: dict of action name -> tuple of action names it runs after, in link order
+        :raises ValueError: if a dependency is not linked to the event, or dependencies form a cycle
+        """
+        self.after = {name: tuple(dependencies) for name, dependencies in after.items()}
+        self.dependents = {name: [] for name in self.after}
+        for name, dependencies in self.after.items():
+            for dependency in dependencies:
+                if dependency not in self.after:
+                    raise ValueError(f'{name} runs after {dependency}, which is not linked to the event')
+                self.dependents[dependency].append(name)
+        self.order = self._sort()
+
+    def _sort(self):
+        # Kahn's algorithm, ties keep link order
+        remaining = {name: len(dependencies) for name, dependencies in self.after.items()}
+        ready = [name for name, count in remaining.items() if count == 0]
+        order = []
+        while ready:
+            name = ready.pop(0)
+            order.append(name)
+            for dependent in self.dependents[name]:
+                remaining[dependent] -= 1
+                if remaining[dependent] == 0:
+                    ready.append(dependent)
+        if len(order) != len(self.after):
+            cycle = [name for name in self.after if name not in order]
+            raise ValueError(f'Action dependencies form a cycle: {cycle}')
+        return order
+
+    def run(self, start_action) -> Future:
+        """
+        Starts every action, an action whose predecessor failed is skipped.
+        Returns right away: an action is started by the thread that completes the last action it runs after, so the
+        caller (a dispatch lane worker) is not held while a slow backend runs the actions.
+        :param start_action: callable taking an action name, starts the action and returns its Future
+        :return: Future resolved once every runnable action is done, or failed with the first exception raised by an
+            action. An action abandoned past its deadline counts as done once its call actually returns: the alert's
+            shard stays held meanwhile, so the next alert of the shard does not run alongside the hung call
+        """
+        result = Future()
+        remaining = {name: len(dependencies) for name, dependencies in self.after.items()}
+        pending = [len(self.order)]
+        errors = []
+        lock = threading.Lock()
+
+        def skip(name):
+            # called with lock held, skips the action and everything that runs after it
+            if remaining[name] < 0:
+                return
+            remaining[name] = -1
+            pending[0] -= 1
+            logger.warning(f'ACTION SKIPPED (a predecessor failed) --->\t{name}')
+            for dependent in self.dependents[name]:
+                skip(dependent)
+
+        def finished(name, future):
+            ready = []
+            error = future.exception()
+            with lock:
+                if error is not None:
+                    errors.append(error)
+                    for dependent in self.dependents[name]:
+                        skip(dependent)
+                else:
+                    for dependent in self.dependents[name]:
+                        if remaining[dependent] < 0:
+                            continue
+                        remaining[dependent] -= 1
+                        if remaining[dependent] == 0:
+                            ready.append(dependent)
+            for dependent in ready:
+                start(dependent)
+            # the actions after an abandoned one are skipped right away, the graph waits for it to return
+            returned = error.returned if isinstance(error, ActionTimeout) else None
+            if returned is not None:
+                returned.add_done_callback(lambda _: done())
+            else:
+                done()
+
+        def done():
+            with lock:
+                pending[0] -= 1
+                complete = pending[0] == 0
+            if complete:
+                if errors:
+                    result.set_exception(errors[0])
+                else:
+                    result.set_result(None)
+
+        def start(name):
+            try:
+                future = start_action(name)
+            except Exception as e:
+                future = Future()
+                future.set_exception(e)
+            future.add_done_callback(lambda f: finished(name, f))
+
+        if not self.order:
+            result.set_result(None)
+        for name in [name for name in self.order if not self.after[name]]:
+            start(name)
+        return result
@@ -2,5 +2,9 @@ from components.events.base.event import Event
 
 
 class WebhookReceivedMtBalance(Event):
+    priority = 'low'
+    broker = 'mt5'
+    account_env = 'MT5_LOGIN'
+
     def __init__(self):
         super().__init__()
@@ -1,6 +1,15 @@
 from components.events.base.event import Event
+from components.schemas.payload import Field
 
 
 class WebhookReceivedMtFlatten(Event):
+    priority = 'critical'
+    broker = 'mt5'
+    account_env = 'MT5_LOGIN'
+    fields = {
+        'symbol': Field(str, required=True),
+        'magic': Field(int, required=True),
+    }
+
     def __init__(self):
         super().__init__()
@@ -1,6 +1,25 @@
 from components.events.base.event import Event
+from components.schemas.payload import Field
 
 
 class WebhookReceivedMtOrder(Event):
+    priority = 'critical'
+    broker = 'mt5'
+    account_env = 'MT5_LOGIN'
+    coalesce_quantity = 'volume'
+    position_target = True
+    fields = {
+        'symbol': Field(str, required=True),
+        'order_type': Field(str, required=True),
+        'magic': Field(int, required=True),
+        'volume': Field(float),
+        'price': Field(float),
+        'deviation': Field(int),
+        'tp': Field(float),
+        'sl': Field(float),
+        'tp_rel': Field(float),
+        'sl_rel': Field(float),
+    }
+
     def __init__(self):
         super().__init__()
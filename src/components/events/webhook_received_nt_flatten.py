@@ -1,7 +1,18 @@
 from components.events.base.event import Event
+from components.schemas.payload import Field
 
 
 class WebhookReceivedNtFlatten(Event):
     """Event triggered when a NinjaTrader flatten webhook is received"""
+    priority = 'critical'
+    broker = 'nt'
+    account_env = 'NT_ACCOUNT'
+    fields = {
+        'symbol': Field(str, required=True),
+        'account': Field(str),
+        'strategy': Field(str),
+        'strategy_id': Field(str),
+    }
+
     def __init__(self):
         super().__init__()
@@ -1,7 +1,29 @@
 from components.events.base.event import Event
+from components.schemas.payload import Field
 
 
 class WebhookReceivedNtOrder(Event):
     """Event triggered when a NinjaTrader order webhook is received"""
+    priority = 'critical'
+    broker = 'nt'
+    account_env = 'NT_ACCOUNT'
+    position_target = True
+    fields = {
+        'symbol': Field(str, required=True),
+        'order_type': Field(str, required=True),
+        'quantity': Field(int),
+        'account': Field(str),
+        'order_kind': Field(str),
+        'limit_price': Field(float),
+        'stop_price': Field(float),
+        'tif': Field(str),
+        'oco': Field(str),
+        'order_id': Field(str),
+        'strategy': Field(str),
+        'strategy_id': Field(str),
+        'tp': Field(float),
+        'sl': Field(float),
+    }
+
     def __init__(self):
         super().__init__()
@@ -1,5 +1,11 @@
 from components.events.base.event import Event
+from components.schemas.payload import Field
 
 
 class WebhookReceivedNtOrderInfo(Event):
-    pass
+    priority = 'low'
+    broker = 'nt'
+    account_env = 'NT_ACCOUNT'
+    fields = {
+        'account': Field(str),
+    }
@@ -1,5 +1,12 @@
 from components.events.base.event import Event
+from components.schemas.payload import Field
 
 
 class WebhookReceivedNtPositionInfo(Event):
-    pass
+    priority = 'low'
+    broker = 'nt'
+    account_env = 'NT_ACCOUNT'
+    fields = {
+        'symbol': Field(str),
+        'account': Field(str),
+    }
@@ -0,0 +1,288 @@
+import json
+import queue
+import sqlite3
+import threading
+import time
+
+from commons import JOURNAL_PATH, JOURNAL_QUEUE_SIZE, JOURNAL_BATCH_SIZE
+from components.metrics.metrics import metrics, broker_call_hooks
+from utils.log import get_logger
+
+logger = get_logger(__name__)
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS journal (
+    id INTEGER PRIMARY KEY,
+    at REAL NOT NULL,
+    kind TEXT NOT NULL,
+    correlation_id TEXT,
+    event TEXT,
+    name TEXT,
+    symbol TEXT,
+    account TEXT,
+    status TEXT,
+    seconds REAL,
+    detail TEXT
+);
+CREATE INDEX IF NOT EXISTS journal_at ON journal (at);
+CREATE INDEX IF NOT EXISTS journal_event_at ON journal (event, at);
+CREATE INDEX IF NOT EXISTS journal_symbol_at ON journal (symbol, at);
+CREATE INDEX IF NOT EXISTS journal_account_at ON journal (account, at);
+CREATE INDEX IF NOT EXISTS journal_correlation_id ON journal (correlation_id);
+'''
+
+COLUMNS = ('id', 'at', 'kind', 'correlation_id', 'event', 'name', 'symbol', 'account', 'status', 'seconds', 'detail')
+
+KINDS = ('alert', 'action', 'broker')
+
+# longest broker response body kept, in characters
+MAX_RESPONSE_CHARS = 4000
+
+
+def _jsonable(value):
+    # broker results: MT5 named tuples, requests responses, anything else as text
+    if hasattr(value, '_asdict'):
+        return {k: _jsonable(v) for k, v in value._asdict().items()}
+    if hasattr(value, 'status_code') and hasattr(value, 'text'):
+        return {'status_code': value.status_code, 'body': value.text[:MAX_RESPONSE_CHARS]}
+    if isinstance(value, (str, int, float, bool)) or value is None:
+        return value
+    if isinstance(value, dict):
+        return {str(k): _jsonable(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_jsonable(v) for v in value]
+    return str(value)
+
+
+def _payload(data):
+    # the webhook key is a secret, not journaled
+    return {k: v for k, v in dict(data).items() if k != 'key'} if data else None
+
+
+def _where(data, field):
+    value = data.get(field) if data else None
+    return str(value) if value not in (None, '') else None
+
+
+class Journal:
+    """
+    Durable journal of every alert, action run and broker call (request and response), for audits, in SQLite
+    (WAL mode), indexed by time, event, symbol and account.
+    Recording only queues the row: a single writer thread inserts everything queued at that time in one transaction,
+    so the webhook path never touches the disk. If the writer falls JOURNAL_QUEUE_SIZE rows behind, rows are dropped
+    (and counted) rather than slowing alerts down.
+    """
+
+    def __init__(self, path: str = JOURNAL_PATH, queue_size: int = JOURNAL_QUEUE_SIZE,
+                 batch_size: int = JOURNAL_BATCH_SIZE):
+        self.path = path
+        self.batch_size = batch_size
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._writer = None
+        self._lock = threading.Lock()
+
+        # counters
+        self._written = 0
+        self._commits = 0
+        self._dropped = 0
+        self._errors = 0
+
+    @property
+    def enabled(self):
+        return bool(self.path)
+
+    def record_alert(self, correlation_id, event, data, status, message, replayed=False):
+        """
+        Records an alert and the response it got
+        :param correlation_id: id of the alert, shared by its action runs and broker calls
+        :param event: event name
+        :param data: decoded data (Payload()), None if not decoded
+        :param status: response status code
+        :param message: response message
+        :param replayed: replayed from the write-ahead log
+        """
+        detail = {'data': _payload(data), 'message': message}
+        if replayed:
+            detail['replayed'] = True
+        self._record('alert', correlation_id, event, None, _where(data, 'symbol'), _where(data, 'account'),
+                     str(status), None, detail)
+
+    def record_action(self, context, action, status, seconds, error=None):
+        """
+        Records an action run
+        :param context: ActionContext() of the run
+        :param action: action name
+        :param status: ok, error or timeout
+        :param seconds: run time
+        :param error: exception raised, if any
+        """
+        self._record('action', context.correlation_id, context.event, action, _where(context.data, 'symbol'),
+                     _where(context.data, 'account'), status, seconds, {'error': repr(error)} if error else None)
+
+    def record_broker(self, broker, call, request, response, seconds, error=None):
+        """
+        Records a broker call, with the alert of the action making it, called by metrics.broker_call()
+        :param broker: broker name, i.e. mt5
+        :param call: call name, i.e. order_send
+        :param request: what was sent
+        :param response: what came back
+        :param seconds: call time
+        :param error: exception raised, if any
+        """
+        from components.actions.base.action import current_context
+
+        context = current_context()
+        data = context.data if context is not None else None
+        detail = {'request': _jsonable(request), 'response': _jsonable(response)}
+        if error is not None:
+            detail['error'] = repr(error)
+        self._record('broker', context.correlation_id if context is not None else None,
+                     context.event if context is not None else None, f'{broker}.{call}',
+                     _where(data, 'symbol'), _where(data, 'account'), 'error' if error else 'ok', seconds, detail)
+
+    def _record(self, kind, correlation_id, event, name, symbol, account, status, seconds, detail):
+        if not self.enabled:
+            return
+        if self._writer is None:
+            self._start()
+        row = (time.time(), kind, correlation_id, event, name, symbol, account, status, seconds,
+               json.dumps(detail, default=str) if detail is not None else None)
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            with self._lock:
+                self._dropped += 1
+
+    def _start(self):
+        # started on the first record, so forked workers each start their own
+        with self._lock:
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._write, name='journal-writer', daemon=True)
+                self._writer.start()
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=5)
+        connection.execute('PRAGMA journal_mode=WAL')
+        # with WAL, commits are not fsynced (checkpoints are): a power loss can lose the last commits, not corrupt
+        connection.execute('PRAGMA synchronous=NORMAL')
+        connection.executescript(SCHEMA)
+        return connection
+
+    def _write(self):
+        connection = None
+        while True:
+            rows = [self._queue.get()]
+            while len(rows) < self.batch_size:
+                try:
+                    rows.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                if connection is None:
+                    connection = self._connect()
+                with connection:
+                    connection.executemany(
+                        'INSERT INTO journal (at, kind, correlation_id, event, name, symbol, account, status, seconds, '
+                        'detail) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+                with self._lock:
+                    self._written += len(rows)
+                    self._commits += 1
+            except sqlite3.Error as e:
+                logger.exception(f'Journal write failed, {len(rows)} row(s) lost: {e}')
+                with self._lock:
+                    self._errors += 1
+                    self._dropped += len(rows)
+            finally:
+                for _ in rows:
+                    self._queue.task_done()
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """
+        Waits until every queued row is written, i.e. before the process exits
+        :param timeout: seconds
+        :return: False if rows were still queued at the timeout
+        """
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks:
+            if self._writer is None or time.monotonic() >= deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def query(self, kind=None, event=None, symbol=None, account=None, correlation_id=None, since=None, until=None,
+              limit=100) -> list:
+        """
+        Gets journal rows, newest first
+        :param kind: alert, action or broker
+        :param event: event name
+        :param symbol: symbol of the alert
+        :param account: account of the alert
+        :param correlation_id: id of an alert, to get its action runs and broker calls
+        :param since: epoch, rows at or after
+        :param until: epoch, rows before
+        :param limit: maximum number of rows
+        :return: list of dict
+        """
+        if not self.enabled:
+            return []
+        clauses, params = [], []
+        for column, value in (('kind', kind), ('event', event), ('symbol', symbol), ('account', account),
+                              ('correlation_id', correlation_id)):
+            if value is not None:
+                clauses.append(f'{column} = ?')
+                params.append(value)
+        if since is not None:
+            clauses.append('at >= ?')
+            params.append(since)
+        if until is not None:
+            clauses.append('at < ?')
+            params.append(until)
+        where = f'WHERE {" AND ".join(clauses)}' if clauses else ''
+
+        try:
+            # readers don't block the writer (nor each other) in WAL mode
+            connection = sqlite3.connect(f'file:{self.path}?mode=ro', uri=True, timeout=5)
+        except sqlite3.OperationalError:
+            # nothing journaled yet
+            return []
+        try:
+            rows = connection.execute(
+                f'SELECT {", ".join(COLUMNS)} FROM journal {where} ORDER BY at DESC LIMIT ?', (*params, limit)
+            ).fetchall()
+        except sqlite3.OperationalError:
+            return []
+        finally:
+            connection.close()
+
+        entries = []
+        for row in rows:
+            entry = dict(zip(COLUMNS, row))
+            entry['detail'] = json.loads(entry['detail']) if entry['detail'] else None
+            entries.append(entry)
+        return entries
+
+    def stats(self) -> dict:
+        """
+        Gets writer counters
+        :return: dict
+        """
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'queued': self._queue.qsize(),
+                'written': self._written,
+                'commits': self._commits,
+                'dropped': self._dropped,
+                'errors': self._errors,
+            }
+
+
+journal = Journal()
+broker_call_hooks.append(journal.record_broker)
+
+metrics.gauge(
+    'tvwb_journal_queue_depth', 'Journal rows waiting for the writer',
+    lambda: journal.stats()['queued'])
+metrics.callback_counter(
+    'tvwb_journal_dropped_total', 'Journal rows dropped (writer behind, or write failed)',
+    lambda: journal.stats()['dropped'])
@@ -1,6 +1,7 @@
 from datetime import datetime
 
-from commons import LOG_LOCATION, LOG_LIMIT
+from components.logs.log_hub import log_hub
+from components.logs.log_store import log_store
 
 
 class LogEvent:
@@ -48,11 +49,4 @@ class LogEvent:
         return self
 
     def write(self):
-        rows = open(LOG_LOCATION, 'r').readlines()
-        if len(rows) >= LOG_LIMIT:
-            log_file = open(LOG_LOCATION, 'w')
-            log_file.writelines(rows[1:])
-        else:
-            log_file = open(LOG_LOCATION, 'a')
-        log_file.write(self.to_line())
-        log_file.close()
\ No newline at end of file
+        log_hub.publish(log_store.append(self.to_line()))
\ No newline at end of file
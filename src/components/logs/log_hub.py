@@ -0,0 +1,216 @@
+import collections
+import json
+import threading
+import time
+
+from commons import LOG_STREAM_CLIENTS, LOG_STREAM_BUFFER
+from components.logs.log_store import log_store, parse_cursor
+from components.metrics.metrics import metrics
+
+# milliseconds before a browser reconnects to an ended stream (i.e. a reloaded worker)
+STREAM_RETRY = 3000
+# seconds between reads of the log store, for the entries written by the other prefork workers
+STREAM_POLL = 1.0
+# seconds of silence before a comment is sent, keeps proxies from closing the stream and detects gone clients
+STREAM_HEARTBEAT = 15.0
+
+
+class LogSubscriber:
+    """
+    Bounded buffer of the log entries published since a subscriber (a /logs/stream client) last read.
+    Once full, new entries are not buffered: the subscriber is marked overflowed and catches up from the log store,
+    so a slow client never holds more than `size` entries.
+    """
+
+    def __init__(self, size: int, wake):
+        self.size = size
+        self.overflowed = False
+        self._entries = collections.deque()
+        self._wake = wake
+
+    def put(self, entry):
+        # called with the hub lock held
+        if len(self._entries) >= self.size:
+            self.overflowed = True
+        else:
+            self._entries.append(entry)
+        self._wake()
+
+    def take(self):
+        """
+        Takes the buffered entries
+        :return: (list of LogEntry oldest first, True if entries were dropped since the last take)
+        """
+        entries = []
+        while self._entries:
+            entries.append(self._entries.popleft())
+        overflowed, self.overflowed = self.overflowed, False
+        return entries, overflowed
+
+
+class LogHub:
+    """
+    Publishes log entries, as they are written, to the live log streams (GET /logs/stream)
+    """
+
+    def __init__(self, max_subscribers: int = LOG_STREAM_CLIENTS, buffer_size: int = LOG_STREAM_BUFFER):
+        self.max_subscribers = max_subscribers
+        self.buffer_size = buffer_size
+        self.closed = False
+        self._subscribers = set()
+        self._lock = threading.Lock()
+
+        # counters
+        self._published = 0
+        self._overflows = 0
+        self._refused = 0
+
+    def accepts(self) -> bool:
+        """
+        Checks a new subscriber would be accepted, counting it as refused otherwise
+        :return: False if there are already max_subscribers or the hub is closed
+        """
+        with self._lock:
+            if self.closed or len(self._subscribers) >= self.max_subscribers:
+                self._refused += 1
+                return False
+            return True
+
+    def subscribe(self, wake):
+        """
+        Adds a subscriber
+        :param wake: called (from the publishing thread) when entries are buffered or the hub is closed
+        :return: LogSubscriber, None if there are already max_subscribers or the hub is closed
+        """
+        with self._lock:
+            if self.closed or len(self._subscribers) >= self.max_subscribers:
+                self._refused += 1
+                return None
+            subscriber = LogSubscriber(self.buffer_size, wake)
+            self._subscribers.add(subscriber)
+            return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def publish(self, entry):
+        """
+        Buffers an entry for every subscriber
+        :param entry: LogEntry
+        """
+        with self._lock:
+            self._published += 1
+            for subscriber in self._subscribers:
+                overflowed = subscriber.overflowed
+                subscriber.put(entry)
+                if subscriber.overflowed and not overflowed:
+                    self._overflows += 1
+
+    def close(self):
+        """
+        Ends every stream (clients reconnect, i.e. to the next worker generation) and refuses new ones
+        """
+        with self._lock:
+            self.closed = True
+            for subscriber in self._subscribers:
+                subscriber._wake()
+
+    def stats(self) -> dict:
+        """
+        Gets subscriber counters
+        :return: dict
+        """
+        with self._lock:
+            return {
+                'subscribers': len(self._subscribers),
+                'max_subscribers': self.max_subscribers,
+                'published': self._published,
+                'overflows': self._overflows,
+                'refused': self._refused,
+            }
+
+
+class LogStream:
+    """
+    Server-Sent Events of a /logs/stream client: entries published by this process as they are written, and entries
+    written by other prefork workers (or dropped from a full buffer) read back from the log store every STREAM_POLL.
+    The server calls start(), then read() whenever woken (or every STREAM_POLL) while the stream is open.
+    """
+
+    def __init__(self, hub, render, since: str = None, wake=None):
+        """
+        :param hub: LogHub
+        :param render: gets the JSON serializable data of a LogEntry
+        :param since: cursor of the newest entry the client has (Last-Event-ID)
+        :param wake: called when entries are published or the hub is closed
+        """
+        self.hub = hub
+        self.render = render
+        self.wake = wake or (lambda: None)
+        self.last = None
+        if since:
+            try:
+                self.last = parse_cursor(since)
+            except ValueError:
+                pass
+        self.subscriber = None
+        self._next_poll = 0.0
+        self._sent_at = 0.0
+
+    @property
+    def open(self):
+        return self.subscriber is not None and not self.hub.closed
+
+    def start(self) -> str:
+        """
+        Subscribes to the hub
+        :return: first chunk of the stream, the entries since the cursor (or the last entries), empty if the hub is full
+        """
+        self.subscriber = self.hub.subscribe(self.wake)
+        if self.subscriber is None:
+            return ''
+        self._next_poll = self._sent_at = time.monotonic()
+        return f'retry: {STREAM_RETRY}\n\n' + self._format(reversed(log_store.newer(self.last)))
+
+    def read(self) -> str:
+        """
+        :return: events for the entries not sent yet, a heartbeat comment, or an empty string
+        """
+        now = time.monotonic()
+        entries, overflowed = self.subscriber.take()
+        if overflowed or now >= self._next_poll:
+            # the store has everything, in order: what is buffered is in it
+            self._next_poll = now + STREAM_POLL
+            chunk = self._format(reversed(log_store.newer(self.last)))
+        else:
+            chunk = self._format(entries)
+        if chunk:
+            self._sent_at = now
+        elif now - self._sent_at >= STREAM_HEARTBEAT:
+            chunk = ': keep-alive\n\n'
+            self._sent_at = now
+        return chunk
+
+    def close(self):
+        if self.subscriber is not None:
+            self.hub.unsubscribe(self.subscriber)
+            self.subscriber = None
+
+    def _format(self, entries) -> str:
+        events = []
+        for entry in entries:
+            position = (entry.segment, entry.offset)
+            if self.last is not None and position[0] == self.last[0] and position[1] <= self.last[1]:
+                # already sent
+                continue
+            events.append(f'id: {entry.cursor}\nevent: log\ndata: {json.dumps(self.render(entry))}\n\n')
+            self.last = position
+        return ''.join(events)
+
+
+log_hub = LogHub()
+
+metrics.gauge(
+    'tvwb_log_stream_clients', 'Dashboards connected to the live log stream',
+    lambda: log_hub.stats()['subscribers'])
@@ -0,0 +1,203 @@
+import collections
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows, no prefork workers to coordinate with
+    fcntl = None
+
+from commons import LOG_LOCATION, LOG_LIMIT, LOG_SEGMENT_BYTES
+
+
+class LogEntry(collections.namedtuple('LogEntry', ('segment', 'offset', 'line'))):
+    """
+    A log line, located by the inode of its segment and the offset of its end in it: the same in every prefork worker
+    """
+
+    @property
+    def cursor(self):
+        return f'{self.segment:x}-{self.offset:x}'
+
+
+def parse_cursor(cursor: str):
+    """
+    Parses a cursor given by LogEntry.cursor
+    :return: (segment, offset)
+    :raises ValueError: if the cursor is invalid
+    """
+    segment, offset = cursor.split('-')
+    return int(segment, 16), int(offset, 16)
+
+
+class LogStore:
+    """
+    Log lines (events triggered, actions run) shown in the GUI. The last `limit` lines are kept in memory, in a ring,
+    and each line is appended to the active segment on disk (path) under a lock, without reading the file back.
+    Once the active segment grows past segment_bytes it becomes the previous segment (path.1, replacing the older one),
+    so the disk is trimmed a segment at a time rather than rewritten.
+
+    Lines are also indexed by parent (the event or action that wrote them), the last `limit` lines of each, so events
+    get their history without reading the file: the segments are read once, then again only when another prefork
+    worker wrote to them (a worker reloads when it sees the active segment changed behind it).
+    """
+
+    def __init__(self, path: str = LOG_LOCATION, limit: int = LOG_LIMIT, segment_bytes: int = LOG_SEGMENT_BYTES):
+        self.path = path
+        self.limit = limit
+        self.segment_bytes = segment_bytes
+        self._entries = collections.deque(maxlen=limit)
+        self._by_parent = {}  # parent -> deque of its last LogEntry
+        self._file = None
+        self._seen = None  # (inode, size) of the active segment, as last written or read by this process
+        self._modified = 0.0  # epoch of the last line appended, by any worker
+        self._lock = threading.Lock()
+
+    @property
+    def previous_path(self):
+        return f'{self.path}.1'
+
+    def append(self, line: str):
+        """
+        Appends a line (ending with a newline) to the log
+        :param line: str
+        :return: LogEntry
+        """
+        data = line.encode('utf-8')
+        with self._lock:
+            self._sync()
+            # a single write on a file opened for appending, lines of concurrent workers don't interleave
+            self._file.write(data)
+            self._file.flush()
+            inode, size = self._seen
+            entry = LogEntry(inode, self._file.tell(), line)
+            self._entries.append(entry)
+            self._index(self._by_parent, entry)
+            self._seen = (inode, size + len(data))
+            self._modified = time.time()
+            if self._seen[1] >= self.segment_bytes:
+                self._rotate()
+            return entry
+
+    def lines(self) -> list:
+        """
+        Gets the last lines of the log, oldest first
+        :return: list of str
+        """
+        with self._lock:
+            self._sync()
+            return [entry.line for entry in self._entries]
+
+    def history(self, parent: str) -> list:
+        """
+        Gets the last lines written by an event or action
+        :param parent: event or action name
+        :return: list of LogEntry, oldest first
+        """
+        with self._lock:
+            self._sync()
+            return list(self._by_parent.get(parent, ()))
+
+    def state(self):
+        """
+        Gets what identifies the current content of the log, for conditional requests
+        :return: (cursor of the newest line or None if empty, epoch of the last change)
+        """
+        with self._lock:
+            self._sync()
+            newest = self._entries[-1].cursor if self._entries else None
+            return newest, self._modified
+
+    def newer(self, since=None, limit: int = None) -> list:
+        """
+        Gets the lines appended after a cursor, newest first
+        :param since: (segment, offset) given by parse_cursor(), None for the last lines
+        :param limit: maximum number of lines, defaults to the ring size
+        :return: list of LogEntry
+        """
+        limit = limit or self.limit
+        with self._lock:
+            self._sync()
+            entries = []
+            in_segment = False
+            for entry in reversed(self._entries):
+                if len(entries) >= limit:
+                    break
+                if since is not None:
+                    if entry.segment == since[0]:
+                        if entry.offset <= since[1]:
+                            break
+                        in_segment = True
+                    elif in_segment:
+                        # older segment than the cursor's
+                        break
+                entries.append(entry)
+            return entries
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+                self._seen = None
+
+    def _sync(self):
+        # called with lock held, (re)opens the active segment and reloads the ring if it changed behind this process
+        if self._file is not None:
+            try:
+                stat = os.stat(self.path)
+                if (stat.st_ino, stat.st_size) == self._seen:
+                    return
+            except FileNotFoundError:
+                pass
+            self._file.close()
+        self._file = open(self.path, 'ab')
+        # stat before reading: a line written in between is read, then seen as a change and read again next time
+        stat = os.fstat(self._file.fileno())
+        self._seen = (stat.st_ino, stat.st_size)
+        self._modified = stat.st_mtime
+        entries = collections.deque(maxlen=self.limit)
+        by_parent = {}
+        for segment in (self.previous_path, self.path):
+            try:
+                with open(segment, 'rb') as segment_file:
+                    inode, offset = os.fstat(segment_file.fileno()).st_ino, 0
+                    for data in segment_file:
+                        offset += len(data)
+                        line = data.decode('utf-8', errors='replace')
+                        if line.strip():
+                            entry = LogEntry(inode, offset, line)
+                            entries.append(entry)
+                            self._index(by_parent, entry)
+            except FileNotFoundError:
+                pass
+        self._entries = entries
+        self._by_parent = by_parent
+
+    def _index(self, by_parent, entry):
+        parent = entry.line.split(',', 1)[0]
+        if parent not in by_parent:
+            by_parent[parent] = collections.deque(maxlen=self.limit)
+        by_parent[parent].append(entry)
+
+    def _rotate(self):
+        # called with lock held, the active segment becomes the previous one
+        try:
+            if fcntl is not None:
+                # workers reaching the limit together rotate once: the others find the segment already moved
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+            if os.path.samestat(os.fstat(self._file.fileno()), os.stat(self.path)):
+                self._file.close()
+                os.replace(self.path, self.previous_path)
+        except OSError:
+            pass
+        finally:
+            # also releases the lock
+            self._file.close()
+        self._file = open(self.path, 'ab')
+        stat = os.fstat(self._file.fileno())
+        self._seen = (stat.st_ino, stat.st_size)
+
+
+log_store = LogStore()
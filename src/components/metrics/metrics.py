@@ -0,0 +1,333 @@
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from utils.log import get_logger
+
+logger = get_logger(__name__)
+
+# latency buckets in seconds, from 100µs (decode) to 30s (hung broker)
+DEFAULT_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# seconds between two snapshots of a prefork worker's metrics, read by the other workers (see MetricsRegistry.share())
+PUBLISH_INTERVAL = 1.0
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in pairs) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    type = None
+    # the value is already the same in every process (i.e. read from shared memory), it is not summed over workers
+    shared = False
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, '')) for name in self.label_names)
+
+    def collect(self):
+        """
+        Gets the values of this process
+        :return: dict of label values tuple -> value
+        """
+        with self._lock:
+            return dict(self._values)
+
+    @staticmethod
+    def combine(value, other):
+        """
+        Adds up the values of two processes
+        """
+        return value + other
+
+    def render(self, values=None):
+        """
+        :param values: dict of label values tuple -> value, defaults to the values of this process
+        :return: list of lines
+        """
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.type}']
+        if values is None:
+            values = self.collect()
+        for key, value in sorted(values.items()):
+            lines.extend(self._render_sample(key, value))
+        return lines
+
+    def _render_sample(self, key, value):
+        return [f'{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}']
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    """Gauge whose value is read from a callback when rendered"""
+    type = 'gauge'
+
+    def __init__(self, name, documentation, callback, labels=()):
+        super().__init__(name, documentation, labels)
+        self.callback = callback
+
+    def collect(self):
+        # callback returns a value, or {label values tuple: value} when the gauge has labels
+        value = self.callback()
+        return value if isinstance(value, dict) else {(): value}
+
+
+class CallbackCounter(Gauge):
+    """Counter whose value is read from a callback when rendered, for components that keep their own totals"""
+    type = 'counter'
+
+
+class Histogram(Metric):
+    """Histogram with fixed buckets, observations are a bisect and two additions"""
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # [per bucket counts (+Inf last), sum]
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][index] += 1
+            state[1] += value
+
+    def collect(self):
+        with self._lock:
+            return {key: [list(counts), total] for key, (counts, total) in self._values.items()}
+
+    @staticmethod
+    def combine(value, other):
+        return [[a + b for a, b in zip(value[0], other[0])], value[1] + other[1]]
+
+    @contextmanager
+    def time(self, **labels):
+        """
+        Times the enclosed block
+        :param labels: label values
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _render_sample(self, key, value):
+        counts, total = value
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), counts):
+            cumulative += count
+            labels = _format_labels(self.label_names, key, ('le', _format_value(bound)))
+            lines.append(f'{self.name}_bucket{labels} {cumulative}')
+        labels = _format_labels(self.label_names, key)
+        lines.append(f'{self.name}_sum{labels} {_format_value(total)}')
+        lines.append(f'{self.name}_count{labels} {cumulative}')
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+        self.directory = None  # snapshots of the prefork workers, see share()
+
+    def _add(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name, documentation, labels=()):
+        return self._add(Counter(name, documentation, labels))
+
+    def gauge(self, name, documentation, callback, labels=(), shared=False):
+        gauge = Gauge(name, documentation, callback, labels)
+        gauge.shared = shared
+        return self._add(gauge)
+
+    def callback_counter(self, name, documentation, callback, labels=(), shared=False):
+        counter = CallbackCounter(name, documentation, callback, labels)
+        counter.shared = shared
+        return self._add(counter)
+
+    def histogram(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        return self._add(Histogram(name, documentation, labels, buckets))
+
+    def share(self, directory: str):
+        """
+        Sums the metrics of every forked worker, whichever one renders them (call before forking).
+        Each worker writes a snapshot of its own values to directory, every PUBLISH_INTERVAL seconds (see publish()),
+        so the values of the other workers are up to that old.
+        :param directory: empty directory, removed by the caller once every worker has exited
+        """
+        self.directory = directory
+
+    def publish(self):
+        """
+        Writes the values of this process to the shared directory, for the other workers to render
+        """
+        if self.directory is None:
+            return
+        with self._lock:
+            metrics = [metric for metric in self._metrics.values() if not metric.shared]
+        snapshot = {metric.name: [[list(key), value] for key, value in metric.collect().items()] for metric in metrics}
+        path = os.path.join(self.directory, f'{os.getpid()}.json')
+        temporary = f'{path}.{threading.get_ident()}.tmp'
+        with open(temporary, 'w') as snapshot_file:
+            json.dump(snapshot, snapshot_file)
+        os.replace(temporary, path)
+
+    def retire(self, pid: int):
+        """
+        Drops the gauges of an exited worker from the shared directory, its counters and histograms still count
+        :param pid: process id of the worker
+        """
+        path = os.path.join(self.directory, f'{pid}.json')
+        try:
+            with open(path) as snapshot_file:
+                snapshot = json.load(snapshot_file)
+        except (OSError, ValueError):
+            return
+        with self._lock:
+            gauges = {name for name, metric in self._metrics.items() if metric.type == 'gauge'}
+        with open(path, 'w') as snapshot_file:
+            json.dump({name: values for name, values in snapshot.items() if name not in gauges}, snapshot_file)
+
+    def _snapshots(self):
+        snapshots = []
+        for name in os.listdir(self.directory):
+            if not name.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(self.directory, name)) as snapshot_file:
+                    snapshots.append(json.load(snapshot_file))
+            except (OSError, ValueError) as e:
+                logger.warning(f'Skipping metrics snapshot {name}: {e}')
+        return snapshots
+
+    def render(self):
+        """
+        Renders all metrics in the Prometheus text exposition format, summed over the prefork workers once shared
+        :return: str
+        """
+        with self._lock:
+            metrics = list(self._metrics.values())
+        snapshots = None
+        if self.directory is not None:
+            self.publish()
+            snapshots = self._snapshots()
+
+        lines = []
+        for metric in metrics:
+            values = None
+            if snapshots is not None and not metric.shared:
+                values = {}
+                for snapshot in snapshots:
+                    for key, value in snapshot.get(metric.name, ()):
+                        key = tuple(key)
+                        values[key] = metric.combine(values[key], value) if key in values else value
+            lines.extend(metric.render(values))
+        return '\n'.join(lines) + '\n'
+
+
+metrics = MetricsRegistry()
+
+# request stages, from arrival to the webhook being queued
+stage_seconds = metrics.histogram(
+    'tvwb_stage_seconds', 'Time spent in each webhook ingress stage', labels=('stage',))
+webhooks_total = metrics.counter(
+    'tvwb_webhooks_total', 'Webhook items received, by event and response status', labels=('event', 'status'))
+
+# execution
+action_seconds = metrics.histogram(
+    'tvwb_action_seconds', 'Time spent running each linked action', labels=('event', 'action'))
+action_errors_total = metrics.counter(
+    'tvwb_action_errors_total', 'Actions that raised an exception', labels=('event', 'action'))
+action_timeouts_total = metrics.counter(
+    'tvwb_action_timeouts_total', 'Actions abandoned past their deadline', labels=('event', 'action'))
+broker_seconds = metrics.histogram(
+    'tvwb_broker_seconds', 'Time spent in broker calls', labels=('broker', 'call'))
+broker_errors_total = metrics.counter(
+    'tvwb_broker_errors_total', 'Broker calls that raised an exception', labels=('broker', 'call'))
+
+
+class BrokerCall:
+    """Request and response of a broker call, set the response for it to be journaled"""
+
+    __slots__ = ('request', 'response')
+
+    def __init__(self, request=None):
+        self.request = request
+        self.response = None
+
+
+# called after every broker call with (broker, call, request, response, seconds, error), i.e. by the journal
+broker_call_hooks = []
+
+
+@contextmanager
+def broker_call(broker, call, request=None):
+    """
+    Times a call to a broker (HTTP request, ATI file write, MT5 order_send...), and passes it to broker_call_hooks
+    :param broker: broker name, i.e. mt5
+    :param call: call name, i.e. order_send
+    :param request: what is sent to the broker
+    :return: BrokerCall(), set its response
+    """
+    record = BrokerCall(request)
+    start = time.perf_counter()
+    error = None
+    try:
+        yield record
+    except Exception as e:
+        error = e
+        broker_errors_total.inc(broker=broker, call=call)
+        raise
+    finally:
+        seconds = time.perf_counter() - start
+        broker_seconds.observe(seconds, broker=broker, call=call)
+        for hook in broker_call_hooks:
+            try:
+                hook(broker, call, record.request, record.response, seconds, error)
+            except Exception as e:
+                # never hides the outcome of the call itself
+                logger.exception(f'Broker call hook failed: {e}')
@@ -0,0 +1,209 @@
+import json
+import math
+import re
+from collections.abc import Mapping
+from hashlib import sha256
+
+# finds the key of a text/plain body without parsing the rest of it
+_TEXT_KEY = re.compile(r'(?:^|,)\s*key\s*=\s*([^,]*)')
+
+
+class PayloadError(ValueError):
+    """Raised when webhook data does not match the fields declared by an event"""
+
+
+class Field:
+    def __init__(self, type=str, required=False, default=None):
+        """
+        Declares an expected webhook field
+        :param type: one of str, int, float, bool
+        :param required: reject webhooks that do not provide this field
+        :param default: value used when the field is not provided
+        """
+        if type not in _COERCERS:
+            raise TypeError(f'Unsupported field type {type}')
+        self.type = type
+        self.required = required
+        self.default = default
+
+
+class Payload(Mapping):
+    """Immutable, already typed webhook data handed to actions"""
+
+    __slots__ = ('_data',)
+
+    def __init__(self, data):
+        object.__setattr__(self, '_data', dict(data))
+
+    def __getitem__(self, name):
+        return self._data[name]
+
+    def __getattr__(self, name):
+        if name.startswith('__') or name == '_data':
+            raise AttributeError(name)
+        try:
+            return self._data[name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('Payload is immutable')
+
+    def __iter__(self):
+        return iter(self._data)
+
+    def __len__(self):
+        return len(self._data)
+
+    def __repr__(self):
+        return repr(self._data)
+
+    def __reduce__(self):
+        return Payload, (self._data,)
+
+    def as_dict(self):
+        return dict(self._data)
+
+    def digest(self):
+        """
+        Gets a canonical hash of the payload, equal payloads hash the same regardless of field order
+        :return: str
+        """
+        canonical = json.dumps(self._data, sort_keys=True, separators=(',', ':'), default=str)
+        return sha256(canonical.encode()).hexdigest()
+
+
+def _check_scalar(value):
+    # JSON lists and objects (and booleans, which are ints) are never numbers
+    if isinstance(value, bool) or not isinstance(value, (str, int, float)):
+        raise TypeError
+
+
+def _to_str(value):
+    if isinstance(value, (list, dict)):
+        raise TypeError
+    return value.strip() if isinstance(value, str) else str(value)
+
+
+def _to_int(value):
+    _check_scalar(value)
+    if isinstance(value, int):
+        return value
+    if isinstance(value, float):
+        if not value.is_integer():
+            raise ValueError
+        return int(value)
+    value = value.strip()
+    try:
+        return int(value)
+    except ValueError:
+        # accept integral floats, i.e. "1.0"
+        as_float = float(value)
+        if not as_float.is_integer():
+            raise
+        return int(as_float)
+
+
+def _to_float(value):
+    _check_scalar(value)
+    value = float(value)
+    # "nan" and "inf" parse, but are no quantity nor price
+    if not math.isfinite(value):
+        raise ValueError
+    return value
+
+
+def _to_bool(value):
+    if isinstance(value, bool):
+        return value
+    lowered = str(value).strip().lower()
+    if lowered in ('true', '1', 'yes', 'on'):
+        return True
+    if lowered in ('false', '0', 'no', 'off'):
+        return False
+    raise ValueError
+
+
+_COERCERS = {
+    str: _to_str,
+    int: _to_int,
+    float: _to_float,
+    bool: _to_bool,
+}
+
+
+def extract_text_key(body: str):
+    """
+    Gets the webhook key from a text/plain body (k=v,k=v)
+    :param body: raw body
+    :return: key or None
+    """
+    match = _TEXT_KEY.search(body)
+    return match.group(1).strip() if match else None
+
+
+def _iter_text_pairs(body: str):
+    for item in body.split(','):
+        if '=' not in item:
+            continue
+        name, value = item.split('=', 1)
+        yield name.strip(), value
+
+
+class PayloadDecoder:
+    """
+    Decoder compiled once from an event's field declaration.
+    Parses and coerces webhook data in a single pass over the provided fields.
+    """
+
+    def __init__(self, fields: dict):
+        self._coercers = {name: (_COERCERS[field.type], field) for name, field in fields.items()}
+        self._required = tuple(name for name, field in fields.items() if field.required)
+        self._defaults = {name: field.default for name, field in fields.items() if field.default is not None}
+
+    def decode(self, data: dict) -> Payload:
+        """
+        Decodes JSON webhook data
+        :param data: dict from the request body
+        :return: Payload()
+        :raises PayloadError: if a field is missing or malformed
+        """
+        return self._decode(data.items())
+
+    def decode_text(self, body: str) -> Payload:
+        """
+        Decodes text/plain webhook data (k=v,k=v)
+        :param body: raw body
+        :return: Payload()
+        :raises PayloadError: if a field is missing or malformed
+        """
+        return self._decode(_iter_text_pairs(body))
+
+    def _decode(self, items) -> Payload:
+        data = dict(self._defaults)
+        errors = {}
+        for name, value in items:
+            entry = self._coercers.get(name)
+            if entry is None:
+                # undeclared fields are passed through as is
+                data[name] = value
+                continue
+
+            # empty optional fields fall back to their default
+            if value is None or (isinstance(value, str) and not value.strip()):
+                continue
+
+            coerce, field = entry
+            try:
+                data[name] = coerce(value)
+            except (TypeError, ValueError):
+                errors[name] = f'{name}: cannot convert {value!r} to {field.type.__name__}'
+
+        messages = list(errors.values())
+        missing = [name for name in self._required if name not in data and name not in errors]
+        if missing:
+            messages.append(f'missing required field(s): {", ".join(missing)}')
+        if messages:
+            raise PayloadError('; '.join(messages))
+
+        return Payload(data)
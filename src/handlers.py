@@ -0,0 +1,495 @@
+# request handling shared by the WSGI (main.py) and ASGI (asgi.py) apps
+import json
+import threading
+import time
+from datetime import datetime
+
+from werkzeug.http import http_date, parse_etags, quote_etag
+
+from commons import VERSION_NUMBER, LOG_LIMIT, WEBHOOK_BATCH_LIMIT
+from components.actions.base.action import am, new_correlation_id
+from components.dispatch.bulkhead import bulkheads
+from components.dispatch.coalesce import coalescer
+from components.dispatch.dedupe import dedupe
+from components.dispatch.dispatcher import dispatcher, DispatchQueueFull
+from components.dispatch.rate_limit import rate_limiter
+from components.dispatch.wal import wal, WalError
+from components.events.base.event import em
+from components.journal.journal import journal, KINDS
+from components.logs.log_event import LogEvent
+from components.logs.log_hub import log_hub, LogStream, STREAM_POLL
+from components.logs.log_store import log_store, parse_cursor
+from components.metrics.metrics import metrics, stage_seconds, webhooks_total
+from components.schemas.payload import Payload, PayloadError, extract_text_key
+from components.schemas.trading import Order, Position
+from utils.log import get_logger
+from utils.register import register_action, register_event, register_link, build_action_graphs
+
+# register actions, events, links
+from settings import REGISTERED_ACTIONS, REGISTERED_EVENTS, REGISTERED_LINKS
+
+registered_actions = [register_action(action) for action in REGISTERED_ACTIONS]
+registered_events = [register_event(event) for event in REGISTERED_EVENTS]
+registered_links = [register_link(link, em, am) for link in REGISTERED_LINKS]
+build_action_graphs(em)
+
+# configure logging
+logger = get_logger(__name__)
+
+schema_list = {
+    'order': Order().as_json(),
+    'position': Position().as_json()
+}
+
+
+def gui_access(gui_key):
+    """
+    Checks the GUI key from the request against the key file
+    :param gui_key: guiKey query parameter
+    :return: bool
+    """
+    # check if gui key file exists
+    try:
+        with open('.gui_key', 'r') as key_file:
+            # check that the gui key from file matches the gui key from request
+            return key_file.read().strip() == gui_key
+
+    # if gui key file does not exist, the tvwb.py did not start gui in closed mode
+    except FileNotFoundError:
+        logger.warning('GUI key file not found. Open GUI mode detected.')
+        return True
+
+
+def dashboard_context():
+    """
+    Gets the variables used to render the dashboard template
+    :return: dict
+    """
+    return {
+        'schema_list': schema_list,
+        'action_list': am.get_all(),
+        'event_list': registered_events,
+        'version': VERSION_NUMBER,
+    }
+
+
+def route_item(item):
+    """
+    Routes a single webhook item to its event (by key), without decoding the rest of it
+    :param item: dict (JSON) or str (text/plain, k=v,k=v)
+    :return: Event()
+    :raises PayloadError: if the data is malformed
+    :raises ValueError: if the key does not match any event
+    """
+    with stage_seconds.time(stage='route'):
+        if isinstance(item, str):
+            return em.get_by_key(extract_text_key(item))
+        if not isinstance(item, dict):
+            raise PayloadError('Webhook data must be an object')
+        return em.get_by_key(item.get('key'))
+
+
+def decode_item(event, item):
+    """
+    Decodes a single webhook item with its event's declared fields
+    :param event: Event() from route_item()
+    :param item: dict (JSON) or str (text/plain, k=v,k=v)
+    :return: Payload()
+    :raises PayloadError: if the data is malformed
+    """
+    with stage_seconds.time(stage='decode'):
+        if isinstance(item, str):
+            return event.decoder.decode_text(item)
+        return event.decoder.decode(item)
+
+
+def process_item(item):
+    """
+    Decodes and triggers a single webhook item
+    :param item: dict (JSON) or str (text/plain)
+    :return: (status code, message, event name)
+    """
+    status, message, event_name = _trigger_item(item)
+    webhooks_total.inc(event=event_name or '', status=status)
+    return status, message, event_name
+
+
+def _trigger_item(item):
+    try:
+        event = route_item(item)
+
+        # admission control right after key lookup, a flooding alert is rejected before any decoding
+        rejected = rate_limiter.admit(event)
+        if rejected is not None:
+            scope, wait = rejected
+            logger.warning(f'Rate limit ({scope}) exceeded for {event.name}, retry in {wait:.3f}s')
+            journal.record_alert(new_correlation_id(), event.name, None, 429, f'Rate limit exceeded ({scope})')
+            return 429, f'Rate limit exceeded ({scope})', event.name
+
+        data = decode_item(event, item)
+    except PayloadError as e:
+        logger.warning(f'Malformed webhook data: {e}')
+        return 400, f'Malformed webhook data: {e}', None
+
+    # reject unknown keys before doing any further work
+    except ValueError as e:
+        logger.warning(e)
+        return 404, 'Unknown webhook key', None
+
+    logger.info(f'Request Data: {data}')
+    status, message = _accept(event, data)
+    return status, message, event.name
+
+
+def _accept(event, data, entry_id=None):
+    """
+    Triggers a decoded alert, once it is recorded in the write-ahead log, and journals it
+    :param event: Event()
+    :param data: Payload()
+    :param entry_id: write-ahead log id when replaying an alert, None for a new alert
+    :return: (status code, message)
+    """
+    correlation_id = entry_id or new_correlation_id()
+    status, message = _admit(event, data, correlation_id, entry_id)
+    # queued for the journal writer, no disk access here
+    journal.record_alert(correlation_id, event.name, data, status, message, replayed=entry_id is not None)
+    return status, message
+
+
+def _admit(event, data, correlation_id, entry_id=None):
+    replayed = entry_id is not None
+
+    # answer duplicate alerts (i.e. retries) without triggering the event again
+    alert_id = None
+    if dedupe.enabled:
+        alert_id = dedupe.alert_id(data)
+        duplicate = dedupe.claim(alert_id, (202, 'Accepted'))
+        if duplicate is not None:
+            logger.warning(f'Duplicate alert for {event.name}, not triggered again')
+            if replayed:
+                wal.complete(entry_id)
+            return duplicate[0], f'Duplicate alert: {duplicate[1]}'
+
+    # on disk before it is acknowledged, until its actions have run
+    if not replayed and wal.opened and event.active:
+        entry_id = correlation_id
+        try:
+            with stage_seconds.time(stage='wal'):
+                wal.append(entry_id, event.name, data)
+        except WalError as e:
+            logger.error(e)
+            if alert_id:
+                dedupe.release(alert_id)
+            return 503, 'Could not persist alert'
+
+    def done(*_):
+        # actions have run (or won't), the alert is not replayed anymore
+        if entry_id is not None:
+            wal.complete(entry_id)
+
+    # flapping signals are merged into one intent, triggered when the event's coalescing window closes
+    if event.coalesce_window and event.active:
+        merged = coalescer.add(event, data, on_done=done, correlation_id=correlation_id)
+        return 202, 'Accepted (coalesced)' if merged else 'Accepted'
+
+    try:
+        with stage_seconds.time(stage='enqueue'):
+            queued = event.trigger(data=data, correlation_id=correlation_id)
+    except DispatchQueueFull as e:
+        if alert_id:
+            dedupe.release(alert_id)
+        # a replayed alert stays in the log, to be queued again
+        if not replayed:
+            done()
+        return 503, str(e)
+
+    if queued is None:
+        if alert_id:
+            dedupe.release(alert_id)
+        done()
+        logger.warning(f'No events triggered for webhook request {data}')
+        return 200, 'Event is inactive'
+
+    queued.add_done_callback(done)
+    logger.info(f'Triggered events: {[event.name]}')
+
+    # actions run on the dispatcher, acknowledge as soon as they are queued
+    return 202, 'Accepted'
+
+
+def replay_wal(path=None):
+    """
+    Opens the write-ahead log, and triggers again the alerts accepted before a restart whose actions never ran.
+    Replayed alerts go through duplicate detection, but not rate limits.
+    :param path: log file, defaults to WAL_PATH
+    """
+    _replay(wal.open(path))
+
+
+def adopt_wal():
+    """
+    Triggers again the pending alerts of processes that are gone, i.e. once the previous worker generation has drained
+    """
+    _replay(wal.adopt())
+
+
+def _replay(records):
+    for record in records:
+        try:
+            event = em.get(record['ev'])
+        except ValueError as e:
+            logger.error(f'Not replaying alert {record["id"]}: {e}')
+            wal.complete(record['id'])
+            continue
+
+        data = Payload(record['d'])
+        while True:
+            status, message = _accept(event, data, entry_id=record['id'])
+            if status != 503:
+                break
+            # the dispatch queue is full of replayed alerts, wait for it to drain
+            time.sleep(0.1)
+        logger.info(f'REPLAYED --->\t{event.name} ({record["id"]}): {status} {message}')
+
+
+def drain(timeout):
+    """
+    Waits for the alerts accepted so far to run, then closes the write-ahead log and flushes the journal,
+    before the worker exits
+    :param timeout: seconds
+    :return: True if every alert ran, the others are replayed by the next worker
+    """
+    end_log_streams()
+    deadline = time.monotonic() + timeout
+    while any(coalescer.stats()[windows] for windows in ('open', 'retrying')) and time.monotonic() < deadline:
+        time.sleep(0.05)
+    drained = dispatcher.drain(max(0.0, deadline - time.monotonic()))
+    wal.close()
+    journal.flush(max(1.0, deadline - time.monotonic()))
+    return drained
+
+
+def warm_up():
+    """
+    Lets every registered action open its broker connections, before the worker serves requests
+    """
+    for action in am.get_all():
+        try:
+            action.warm_up()
+        except Exception as e:
+            logger.error(f'Warm up of {action.name} failed: {e}')
+
+
+def process_batch(items):
+    """
+    Triggers every item of a batch webhook, each item is queued as its own dispatcher job
+    :param items: list of dict (JSON) or str (text/plain)
+    :return: (status code, list of per item statuses)
+    """
+    results = []
+    for index, item in enumerate(items):
+        status, message, event_name = process_item(item)
+        results.append({'index': index, 'event': event_name, 'status': status, 'message': message})
+
+    # 207 (Multi-Status) if any item was not accepted
+    accepted = all(result['status'] == 202 for result in results)
+    return (202 if accepted else 207), results
+
+
+def handle_webhook(content_type, body: bytes):
+    """
+    Handles a webhook request
+    :param content_type: Content-Type header
+    :param body: raw request body
+    :return: (status code, str or list (JSON) response body, headers)
+    """
+    logger.info(f'/webhook Content-Type: {content_type}')
+
+    if content_type and content_type.startswith('text/plain'):
+        # one alert per line, several lines make a batch
+        with stage_seconds.time(stage='parse'):
+            lines = [line for line in body.decode('utf-8').splitlines() if line.strip()]
+        data = lines if len(lines) > 1 else (lines[0] if lines else '')
+
+    elif content_type and content_type.startswith('application/json'):
+        try:
+            with stage_seconds.time(stage='parse'):
+                data = json.loads(body)
+        except ValueError:
+            logger.error(f'Error getting JSON data from request...')
+            logger.error(f'Request data: {body}')
+            return 400, 'Error getting JSON data from request', {}
+
+    else:
+        return 415, f'Unsupported Content-Type: {content_type}', {}
+
+    if isinstance(data, list):
+        if len(data) > WEBHOOK_BATCH_LIMIT:
+            return 413, f'Batch exceeds {WEBHOOK_BATCH_LIMIT} items', {}
+        status, results = process_batch(data)
+        return status, results, {}
+
+    status, message, _ = process_item(data)
+    headers = {'Retry-After': '1'} if status in (429, 503) else {}
+    return status, message, headers
+
+
+def dispatch_stats():
+    """
+    Gets dispatcher, backend action pools, dedupe, admission control, write-ahead log, log stream and journal counters
+    :return: dict
+    """
+    return {
+        **dispatcher.stats(),
+        'actions': bulkheads.stats(),
+        'async_actions': dispatcher.loop.stats(),
+        'dedupe': dedupe.stats(),
+        'coalesce': coalescer.stats(),
+        'rate_limit': rate_limiter.stats(),
+        'wal': wal.stats(),
+        'log_stream': log_hub.stats(),
+        'journal': journal.stats(),
+    }
+
+
+def render_metrics():
+    """
+    Renders metrics in the Prometheus text format
+    :return: str
+    """
+    return metrics.render()
+
+
+def read_logs(since=None, limit=None, if_none_match=None):
+    """
+    Gets the latest logs, newest first, from the in-memory log (not the file).
+    Each log has a `cursor`, pass the newest one as `since` to only get the logs added after it.
+    :param since: cursor of the newest log the client already has
+    :param limit: maximum number of logs, at most (and by default) LOG_LIMIT
+    :param if_none_match: If-None-Match request header
+    :return: (status code, list of dict or str response body, headers)
+    """
+    try:
+        cursor = parse_cursor(since) if since else None
+        limit = min(int(limit), LOG_LIMIT) if limit else LOG_LIMIT
+        if limit < 1:
+            raise ValueError(limit)
+    except ValueError:
+        return 400, f'Invalid since ({since}) or limit ({limit})', {}
+
+    # the newest log identifies the content of the log, and so of the response for a given since and limit.
+    # it alone decides 304s: Last-Modified has 1s resolution, a log added in the same second would be missed
+    newest, modified = log_store.state()
+    headers = {
+        'ETag': quote_etag(newest or 'empty'),
+        'Last-Modified': http_date(modified),
+        'Cache-Control': 'no-cache',
+    }
+    if if_none_match and parse_etags(if_none_match).contains(newest or 'empty'):
+        return 304, '', headers
+
+    return 200, [_log_json(entry) for entry in log_store.newer(cursor, limit)], headers
+
+
+def query_journal(args):
+    """
+    Gets journal rows (alerts, action runs, broker calls), newest first
+    :param args: query parameters: kind, event, symbol, account, correlation_id, since and until (epoch or ISO 8601),
+        limit (default 100, at most 1000)
+    :return: (status code, list of dict or str response body)
+    """
+    try:
+        kind = args.get('kind')
+        if kind is not None and kind not in KINDS:
+            raise ValueError(f'kind must be one of {", ".join(KINDS)}')
+        since, until = _epoch(args.get('since')), _epoch(args.get('until'))
+        limit = min(int(args.get('limit') or 100), 1000)
+        if limit < 1:
+            raise ValueError('limit must be positive')
+    except ValueError as e:
+        return 400, f'Invalid journal query: {e}'
+    return 200, journal.query(kind, args.get('event'), args.get('symbol'), args.get('account'),
+                              args.get('correlation_id'), since, until, limit)
+
+
+def _epoch(value):
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+
+def _log_json(entry):
+    log = dict(LogEvent().from_line(entry.line).as_json(), cursor=entry.cursor)
+    log['event_time'] = http_date(log['event_time'])
+    return log
+
+
+def open_log_stream(last_event_id=None, wake=None):
+    """
+    Creates a live log stream (Server-Sent Events), the server calls start() then read() until it is closed
+    :param last_event_id: Last-Event-ID request header, cursor of the last log the client received
+    :param wake: called (from any thread) when logs are written or the stream must end
+    :return: LogStream, None if LOG_STREAM_CLIENTS streams are already open
+    """
+    if not log_hub.accepts():
+        return None
+    return LogStream(log_hub, _log_json, last_event_id, wake)
+
+
+def stream_logs(last_event_id=None):
+    """
+    Live log stream for a WSGI server, each stream holds a server thread while open
+    :param last_event_id: Last-Event-ID request header
+    :return: iterator of str, None if LOG_STREAM_CLIENTS streams are already open
+    """
+    wake = threading.Event()
+    stream = open_log_stream(last_event_id, wake.set)
+    if stream is None:
+        return None
+
+    def events():
+        # subscribes once iterated: a response closed before being sent holds no subscription
+        try:
+            yield stream.start()
+            while stream.open:
+                wake.wait(STREAM_POLL)
+                wake.clear()
+                chunk = stream.read()
+                if chunk:
+                    yield chunk
+        finally:
+            stream.close()
+
+    return events()
+
+
+def end_log_streams():
+    """
+    Ends the live log streams and refuses new ones, before the worker drains (clients reconnect to another worker)
+    """
+    log_hub.close()
+
+
+def set_event_active(event_name, active):
+    """
+    Activates or deactivates an event
+    :param event_name: name of event
+    :param active: 'true' to activate, anything else deactivates
+    :return: (status code, str or dict response body)
+    """
+    # if event name is not provided, or cannot be found, 404
+    if event_name is None:
+        return 404, f'Event name cannot be empty ({event_name})'
+
+    try:
+        event = em.get(event_name)
+    except ValueError:
+        return 404, f'Cannot find event with name: {event_name}'
+
+    # set event to active or inactive, depending on current state
+    event.active = active == 'true'
+    logger.info(f'Event {event.name} active set to: {event.active}, via POST request')
+    return 200, {'active': event.active}
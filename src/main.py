@@ -1,129 +1,88 @@
 # initialize our Flask application
-from logging import getLogger, DEBUG
-
 from flask import Flask, request, jsonify, render_template, Response
 
-from commons import VERSION_NUMBER, LOG_LOCATION
-from components.actions.base.action import am
-from components.events.base.event import em
-from components.logs.log_event import LogEvent
-from components.schemas.trading import Order, Position
+import handlers
+from components.metrics.metrics import stage_seconds
 from utils.log import get_logger
-from utils.register import register_action, register_event, register_link
-
-# register actions, events, links
-from settings import REGISTERED_ACTIONS, REGISTERED_EVENTS, REGISTERED_LINKS
-
-registered_actions = [register_action(action) for action in REGISTERED_ACTIONS]
-registered_events = [register_event(event) for event in REGISTERED_EVENTS]
-registered_links = [register_link(link, em, am) for link in REGISTERED_LINKS]
 
 app = Flask(__name__)
 
 # configure logging
 logger = get_logger(__name__)
 
-schema_list = {
-    'order': Order().as_json(),
-    'position': Position().as_json()
-}
-
 
 @app.route("/", methods=["GET"])
 def dashboard():
     if request.method == 'GET':
-
-        # check if gui key file exists
-        try:
-            with open('.gui_key', 'r') as key_file:
-                gui_key = key_file.read().strip()
-                # check that the gui key from file matches the gui key from request
-                if gui_key == request.args.get('guiKey', None):
-                    pass
-                else:
-                    return 'Access Denied', 401
-
-        # if gui key file does not exist, the tvwb.py did not start gui in closed mode
-        except FileNotFoundError:
-            logger.warning('GUI key file not found. Open GUI mode detected.')
+        if not handlers.gui_access(request.args.get('guiKey', None)):
+            return 'Access Denied', 401
 
         # serve the dashboard
-        action_list = am.get_all()
-        return render_template(
-            template_name_or_list='dashboard.html',
-            schema_list=schema_list,
-            action_list=action_list,
-            event_list=registered_events,
-            version=VERSION_NUMBER
-        )
+        return render_template(template_name_or_list='dashboard.html', **handlers.dashboard_context())
 
 
 @app.route("/webhook", methods=["POST"])
-async def webhook():
+def webhook():
     if request.method == 'POST':
-        content_type = request.headers.get('Content-Type')
-        logger.info(f'/webhook Content-Type: {content_type}')
-
-        if content_type and content_type.startswith('text/plain'):
-            raw_data = request.data.decode('utf-8')
-            data = {}
-            for item in raw_data.split(','):
-                if '=' not in item:
-                    continue
-                key, value = item.split('=', 1)
-                data[key] = value
-
-        elif content_type == 'application/json':
-            data = request.get_json()
-            if data is None:
-                logger.error(f'Error getting JSON data from request...')
-                logger.error(f'Request data: {request.data}')
-                logger.error(f'Request headers: {request.headers}')
-                return 'Error getting JSON data from request', 400
-
-        logger.info(f'Request Data: {data}')
-        triggered_events = []
-        for event in em.get_all():
-            if event.webhook:
-                if event.key == data['key']:
-                    event.trigger(data=data)
-                    triggered_events.append(event.name)
-
-        if not triggered_events:
-            logger.warning(f'No events triggered for webhook request {request.get_json()}')
-        else:
-            logger.info(f'Triggered events: {triggered_events}')
-
-    return Response(status=200)
+        with stage_seconds.time(stage='read'):
+            data = request.get_data()
+        status, body, headers = handlers.handle_webhook(request.headers.get('Content-Type'), data)
+        if isinstance(body, list):
+            return jsonify(body), status, headers
+        return Response(body, status=status, headers=headers)
+
+
+@app.route("/dispatch/stats", methods=["GET"])
+def dispatch_stats():
+    if request.method == 'GET':
+        return jsonify(handlers.dispatch_stats())
+
+
+@app.route("/metrics", methods=["GET"])
+def get_metrics():
+    if request.method == 'GET':
+        return Response(handlers.render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
 
 
 @app.route("/logs", methods=["GET"])
 def get_logs():
     if request.method == 'GET':
-        log_file = open(LOG_LOCATION, 'r')
-        logs = [LogEvent().from_line(log) for log in log_file.readlines()]
-        return jsonify([log.as_json() for log in logs])
+        status, body, headers = handlers.read_logs(
+            request.args.get('since'), request.args.get('limit'), request.headers.get('If-None-Match'))
+        if isinstance(body, list):
+            return jsonify(body), status, headers
+        return Response(body, status=status, headers=headers)
+
+
+@app.route("/logs/stream", methods=["GET"])
+def stream_logs():
+    if request.method == 'GET':
+        events = handlers.stream_logs(request.headers.get('Last-Event-ID'))
+        if events is None:
+            # EventSource does not reconnect on 204, the dashboard falls back to polling /logs
+            return Response(status=204)
+        return Response(events, content_type='text/event-stream', headers={'Cache-Control': 'no-cache'})
+
+
+@app.route("/journal", methods=["GET"])
+def query_journal():
+    if request.method == 'GET':
+        # alert payloads and broker responses, behind the GUI key
+        if not handlers.gui_access(request.args.get('guiKey', None)):
+            return 'Access Denied', 401
+        status, body = handlers.query_journal(request.args)
+        if isinstance(body, list):
+            return jsonify(body), status
+        return Response(body, status=status)
 
 
 @app.route("/event/active", methods=["POST"])
 def activate_event():
     if request.method == 'POST':
-        # get query parameters
-        event_name = request.args.get('event', None)
-
-        # if event name is not provided, or cannot be found, 404
-        if event_name is None:
-            return Response(f'Event name cannot be empty ({event_name})', status=404)
-
-        try:
-            event = em.get(event_name)
-        except ValueError:
-            return Response(f'Cannot find event with name: {event_name}', status=404)
-
-        # set event to active or inactive, depending on current state
-        event.active = request.args.get('active', True) == 'true'
-        logger.info(f'Event {event.name} active set to: {event.active}, via POST request')
-        return {'active': event.active}
+        status, body = handlers.set_event_active(request.args.get('event', None), request.args.get('active', None))
+        if isinstance(body, dict):
+            return body, status
+        return Response(body, status=status)
 
 
 if __name__ == '__main__':
@@ -40,11 +40,11 @@ REGISTERED_LINKS = [
     # MT5 Links
     ("MtAccountBalance", "WebhookReceivedMtBalance"),
     ("MtFlatten", "WebhookReceivedMtOrder"), # flatten avant
-    ("MtPlaceOrder", "WebhookReceivedMtOrder"), # place les ordres apres
+    ("MtPlaceOrder", "WebhookReceivedMtOrder", ("MtFlatten",)), # place les ordres apres
     ("MtFlatten", "WebhookReceivedMtFlatten"),
     # NinjaTrader Links
     ("NtFlatten", "WebhookReceivedNtOrder"), # flatten avant
-    ("NtPlaceOrder", "WebhookReceivedNtOrder"), # place les ordres apres
+    ("NtPlaceOrder", "WebhookReceivedNtOrder", ("NtFlatten",)), # place les ordres apres
     ("NtFlatten", "WebhookReceivedNtFlatten"),
     ("NtPositionInfo", "WebhookReceivedNtPositionInfo"),
     ("NtOrderInfo", "WebhookReceivedNtOrderInfo"),
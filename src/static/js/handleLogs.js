@@ -1,11 +1,42 @@
 $(document).ready(function () {
+    const MAX_LOGS = 30;
+    let cursor = null;
+
+    function addLogs(logData) {
+        // logData newest first, only new logs are added, the oldest are removed past MAX_LOGS
+        const logContainer = document.getElementById('logContainer');
+        logData.slice(0, MAX_LOGS).reverse().forEach(log => {
+            logContainer.insertAdjacentHTML('afterbegin', `
+            <div class="d-flex justify-content-between w-100">
+                <div class="d-flex gap-2">
+                    <div class="">${new Date(log.event_time).toLocaleString()}</div>
+                    <div class="d-flex flex-row">
+                        <div class="fw-bolder mb-2 me-2 text-primary">${log.parent}
+                        </div>
+                        <div>${log.event_data}</div>
+                    </div>
+                </div>
+            </div>
+        `);
+        });
+        while (logContainer.children.length > MAX_LOGS) {
+            logContainer.removeChild(logContainer.lastElementChild);
+        }
+        if (logData.length) {
+            cursor = logData[0].cursor;
+        }
+    }
+
     function getLogData() {
+        // only the logs added since the newest one shown, an unchanged log is answered with a 304
         $.ajax({
             url: '/logs',
             type: 'GET',
+            data: cursor ? {since: cursor, limit: MAX_LOGS} : {limit: MAX_LOGS},
             success: function (data) {
-                data.reverse()
-                createLogs(data.splice(0, 30));
+                if (data && data.length) {
+                    addLogs(data);
+                }
             },
             error: function (error) {
                 console.log(error)
@@ -14,28 +45,28 @@ $(document).ready(function () {
         })
     }
 
-    function createLogs(logData) {
-        const logContainer = document.getElementById('logContainer');
-        logContainer.innerHTML = '';
-        logData.forEach(log => {
-            logContainer.innerHTML += `
-            <div class="d-flex justify-content-between w-100">
-                <div class="d-flex gap-2">
-                    <div class="">${new Date(log.event_time).toLocaleString()}</div>
-                    <div class="d-flex flex-row">
-                        <div class="fw-bolder mb-2 me-2 text-primary">${log.parent}                    
-                        </div>
-                        <div>${log.event_data}</div>
-                    </div>
-                </div>
-            </div>
-        `;
-        });
+    function pollLogs() {
+        getLogData();
+        setInterval(function () {
+            getLogData()
+        }, 10000);
+    }
+
+    if (!window.EventSource) {
+        pollLogs();
+        return;
     }
 
-    getLogData();
-    
-    setInterval(function () {
-        getLogData()
-    }, 10000);
-});
\ No newline at end of file
+    // logs are pushed as they are written, the browser reconnects (sending the last cursor) if the stream ends
+    const source = new EventSource('/logs/stream');
+    source.addEventListener('log', function (event) {
+        addLogs([JSON.parse(event.data)]);
+    });
+    source.onerror = function () {
+        if (source.readyState === EventSource.CLOSED) {
+            // refused (too many streams open), poll instead
+            source.close();
+            pollLogs();
+        }
+    };
+});
@@ -0,0 +1,87 @@
+import asyncio
+import json
+
+import pytest
+
+import asgi
+import handlers
+
+
+def _call(method, path, body=b'', headers=(), query=b''):
+    # runs one request through the ASGI app, returns (status, headers, body)
+    messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+    sent = []
+
+    async def receive():
+        return messages.pop(0) if messages else {'type': 'http.disconnect'}
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {'type': 'http', 'method': method, 'path': path, 'query_string': query, 'headers': list(headers)}
+    asyncio.run(asgi.app(scope, receive, send))
+    start = sent[0]
+    return start['status'], dict(start['headers']), b''.join(message.get('body', b'') for message in sent[1:])
+
+
+@pytest.fixture
+def accepted(monkeypatch):
+    alerts = []
+
+    def accept(event, data, entry_id=None):
+        alerts.append(data)
+        return 202, 'Accepted'
+
+    monkeypatch.setattr(handlers, '_accept', accept)
+    return alerts
+
+
+def test_webhook_is_answered_by_the_shared_handlers(accepted):
+    key = handlers.em.get('WebhookReceivedNtOrder').key
+    body = json.dumps({'key': key, 'symbol': 'ES', 'order_type': 'buy'}).encode()
+    status, _, response = _call('POST', '/webhook', body, [(b'content-type', b'application/json')])
+    assert (status, response) == (202, b'Accepted')
+    assert accepted[0]['symbol'] == 'ES'
+
+
+def test_batch_answer_is_json(accepted):
+    key = handlers.em.get('WebhookReceivedNtOrder').key
+    body = json.dumps([{'key': key, 'symbol': 'ES', 'order_type': 'buy'}, {'key': 'Unknown:abc'}]).encode()
+    status, headers, response = _call('POST', '/webhook', body, [(b'content-type', b'application/json')])
+    assert status == 207 and headers[b'content-type'] == b'application/json'
+    assert [result['status'] for result in json.loads(response)] == [202, 404]
+
+
+def test_unknown_route_and_method():
+    assert _call('GET', '/nowhere')[0] == 404
+    status, headers, _ = _call('GET', '/webhook')
+    assert status == 405 and headers[b'allow'] == b'POST'
+
+
+def test_stats_and_metrics():
+    status, _, response = _call('GET', '/dispatch/stats')
+    assert status == 200 and 'lanes' in json.loads(response)
+    status, headers, _ = _call('GET', '/metrics')
+    assert status == 200 and headers[b'content-type'].startswith(b'text/plain; version=0.0.4')
+
+
+def test_static_files_stay_in_the_static_directory():
+    assert _call('GET', '/static/../asgi.py')[0] == 404
+
+
+def test_lifespan_replays_then_drains(monkeypatch):
+    calls = []
+    monkeypatch.setattr(handlers, 'replay_wal', lambda: calls.append('replay'))
+    monkeypatch.setattr(handlers, 'drain', lambda timeout: calls.append(('drain', timeout)) or True)
+    messages = [{'type': 'lifespan.startup'}, {'type': 'lifespan.shutdown'}]
+    sent = []
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message['type'])
+
+    asyncio.run(asgi.app({'type': 'lifespan'}, receive, send))
+    assert calls == ['replay', ('drain', asgi.DRAIN_TIMEOUT)]
+    assert sent == ['lifespan.startup.complete', 'lifespan.shutdown.complete']
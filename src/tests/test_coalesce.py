@@ -0,0 +1,127 @@
+import time
+from concurrent.futures import Future
+
+import pytest
+
+import handlers
+from components.dispatch import coalesce
+from components.dispatch.coalesce import Coalescer
+from components.dispatch.dispatcher import DispatchQueueFull
+from components.events.base.event import Event
+from components.schemas.payload import Payload, PayloadError
+
+
+class _Event:
+    name = 'TestCoalesced'
+    coalesce_window = 0.05
+    coalesce_mode = 'sum'
+    coalesce_quantity = 'volume'
+
+    def __init__(self, full=0):
+        self.full = full  # trigger attempts refused as if the lane was full
+        self.triggered = []
+
+    def trigger(self, data=None, correlation_id=None):
+        if self.full:
+            self.full -= 1
+            raise DispatchQueueFull('Dispatch queue is full')
+        self.triggered.append((data, correlation_id))
+        future = Future()
+        future.set_result(None)
+        return future
+
+
+def _wait(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_alerts_net_into_one_intent():
+    coalescer, event, done = Coalescer(), _Event(), []
+    assert coalescer.add(event, Payload({'symbol': 'EURUSD', 'order_type': 'buy', 'volume': 0.3}),
+                         on_done=lambda: done.append(1), correlation_id='first') is False
+    assert coalescer.add(event, Payload({'symbol': 'EURUSD', 'order_type': 'sell', 'volume': 0.1}),
+                         on_done=lambda: done.append(2), correlation_id='second') is True
+
+    assert _wait(lambda: len(done) == 2)
+    [(data, correlation_id)] = event.triggered
+    assert (data['order_type'], data['volume'], correlation_id) == ('buy', 0.2, 'first')
+
+
+def test_opposite_alerts_cancel_out():
+    coalescer, event, done = Coalescer(), _Event(), []
+    for order_type in ('buy', 'sell'):
+        coalescer.add(event, Payload({'symbol': 'EURUSD', 'order_type': order_type, 'volume': 0.1}),
+                      on_done=lambda: done.append(1))
+    assert _wait(lambda: len(done) == 2)
+    assert event.triggered == []
+    assert coalescer.stats()['cancelled'] == 1
+
+
+def test_full_lane_is_retried(monkeypatch):
+    monkeypatch.setattr(coalesce, 'TRIGGER_RETRY', 0.01)
+    coalescer, event, done = Coalescer(), _Event(full=2), []
+    coalescer.add(event, Payload({'symbol': 'EURUSD', 'order_type': 'buy', 'volume': 0.1}),
+                  on_done=lambda: done.append(1), correlation_id='first')
+
+    assert _wait(lambda: done)
+    assert [correlation_id for _, correlation_id in event.triggered] == ['first']
+    assert coalescer.stats()['retrying'] == 0
+
+
+def test_alerts_not_completed_when_never_queued(monkeypatch):
+    # left pending in the write-ahead log, to be replayed
+    monkeypatch.setattr(coalesce, 'TRIGGER_RETRY', 0.01)
+    coalescer, event, done = Coalescer(), _Event(full=coalesce.TRIGGER_ATTEMPTS), []
+    coalescer.add(event, Payload({'symbol': 'EURUSD', 'order_type': 'buy', 'volume': 0.1}),
+                  on_done=lambda: done.append(1))
+
+    assert _wait(lambda: coalescer.stats()['failed'] == 1)
+    assert done == []
+    assert event.triggered == []
+
+
+def test_latest_mode_does_not_net_raw_quantities():
+    coalescer, event, done = Coalescer(), _Event(), []
+    event.coalesce_mode = 'latest'
+    for order_type, volume in (('buy', '1'), ('sell', '2')):
+        coalescer.add(event, Payload({'symbol': 'EURUSD', 'order_type': order_type, 'volume': volume}),
+                      on_done=lambda: done.append(1))
+    assert _wait(lambda: len(done) == 2)
+    [(data, _)] = event.triggered
+    assert (data['order_type'], data['volume']) == ('sell', '2')
+
+
+def test_unusable_quantity_lets_the_latest_alert_win():
+    coalescer, event, done = Coalescer(), _Event(), []
+    for order_type, volume in (('buy', 0.1), ('sell', 'lots')):
+        coalescer.add(event, Payload({'symbol': 'EURUSD', 'order_type': order_type, 'volume': volume}),
+                      on_done=lambda: done.append(1))
+    assert _wait(lambda: len(done) == 2)
+    assert event.triggered[0][0]['order_type'] == 'sell'
+
+
+class _DeltaEvent(Event):
+    coalesce_window = 0.05
+    coalesce_mode = 'sum'
+
+
+class _TargetEvent(_DeltaEvent):
+    position_target = True
+
+
+def test_summed_quantity_is_decoded_as_a_number():
+    decoder = _DeltaEvent().decoder
+    assert decoder.decode({'key': 'Delta:abc', 'quantity': '2'})['quantity'] == 2.0
+    with pytest.raises(PayloadError):
+        decoder.decode({'key': 'Delta:abc', 'quantity': 'two'})
+
+
+def test_position_targets_cannot_be_summed():
+    with pytest.raises(ValueError, match='position targets'):
+        _TargetEvent().register()
+    # flatten then order: netting a buy and a sell to nothing would leave the buy's position open
+    assert handlers.em.get('WebhookReceivedMtOrder').position_target
+    assert handlers.em.get('WebhookReceivedNtOrder').position_target
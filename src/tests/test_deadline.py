@@ -0,0 +1,88 @@
+import threading
+import time
+
+import pytest
+
+from components.dispatch.deadline import ActionPoolFull, ActionTimeout, CancelToken, DeadlinePool
+
+
+def test_job_result():
+    pool = DeadlinePool(workers=2, max_abandoned=2)
+    assert pool.submit(lambda a, b: a + b, 1, b=2, timeout=1).result(timeout=1) == 3
+    assert pool.stats()['timeouts'] == 0
+
+
+def test_job_error():
+    pool = DeadlinePool(workers=1, max_abandoned=1)
+
+    def fail():
+        raise ValueError('broker refused')
+
+    with pytest.raises(ValueError):
+        pool.submit(fail, timeout=1).result(timeout=1)
+
+
+def test_hung_job_abandoned_after_finished_job():
+    # the deadline of a finished job expiring alone used to kill the watcher thread
+    pool = DeadlinePool(workers=1, max_abandoned=1)
+    pool.submit(lambda: None, timeout=0.05).result(timeout=1)
+    time.sleep(0.15)
+
+    release, cancelled = threading.Event(), CancelToken()
+    hung = pool.submit(release.wait, 5, timeout=0.1, on_timeout=cancelled.cancel)
+    try:
+        with pytest.raises(ActionTimeout):
+            hung.result(timeout=2)
+        assert cancelled.cancelled
+        assert pool.stats()['abandoned'] == 1
+
+        # the hung thread is replaced, the pool still runs jobs
+        assert pool.submit(lambda: 'ok', timeout=1).result(timeout=1) == 'ok'
+    finally:
+        release.set()
+
+
+def test_saturated_pool_rejects():
+    pool = DeadlinePool(workers=1, max_abandoned=0, queue_size=1)
+    release = threading.Event()
+    try:
+        pool.submit(release.wait, 5)
+        with pytest.raises(ActionPoolFull):
+            pool.submit(release.wait, 5)
+        assert pool.stats()['rejected'] == 1
+    finally:
+        release.set()
+
+
+def test_burst_runs_on_as_many_threads_as_jobs():
+    # a thread left idle by an earlier job used to stop the pool from growing for the whole burst
+    pool = DeadlinePool(workers=4, max_abandoned=0)
+    pool.submit(lambda: None).result(timeout=1)
+    time.sleep(0.05)
+
+    started = time.monotonic()
+    futures = [pool.submit(time.sleep, 0.3) for _ in range(4)]
+    for future in futures:
+        future.result(timeout=2)
+    assert time.monotonic() - started < 0.6
+    assert pool.stats()['threads'] == 4
+
+
+def test_queue_keeps_room_for_critical_jobs():
+    pool = DeadlinePool(workers=1, max_abandoned=0, queue_size=4)
+    release = threading.Event()
+    try:
+        pool.submit(release.wait, 5)
+        while pool.stats()['queued']:
+            time.sleep(0.01)
+        low = [pool.submit(lambda: 'low', priority='low') for _ in range(2)]
+        with pytest.raises(ActionPoolFull):
+            pool.submit(lambda: 'low', priority='low')
+        critical = pool.submit(lambda: 'critical', priority='critical')
+        # the next action of an alert already running is queued past the limit
+        low.append(pool.submit(lambda: 'low', priority='low', admission='always'))
+        assert pool.stats()['queued'] == 4
+    finally:
+        release.set()
+    assert critical.result(timeout=1) == 'critical'
+    assert [future.result(timeout=1) for future in low] == ['low'] * 3
@@ -0,0 +1,61 @@
+import multiprocessing
+import os
+import time
+
+import pytest
+
+from components.dispatch.dedupe import DedupeCache, SharedDedupeTable
+from components.schemas.payload import Payload
+
+
+def test_duplicate_is_answered_from_the_cache():
+    cache = DedupeCache(window=5, max_entries=10)
+    alert_id = cache.alert_id(Payload({'key': 'Event:abc', 'symbol': 'ES'}))
+    assert cache.claim(alert_id, (202, 'Accepted')) is None
+    assert cache.claim(alert_id, (202, 'Accepted')) == (202, 'Accepted')
+    assert cache.stats()['hits'] == 1
+
+
+def test_alert_ids_tell_identical_payloads_apart():
+    cache = DedupeCache(window=5, max_entries=10)
+    first = cache.alert_id(Payload({'key': 'Event:abc', 'symbol': 'ES', 'alert_id': '1'}))
+    second = cache.alert_id(Payload({'key': 'Event:abc', 'symbol': 'ES', 'alert_id': '2'}))
+    assert cache.claim(first, (202, 'Accepted')) is None
+    assert cache.claim(second, (202, 'Accepted')) is None
+
+
+def test_disabled_by_default():
+    assert not DedupeCache().enabled
+
+
+def test_shared_table_claim_release_and_expiry():
+    table = SharedDedupeTable(window=0.05, max_entries=10)
+    assert table.claim('a', (202, 'Accepted')) is None
+    assert table.claim('a', (202, 'Accepted')) == (202, 'Accepted')
+
+    table.release('a')
+    assert table.claim('a', (202, 'Accepted')) is None
+
+    time.sleep(0.1)
+    assert table.claim('a', (202, 'Accepted')) is None
+    assert table.stats()['hits'] == 1
+
+
+def test_shared_table_evicts_when_every_probed_slot_is_live():
+    table = SharedDedupeTable(window=60, max_entries=1)
+    for n in range(table.slots + 1):
+        assert table.claim(f'alert{n}', (202, 'Accepted')) is None
+    assert table.stats()['evictions'] >= 1
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='forked workers only')
+def test_shared_table_catches_duplicates_across_processes():
+    table = SharedDedupeTable(window=60, max_entries=10)
+    assert table.claim('a', (202, 'Accepted')) is None
+
+    context = multiprocessing.get_context('fork')
+    results = context.Queue()
+    worker = context.Process(target=lambda: results.put(table.claim('a', (202, 'Accepted'))))
+    worker.start()
+    worker.join(5)
+    assert results.get(timeout=1) == (202, 'Accepted')
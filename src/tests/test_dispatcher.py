@@ -0,0 +1,186 @@
+import multiprocessing
+import os
+import threading
+import time
+
+import pytest
+
+from components.dispatch.bulkhead import Bulkheads
+from components.dispatch.deadline import ActionTimeout
+from components.dispatch.dispatcher import Dispatcher, DispatchQueueFull, SharedShardTable
+from components.events.base.graph import ActionGraph
+
+
+def _graph_job(bulkheads, backend, fn, timeout=None, priority='normal'):
+    # what Event.run_actions does for a single action, from a lane worker
+    return ActionGraph({'action': ()}).run(
+        lambda name: bulkheads.submit(backend, fn, timeout=timeout, priority=priority, admission='wait'))
+
+
+def test_slow_backend_does_not_delay_another():
+    bulkheads = Bulkheads(default=(1, 0), backends={'mt5': (1, 0), 'nt': (1, 0)}, backend_default=(1, 0))
+    lane = Dispatcher(workers=1, queue_size=10, lane='test-bulkhead')
+    release = threading.Event()
+    try:
+        slow = [lane.submit(_graph_job, bulkheads, 'mt5', lambda: release.wait(5), shard=('mt5', '', symbol))
+                for symbol in ('EURUSD', 'GBPUSD')]
+        started = time.monotonic()
+        fast = lane.submit(_graph_job, bulkheads, 'nt', lambda: 'filled', shard=('nt', '', 'ES'))
+        fast.result(timeout=2)
+        assert time.monotonic() - started < 1
+        assert not any(future.done() for future in slow)
+    finally:
+        release.set()
+    for future in slow:
+        future.result(timeout=2)
+    assert lane.stats()['completed'] == 3
+
+
+def test_shard_runs_in_arrival_order_until_its_actions_are_done():
+    bulkheads = Bulkheads(default=(4, 0), backends={}, backend_default=(4, 0))
+    lane = Dispatcher(workers=1, queue_size=10, lane='test-shard')
+    ran = []
+
+    def action(number):
+        time.sleep(0.05 if number == 0 else 0)
+        ran.append(number)
+
+    futures = [lane.submit(_graph_job, bulkheads, 'nt', lambda n=n: action(n), shard=('nt', '', 'ES'))
+               for n in range(3)]
+    for future in futures:
+        future.result(timeout=2)
+    assert ran == [0, 1, 2]
+
+
+def test_shards_run_in_parallel_with_default_workers():
+    lane = Dispatcher(lane='test-parallel')
+    assert lane.workers > 1
+    both = threading.Barrier(2, timeout=2)
+    futures = [lane.submit(both.wait, shard=('mt5', '', symbol)) for symbol in ('EURUSD', 'GBPUSD')]
+    for future in futures:
+        future.result(timeout=3)
+
+
+def test_full_lane_rejects():
+    lane = Dispatcher(workers=1, queue_size=1, lane='test-full')
+    release = threading.Event()
+    try:
+        running = lane.submit(release.wait, 5)
+        while not lane.stats()['started']:
+            time.sleep(0.01)
+        lane.submit(release.wait, 5)
+        with pytest.raises(DispatchQueueFull):
+            lane.submit(release.wait, 5)
+    finally:
+        release.set()
+    running.result(timeout=2)
+    assert lane.stats()['rejected'] == 1
+
+
+def test_failed_job_releases_its_shard():
+    lane = Dispatcher(workers=1, queue_size=10, lane='test-failed')
+
+    def fail():
+        raise RuntimeError('broker refused')
+
+    failed = lane.submit(fail, shard=('nt', '', 'ES'))
+    after = lane.submit(lambda: 'ran', shard=('nt', '', 'ES'))
+    with pytest.raises(RuntimeError):
+        failed.result(timeout=2)
+    assert after.result(timeout=2) == 'ran'
+    assert lane.stats()['failed'] == 1
+
+
+def test_shard_is_held_until_an_abandoned_action_returns():
+    bulkheads = Bulkheads(default=(4, 0), backends={}, backend_default=(4, 0))
+    lane = Dispatcher(workers=2, queue_size=10, lane='test-abandoned')
+    release, ran = threading.Event(), []
+    try:
+        hung = lane.submit(_graph_job, bulkheads, 'nt', lambda: release.wait(5), timeout=0.1, shard=('nt', '', 'ES'))
+        after = lane.submit(_graph_job, bulkheads, 'nt', lambda: ran.append('after'), shard=('nt', '', 'ES'))
+        other = lane.submit(_graph_job, bulkheads, 'nt', lambda: ran.append('other'), shard=('nt', '', 'NQ'))
+        other.result(timeout=2)
+        time.sleep(0.3)
+        # past its deadline, but the broker call still runs: the next alert of its shard waits
+        assert bulkheads.pool('nt').stats()['abandoned'] == 1
+        assert ran == ['other'] and not hung.done()
+    finally:
+        release.set()
+    with pytest.raises(ActionTimeout):
+        hung.result(timeout=2)
+    after.result(timeout=2)
+    assert ran == ['other', 'after']
+
+
+def test_low_lane_flood_does_not_hold_back_a_critical_action():
+    bulkheads = Bulkheads(default=(1, 0), backends={'nt': (1, 4)}, backend_default=(1, 0))
+    low = Dispatcher(workers=2, queue_size=100, lane='test-low')
+    critical = Dispatcher(workers=1, queue_size=10, lane='test-critical')
+    release, ran = threading.Event(), []
+    try:
+        hung = low.submit(_graph_job, bulkheads, 'nt', lambda: release.wait(5), priority='low')
+        flood = [low.submit(_graph_job, bulkheads, 'nt', lambda: ran.append('low'), priority='low')
+                 for _ in range(20)]
+        # low actions fill their half of the backend's queue, then the low lane's workers wait for room
+        while bulkheads.pool('nt').stats()['waiting'] < 2:
+            time.sleep(0.01)
+        assert bulkheads.pool('nt').stats()['queued'] == 2
+
+        flatten = critical.submit(_graph_job, bulkheads, 'nt', lambda: ran.append('critical'), priority='critical')
+        while bulkheads.pool('nt').stats()['queued'] < 3:
+            time.sleep(0.01)
+    finally:
+        release.set()
+    flatten.result(timeout=2)
+    for future in [hung] + flood:
+        future.result(timeout=5)
+    # picked up ahead of the low actions queued before it, and none of them was dropped
+    assert ran == ['critical'] + ['low'] * 20
+    assert bulkheads.pool('nt').stats()['rejected'] == 0
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='forked workers only')
+def test_shard_running_in_another_worker_only_holds_back_that_shard():
+    table = SharedShardTable()
+    context = multiprocessing.get_context('fork')
+    claimed, release = context.Event(), context.Event()
+
+    def worker():
+        shard_hash = table.claim(('nt', '', 'ES'))
+        claimed.set()
+        release.wait(5)
+        table.release(shard_hash)
+
+    process = context.Process(target=worker)
+    process.start()
+    try:
+        assert claimed.wait(5)
+        # every other shard is claimed right away, however many there are
+        started = time.monotonic()
+        for n in range(1000):
+            table.release(table.claim(('nt', '', f'SYMBOL{n}')))
+        assert time.monotonic() - started < 1
+
+        waiting = threading.Thread(target=lambda: table.release(table.claim(('nt', '', 'ES'))))
+        waiting.start()
+        waiting.join(0.2)
+        assert waiting.is_alive()
+        release.set()
+        waiting.join(2)
+        assert not waiting.is_alive()
+    finally:
+        release.set()
+        process.join(5)
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='forked workers only')
+def test_shard_of_a_dead_worker_is_taken_over():
+    table = SharedShardTable()
+    process = multiprocessing.get_context('fork').Process(target=lambda: table.claim(('nt', '', 'ES')))
+    process.start()
+    process.join(5)
+    assert process.exitcode == 0
+
+    started = time.monotonic()
+    table.release(table.claim(('nt', '', 'ES')))
+    assert time.monotonic() - started < 1
@@ -0,0 +1,69 @@
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import pytest
+
+from components.events.base.graph import ActionGraph
+
+
+def _runner(fail=(), ran=None):
+    pool = ThreadPoolExecutor(4)
+    ran = [] if ran is None else ran
+    lock = threading.Lock()
+
+    def run(name):
+        with lock:
+            ran.append(name)
+        if name in fail:
+            raise RuntimeError(f'{name} failed')
+
+    return lambda name: pool.submit(run, name), ran
+
+
+def test_actions_run_after_their_dependencies():
+    graph = ActionGraph({'flatten': (), 'order': ('flatten',), 'notify': ('order', 'flatten'), 'log': ()})
+    start_action, ran = _runner()
+    assert graph.run(start_action).result(timeout=2) is None
+    assert sorted(ran) == ['flatten', 'log', 'notify', 'order']
+    assert ran.index('flatten') < ran.index('order') < ran.index('notify')
+
+
+def test_failed_action_skips_the_actions_after_it():
+    graph = ActionGraph({'flatten': (), 'order': ('flatten',), 'notify': ('order',), 'log': ()})
+    start_action, ran = _runner(fail={'flatten'})
+    with pytest.raises(RuntimeError, match='flatten failed'):
+        graph.run(start_action).result(timeout=2)
+    assert sorted(ran) == ['flatten', 'log']
+
+
+def test_action_that_cannot_start_fails_the_graph():
+    def start_action(name):
+        if name == 'order':
+            raise RuntimeError('pool is saturated')
+        future = Future()
+        future.set_result(None)
+        return future
+
+    graph = ActionGraph({'flatten': (), 'order': ('flatten',)})
+    with pytest.raises(RuntimeError, match='saturated'):
+        graph.run(start_action).result(timeout=2)
+
+
+def test_run_returns_before_the_actions_are_done():
+    release = threading.Event()
+    pool = ThreadPoolExecutor(1)
+    result = ActionGraph({'slow': ()}).run(lambda name: pool.submit(release.wait, 5))
+    assert not result.done()
+    release.set()
+    result.result(timeout=2)
+
+
+def test_empty_graph_is_done():
+    assert ActionGraph({}).run(lambda name: None).done()
+
+
+def test_invalid_graphs_are_rejected():
+    with pytest.raises(ValueError, match='not linked'):
+        ActionGraph({'order': ('flatten',)})
+    with pytest.raises(ValueError, match='cycle'):
+        ActionGraph({'a': ('b',), 'b': ('a',)})
@@ -0,0 +1,73 @@
+import json
+
+import pytest
+
+import handlers
+
+
+@pytest.fixture
+def accepted(monkeypatch):
+    # decoded alerts are acknowledged without reaching the write-ahead log nor the dispatcher
+    alerts = []
+
+    def accept(event, data, entry_id=None):
+        alerts.append((event.name, data))
+        return 202, 'Accepted'
+
+    monkeypatch.setattr(handlers, '_accept', accept)
+    return alerts
+
+
+def _item(symbol='ES', **fields):
+    return {'key': handlers.em.get('WebhookReceivedNtOrder').key, 'symbol': symbol, 'order_type': 'buy', **fields}
+
+
+def _post(content_type, body):
+    if not isinstance(body, str):
+        body = json.dumps(body)
+    return handlers.handle_webhook(content_type, body.encode())
+
+
+def test_single_alert_is_accepted(accepted):
+    assert _post('application/json', _item(quantity='2')) == (202, 'Accepted', {})
+    assert accepted == [('WebhookReceivedNtOrder', _item(quantity=2))]
+
+
+def test_batch_of_accepted_alerts(accepted):
+    status, results, _ = _post('application/json', [_item('ES'), _item('NQ')])
+    assert status == 202
+    assert [(result['index'], result['status']) for result in results] == [(0, 202), (1, 202)]
+    assert [data['symbol'] for _, data in accepted] == ['ES', 'NQ']
+
+
+def test_batch_with_a_rejected_item_is_multi_status(accepted):
+    status, results, _ = _post('application/json', [_item('ES'), {'key': 'Unknown:abc'}, _item(quantity=[1])])
+    assert status == 207
+    assert [result['status'] for result in results] == [202, 404, 400]
+    # the rejected items do not hold back the accepted one
+    assert len(accepted) == 1
+
+
+def test_text_lines_are_a_batch(accepted):
+    key = _item()['key']
+    body = f'key={key},symbol=ES,order_type=buy\nkey={key},symbol=NQ,order_type=sell\n'
+    status, results, _ = _post('text/plain', body)
+    assert status == 202 and len(results) == 2
+
+
+def test_oversized_batch_is_rejected_before_any_item(accepted, monkeypatch):
+    monkeypatch.setattr(handlers, 'WEBHOOK_BATCH_LIMIT', 2)
+    status, message, _ = _post('application/json', [_item()] * 3)
+    assert status == 413 and '2 items' in message
+    assert accepted == []
+
+
+def test_unsupported_content_type(accepted):
+    status, _, _ = _post('application/x-www-form-urlencoded', 'key=abc')
+    assert status == 415
+    assert _post(None, '')[0] == 415
+
+
+def test_malformed_json(accepted):
+    assert _post('application/json', '{"key":')[0] == 400
+    assert accepted == []
@@ -0,0 +1,56 @@
+import pytest
+
+from components.journal.journal import Journal, journal
+from components.metrics import metrics
+from components.metrics.metrics import broker_call, broker_call_hooks
+from components.schemas.payload import Payload
+
+
+def test_rows_are_written_and_queried(tmp_path):
+    store = Journal(str(tmp_path / 'journal.db'))
+    store.record_alert('abc', 'WebhookReceived', Payload({'key': 'secret', 'symbol': 'ES', 'account': 'Sim101'}),
+                       202, 'Accepted')
+    store.record_broker('nt', 'place_order', {'qty': 1}, {'ok': True}, 0.01)
+    assert store.flush()
+
+    [alert] = store.query(kind='alert', symbol='ES')
+    assert (alert['correlation_id'], alert['status'], alert['account']) == ('abc', '202', 'Sim101')
+    # the webhook key is never journaled
+    assert alert['detail']['data'] == {'symbol': 'ES', 'account': 'Sim101'}
+    assert [row['kind'] for row in store.query()] == ['broker', 'alert']
+    assert store.stats()['written'] == 2
+
+
+def test_full_queue_drops_rows(tmp_path):
+    store = Journal(str(tmp_path / 'journal.db'), queue_size=1)
+    # the writer is not started: the second row finds the queue full
+    store._writer = object()
+    store.record_alert('a', 'Event', None, 202, 'Accepted')
+    store.record_alert('b', 'Event', None, 202, 'Accepted')
+    assert store.stats()['dropped'] == 1
+
+
+def test_query_before_any_write(tmp_path):
+    assert Journal(str(tmp_path / 'missing.db')).query() == []
+
+
+def test_broker_calls_reach_the_hooks(monkeypatch):
+    calls = []
+
+    def failing_hook(*args):
+        raise RuntimeError('journal is gone')
+
+    monkeypatch.setattr(metrics, 'broker_call_hooks', [failing_hook, lambda *args: calls.append(args)])
+
+    # a failing hook neither hides the broker's error nor stops the other hooks
+    with pytest.raises(ConnectionError):
+        with broker_call('nt', 'place_order', {'qty': 1}):
+            raise ConnectionError('refused')
+
+    [(broker, call, request, response, seconds, error)] = calls
+    assert (broker, call, request, response) == ('nt', 'place_order', {'qty': 1}, None)
+    assert isinstance(error, ConnectionError)
+
+
+def test_journal_registers_its_hook():
+    assert journal.record_broker in broker_call_hooks
@@ -0,0 +1,79 @@
+import json
+
+import pytest
+
+from components.logs import log_hub as log_hub_module
+from components.logs.log_hub import LogHub, LogStream
+from components.logs.log_store import LogStore
+
+
+def _line(n):
+    return f'Event,triggered,2026-01-01 00:00:00,Event {n}\n'
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    store = LogStore(str(tmp_path / 'log.log'))
+    monkeypatch.setattr(log_hub_module, 'log_store', store)
+    return store
+
+
+def _events(chunk):
+    return [json.loads(line[len('data: '):]) for line in chunk.splitlines() if line.startswith('data: ')]
+
+
+def _render(entry):
+    return {'cursor': entry.cursor, 'line': entry.line}
+
+
+def test_stream_sends_history_then_published_entries(store):
+    hub, woken = LogHub(max_subscribers=2, buffer_size=10), []
+    store.append(_line(0))
+    stream = LogStream(hub, _render, wake=lambda: woken.append(1))
+
+    first = stream.start()
+    assert first.startswith('retry: ')
+    assert [event['line'] for event in _events(first)] == [_line(0)]
+
+    hub.publish(store.append(_line(1)))
+    assert woken
+    assert [event['line'] for event in _events(stream.read())] == [_line(1)]
+    # nothing is sent twice
+    assert _events(stream.read()) == []
+    stream.close()
+    assert hub.stats()['subscribers'] == 0
+
+
+def test_stream_resumes_from_last_event_id(store):
+    hub = LogHub()
+    entries = [store.append(_line(n)) for n in range(3)]
+    stream = LogStream(hub, _render, since=entries[0].cursor)
+    assert [event['line'] for event in _events(stream.start())] == [_line(1), _line(2)]
+
+
+def test_overflowed_subscriber_catches_up_from_the_store(store):
+    hub = LogHub(buffer_size=2)
+    stream = LogStream(hub, _render)
+    stream.start()
+    for n in range(5):
+        hub.publish(store.append(_line(n)))
+
+    assert hub.stats()['overflows'] == 1
+    assert [event['line'] for event in _events(stream.read())] == [_line(n) for n in range(5)]
+
+
+def test_streams_past_the_limit_are_refused(store):
+    hub = LogHub(max_subscribers=1)
+    assert LogStream(hub, _render).start()
+    assert not hub.accepts()
+    assert LogStream(hub, _render).start() == ''
+    assert hub.stats()['refused'] == 2
+
+
+def test_closed_hub_ends_streams(store):
+    hub, woken = LogHub(), []
+    stream = LogStream(hub, _render, wake=lambda: woken.append(1))
+    stream.start()
+    hub.close()
+    assert woken and not stream.open
+    assert hub.subscribe(lambda: None) is None
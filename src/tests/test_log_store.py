@@ -0,0 +1,68 @@
+import os
+
+import pytest
+
+import handlers
+from components.logs.log_store import LogStore, parse_cursor
+
+
+def _line(parent, n):
+    return f'{parent},triggered,2026-01-01 00:00:00,{parent} {n}\n'
+
+
+def test_newer_returns_entries_after_a_cursor(tmp_path):
+    store = LogStore(str(tmp_path / 'log.log'), limit=10)
+    entries = [store.append(_line('Event', n)) for n in range(5)]
+
+    newer = store.newer(parse_cursor(entries[2].cursor))
+    assert [entry.line for entry in newer] == [entries[4].line, entries[3].line]
+    assert store.newer(parse_cursor(entries[4].cursor)) == []
+    assert len(store.newer(limit=2)) == 2
+
+
+def test_cursors_survive_rotation_and_other_processes(tmp_path):
+    path = str(tmp_path / 'log.log')
+    store = LogStore(path, limit=100, segment_bytes=200)
+    first = store.append(_line('Event', 0))
+    # rotated once, after the 5th line
+    for n in range(1, 8):
+        store.append(_line('Event', n))
+    assert os.path.exists(f'{path}.1')
+
+    # another worker reads both segments back, with the same cursors
+    other = LogStore(path, limit=100, segment_bytes=200)
+    assert [entry.cursor for entry in other.newer()] == [entry.cursor for entry in store.newer()]
+    assert len(other.newer(parse_cursor(first.cursor))) == 7
+
+
+def test_history_is_indexed_by_parent(tmp_path):
+    store = LogStore(str(tmp_path / 'log.log'), limit=3)
+    for n in range(5):
+        store.append(_line('First', n))
+        store.append(_line('Second', n))
+    assert [entry.line for entry in store.history('First')] == [_line('First', n) for n in (2, 3, 4)]
+    assert store.history('Missing') == []
+
+
+def test_invalid_cursor():
+    with pytest.raises(ValueError):
+        parse_cursor('not-a-cursor')
+
+
+def test_unchanged_log_is_not_modified(tmp_path, monkeypatch):
+    store = LogStore(str(tmp_path / 'log.log'))
+    monkeypatch.setattr(handlers, 'log_store', store)
+    store.append(_line('Event', 0))
+
+    status, body, headers = handlers.read_logs()
+    assert status == 200 and len(body) == 1
+    assert handlers.read_logs(if_none_match=headers['ETag'])[0] == 304
+
+    # added in the same second as Last-Modified: the ETag changes
+    store.append(_line('Event', 1))
+    status, body, _ = handlers.read_logs(since=body[0]['cursor'], if_none_match=headers['ETag'])
+    assert status == 200 and [log['event_data'] for log in body] == ['Event 1']
+
+
+def test_invalid_since_is_rejected():
+    assert handlers.read_logs(since='zz')[0] == 400
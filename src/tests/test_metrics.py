@@ -0,0 +1,113 @@
+import os
+
+import pytest
+
+from components.metrics import metrics as metrics_module
+from components.metrics.metrics import MetricsRegistry, broker_call
+
+
+def _samples(text):
+    return [line for line in text.splitlines() if not line.startswith('#')]
+
+
+def test_counter_by_labels():
+    registry = MetricsRegistry()
+    counter = registry.counter('test_total', 'Test counter', labels=('event', 'status'))
+    counter.inc(event='Order', status=202)
+    counter.inc(2, event='Order', status=202)
+    counter.inc(event='Say "hi"\n', status=400)
+
+    text = registry.render()
+    assert '# TYPE test_total counter' in text
+    assert _samples(text) == ['test_total{event="Order",status="202"} 3',
+                              'test_total{event="Say \\"hi\\"\\n",status="400"} 1']
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = MetricsRegistry()
+    histogram = registry.histogram('test_seconds', 'Test histogram', buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.5, 5.0):
+        histogram.observe(value)
+    with histogram.time():
+        pass
+
+    samples = _samples(registry.render())
+    total = float(samples.pop(3).split()[1])
+    assert 6.05 <= total < 6.1
+    assert samples == [
+        'test_seconds_bucket{le="0.1"} 2',
+        'test_seconds_bucket{le="1.0"} 4',
+        'test_seconds_bucket{le="+Inf"} 5',
+        'test_seconds_count 5',
+    ]
+
+
+def test_gauge_reads_its_callback_when_rendered():
+    registry, depth = MetricsRegistry(), {('normal',): 3}
+    registry.gauge('test_depth', 'Test gauge', lambda: depth, labels=('lane',))
+    assert _samples(registry.render()) == ['test_depth{lane="normal"} 3']
+    depth[('normal',)] = 0
+    depth[('low',)] = 1
+    assert _samples(registry.render()) == ['test_depth{lane="low"} 1', 'test_depth{lane="normal"} 0']
+
+
+def test_registering_twice_returns_the_same_metric():
+    registry = MetricsRegistry()
+    assert registry.counter('test_total', 'Test') is registry.counter('test_total', 'Test')
+
+
+def test_broker_call_is_timed_and_passed_to_hooks(monkeypatch):
+    calls = []
+    monkeypatch.setattr(metrics_module, 'broker_call_hooks', [lambda *args: calls.append(args)])
+
+    with broker_call('nt', 'write_ati', request='PLACE;ES') as record:
+        record.response = 'written'
+    with pytest.raises(RuntimeError):
+        with broker_call('nt', 'write_ati'):
+            raise RuntimeError('terminal down')
+
+    (broker, call, request, response, seconds, error), failed = calls
+    assert (broker, call, request, response, error) == ('nt', 'write_ati', 'PLACE;ES', 'written', None)
+    assert seconds >= 0
+    assert isinstance(failed[-1], RuntimeError)
+    assert 'tvwb_broker_errors_total{broker="nt",call="write_ati"}' in metrics_module.metrics.render()
+
+
+def test_failing_hook_does_not_hide_the_call(monkeypatch):
+    def fail(*args):
+        raise ValueError('journal is closed')
+
+    monkeypatch.setattr(metrics_module, 'broker_call_hooks', [fail])
+    with broker_call('mt5', 'order_send') as record:
+        record.response = 'done'
+
+
+def test_shared_registry_sums_the_workers(tmp_path):
+    registry, depth = MetricsRegistry(), {'value': 2}
+    counter = registry.counter('test_total', 'Test counter', labels=('status',))
+    histogram = registry.histogram('test_seconds', 'Test histogram', buckets=(1.0,))
+    registry.gauge('test_depth', 'Test gauge', lambda: depth['value'])
+    registry.gauge('test_entries', 'Shared gauge', lambda: 7, shared=True)
+    registry.share(str(tmp_path))
+
+    # another worker's snapshot, taken before it exited
+    counter.inc(3, status=202)
+    histogram.observe(0.5)
+    registry.publish()
+    os.rename(tmp_path / f'{os.getpid()}.json', tmp_path / '1.json')
+    registry.retire(1)
+
+    counter._values.clear()
+    histogram._values.clear()
+    counter.inc(status=202)
+    histogram.observe(2.0)
+    assert _samples(registry.render()) == [
+        'test_total{status="202"} 4',
+        'test_seconds_bucket{le="1.0"} 1',
+        'test_seconds_bucket{le="+Inf"} 2',
+        'test_seconds_sum 2.5',
+        'test_seconds_count 2',
+        # the gauge of the exited worker is dropped, the shared one is not summed
+        'test_depth 2',
+        'test_entries 7',
+    ]
@@ -0,0 +1,49 @@
+import pytest
+
+import handlers
+from components.schemas.payload import Field, Payload, PayloadDecoder, PayloadError
+
+# declared like WebhookReceivedNtOrder, plus a float field
+FIELDS = {
+    'key': Field(str, required=True),
+    'symbol': Field(str, required=True),
+    'quantity': Field(int),
+    'price': Field(float),
+    'reverse': Field(bool, default=False),
+}
+
+
+def test_fields_are_coerced_once():
+    data = PayloadDecoder(FIELDS).decode(
+        {'key': 'Event:abc', 'symbol': ' ES ', 'quantity': '2.0', 'price': '4500.25', 'note': [1]})
+    assert isinstance(data, Payload)
+    assert data == {'key': 'Event:abc', 'symbol': 'ES', 'quantity': 2, 'price': 4500.25, 'reverse': False,
+                    'note': [1]}
+
+
+def test_text_body_is_coerced_like_json():
+    data = PayloadDecoder(FIELDS).decode_text('key=Event:abc,symbol=ES,quantity=3,reverse=yes')
+    assert data.quantity == 3 and data.reverse is True
+
+
+def test_missing_required_field():
+    with pytest.raises(PayloadError, match='missing required field\\(s\\): symbol'):
+        PayloadDecoder(FIELDS).decode({'key': 'Event:abc', 'quantity': 1})
+
+
+@pytest.mark.parametrize('name, value', [
+    ('quantity', [1]), ('quantity', {'n': 1}), ('quantity', True), ('quantity', '1.5'), ('quantity', 'inf'),
+    ('price', [1.0]), ('price', False), ('price', 'nan'), ('price', 'inf'), ('price', float('-inf')),
+    ('symbol', ['ES']),
+])
+def test_wrong_type_is_a_payload_error(name, value):
+    with pytest.raises(PayloadError, match=f'{name}: cannot convert'):
+        PayloadDecoder(FIELDS).decode({'key': 'Event:abc', 'symbol': 'ES', name: value})
+
+
+def test_wrong_type_is_answered_with_400():
+    event = handlers.em.get('WebhookReceivedNtOrder')
+    status, message, _ = handlers.process_item(
+        {'key': event.key, 'symbol': 'ES', 'order_type': 'buy', 'quantity': [1]})
+    assert status == 400
+    assert 'quantity' in message
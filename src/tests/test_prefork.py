@@ -0,0 +1,105 @@
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+
+import pytest
+
+from components.metrics.metrics import PUBLISH_INTERVAL
+from utils.prefork import READY_LINE, inherit, listen
+
+SRC = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def test_inherited_socket_accepts_on_the_listening_one():
+    sock = listen('127.0.0.1', 0)
+    try:
+        port = sock.getsockname()[1]
+        inherited = inherit(str(os.dup(sock.fileno())))
+        assert inherited.getsockname()[1] == port
+        assert not inherited.getblocking()
+        with socket.create_connection(('127.0.0.1', port), timeout=2):
+            inherited.setblocking(True)
+            inherited.settimeout(2)
+            connection, _ = inherited.accept()
+            connection.close()
+        inherited.close()
+    finally:
+        sock.close()
+
+
+@pytest.fixture
+def prefork(tmp_path):
+    # two workers of a stub app, with their own write-ahead log, journal and GUI log
+    port = _free_port()
+    env = dict(os.environ, MT5_ENABLED='false', NT_ENABLED='false', WAL_PATH=str(tmp_path / 'wal.log'),
+               JOURNAL_PATH=str(tmp_path / 'journal.db'), LOG_LOCATION=str(tmp_path / 'log.log'))
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'utils.prefork', '--host=127.0.0.1', f'--port={port}', '--processes=2',
+         '--threads=2', '--ready'], cwd=SRC, env=env, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+    ready = []
+    both = threading.Event()
+
+    def read():
+        for line in process.stdout:
+            if line.startswith(READY_LINE):
+                ready.append(int(line.split()[1]))
+                if len(ready) == 2:
+                    both.set()
+
+    threading.Thread(target=read, daemon=True).start()
+    try:
+        assert both.wait(30), 'workers did not start'
+        yield process, port, ready
+    finally:
+        if process.poll() is None:
+            process.send_signal(signal.SIGTERM)
+            try:
+                process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='forked workers only')
+def test_workers_serve_then_drain(prefork):
+    process, port, pids = prefork
+    assert len(set(pids)) == 2 and process.pid not in pids
+
+    for _ in range(4):
+        with urllib.request.urlopen(f'http://127.0.0.1:{port}/dispatch/stats', timeout=5) as response:
+            assert 'lanes' in json.loads(response.read())
+
+    process.send_signal(signal.SIGTERM)
+    assert process.wait(timeout=30) == 0
+    for pid in pids:
+        with pytest.raises(ProcessLookupError):
+            os.kill(pid, 0)
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='forked workers only')
+def test_metrics_are_summed_over_the_workers(prefork):
+    process, port, _ = prefork
+    for _ in range(10):
+        request = urllib.request.Request(f'http://127.0.0.1:{port}/webhook', data=b'{"key": "Unknown:abc"}',
+                                         headers={'Content-Type': 'application/json'})
+        with pytest.raises(urllib.error.HTTPError, match='404'):
+            urllib.request.urlopen(request, timeout=5)
+    time.sleep(2 * PUBLISH_INTERVAL)
+
+    # whichever worker answers
+    for _ in range(4):
+        with urllib.request.urlopen(f'http://127.0.0.1:{port}/metrics', timeout=5) as response:
+            assert 'tvwb_webhooks_total{event="",status="404"} 10' in response.read().decode()
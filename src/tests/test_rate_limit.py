@@ -0,0 +1,63 @@
+import multiprocessing
+import os
+
+import pytest
+
+from components.dispatch.rate_limit import RateLimiter, TokenBucket
+
+
+class _Event:
+    webhook = True
+    rate_limit = None
+    rate_burst = None
+
+    def __init__(self, name):
+        self.name = name
+        self.key = f'{name}:abc'
+
+
+def test_bucket_allows_a_burst_then_waits():
+    bucket = TokenBucket(rate=10, burst=3)
+    assert [bucket.take() for _ in range(3)] == [0, 0, 0]
+    wait = bucket.take()
+    assert 0 < wait <= 0.1
+
+    bucket.refund()
+    assert bucket.take() == 0
+
+
+def test_disabled_bucket_always_admits():
+    bucket = TokenBucket(rate=0)
+    assert all(bucket.take() == 0 for _ in range(100))
+
+
+def test_per_key_limit_rejects_only_its_key():
+    limiter = RateLimiter(per_key=1, per_key_burst=1, global_rate=0, global_burst=0)
+    first, second = _Event('First'), _Event('Second')
+    assert limiter.admit(first) is None
+    scope, wait = limiter.admit(first)
+    assert scope == 'key' and wait > 0
+    assert limiter.admit(second) is None
+    assert limiter.stats()['rejected']['key'] == {'First': 1}
+
+
+def test_global_rejection_refunds_the_key():
+    limiter = RateLimiter(per_key=1, per_key_burst=1, global_rate=1, global_burst=1)
+    first, second = _Event('First'), _Event('Second')
+    assert limiter.admit(first) is None
+    assert limiter.admit(second)[0] == 'global'
+    # the rejected alert did not use up its key's token
+    assert limiter.bucket(second).take() == 0
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='forked workers only')
+def test_shared_bucket_is_drawn_by_every_process():
+    bucket = TokenBucket(rate=0.001, burst=2)
+    bucket.share()
+
+    context = multiprocessing.get_context('fork')
+    worker = context.Process(target=bucket.take)
+    worker.start()
+    worker.join(5)
+    assert bucket.take() == 0
+    assert bucket.take() > 0
@@ -0,0 +1,107 @@
+import json
+import os
+import threading
+
+import pytest
+
+from components.dispatch.wal import WalError, WriteAheadLog
+
+
+def _records(path):
+    with open(path, encoding='utf-8') as wal_file:
+        return [json.loads(line) for line in wal_file]
+
+
+def test_concurrent_appends_are_group_committed(tmp_path):
+    wal = WriteAheadLog(str(tmp_path / 'wal.log'), fsync=True)
+    assert wal.open() == []
+
+    threads = [threading.Thread(target=wal.append, args=(f'id{n}', 'Event', {'n': n})) for n in range(50)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    stats = wal.stats()
+    assert stats['appended'] == stats['pending'] == 50
+    assert stats['commits'] <= 50
+    assert sorted(record['id'] for record in _records(wal.path)) == sorted(f'id{n}' for n in range(50))
+    wal.close()
+
+
+def test_pending_alerts_are_replayed(tmp_path):
+    path = str(tmp_path / 'wal.log')
+    wal = WriteAheadLog(path)
+    wal.open()
+    wal.append('done', 'Event', {'symbol': 'ES'})
+    wal.append('pending', 'Event', {'symbol': 'NQ'})
+    wal.complete('done')
+    wal.close()
+
+    reopened = WriteAheadLog(path)
+    assert [(record['id'], record['d']) for record in reopened.open()] == [('pending', {'symbol': 'NQ'})]
+    reopened.close()
+
+
+def test_close_writes_everything_and_stops_the_writer(tmp_path):
+    path = str(tmp_path / 'wal.log')
+    wal = WriteAheadLog(path)
+    wal.open()
+    for n in range(5):
+        wal.append(f'id{n}', 'Event', {})
+    writer = wal._writer
+    # completions are queued without waiting for the writer
+    for n in range(4):
+        wal.complete(f'id{n}')
+    wal.close()
+
+    assert not writer.is_alive()
+    assert len(_records(path)) == 9
+    with pytest.raises(WalError):
+        wal.append('late', 'Event', {})
+
+
+def test_closed_log_without_pending_alerts_is_removed(tmp_path):
+    path = str(tmp_path / 'wal.log')
+    wal = WriteAheadLog(path)
+    wal.open()
+    wal.append('a', 'Event', {})
+    wal.complete('a')
+    wal.close()
+    assert not os.path.exists(path)
+
+
+def test_compaction_keeps_only_pending_alerts(tmp_path):
+    path = str(tmp_path / 'wal.log')
+    wal = WriteAheadLog(path, max_bytes=512)
+    wal.open()
+    for n in range(40):
+        wal.append(f'id{n}', 'Event', {'symbol': 'ES'})
+        if n != 7:
+            wal.complete(f'id{n}')
+    wal.append('last', 'Event', {})
+    wal.close()
+
+    assert wal.stats()['compactions'] >= 1
+    assert len(_records(path)) < 40
+    reopened = WriteAheadLog(path)
+    assert [record['id'] for record in reopened.open()] == ['id7', 'last']
+    reopened.close()
+
+
+def test_logs_of_stopped_processes_are_adopted(tmp_path):
+    base = str(tmp_path / 'wal.log')
+    first = WriteAheadLog(base)
+    first.open()
+    second = WriteAheadLog(base)
+    second.open()
+    assert (first.path, second.path) == (base, f'{base}.1')
+
+    second.append('orphaned', 'Event', {'symbol': 'ES'})
+    # a process dying leaves its log locked by nobody
+    second._lock_file.close()
+
+    assert [record['id'] for record in first.adopt()] == ['orphaned']
+    assert not os.path.exists(f'{base}.1')
+    assert first.stats()['pending'] == 1
+    first.close()
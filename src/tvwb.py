@@ -1,8 +1,10 @@
 import json
 import os
+import sys
 from subprocess import run
+from typing import List
 from hashlib import md5
-from commons import UNIQUE_KEY
+from commons import UNIQUE_KEY, LOG_STREAM_CLIENTS
 
 from utils.copy_template import copy_from_template
 from utils.formatting import snake_case
@@ -57,11 +59,55 @@ def print_gui_info(open_gui: bool, host: str, port: int):
         print(f"To learn more about GUI modes, visit: {gui_modes_url}")
 
 
-def run_server(host: str, port: int, workers: int):
+SERVERS = ["waitress", "uvicorn"]
+
+
+def server_command(
+    host: str, port: int, workers: int, server: str = "waitress", processes: int = 1,
+    supervised: bool = False,
+):
+    # waitress threads: --workers for requests, plus one held by each live log stream of the dashboard
+    threads = workers + LOG_STREAM_CLIENTS
+    if supervised:
+        # supervisor: keeps the socket open across reloads, each generation of workers is warmed up before serving
+        if server != "waitress":
+            raise typer.BadParameter("--supervised is only supported with the waitress server")
+        if processes > 1 and not hasattr(os, "fork"):
+            raise typer.BadParameter("--processes needs os.fork (Linux or macOS)")
+        return [
+            sys.executable, "-m", "utils.supervisor", f"--host={host}", f"--port={port}",
+            f"--processes={processes}", f"--threads={threads}",
+        ]
+    if processes > 1:
+        # prefork: registers once, forks waitress workers sharing event flags, dedupe and rate limits
+        if server != "waitress":
+            raise typer.BadParameter("--processes is only supported with the waitress server")
+        if not hasattr(os, "fork"):
+            raise typer.BadParameter("--processes needs os.fork (Linux or macOS)")
+        return [
+            sys.executable, "-m", "utils.prefork", f"--host={host}", f"--port={port}",
+            f"--processes={processes}", f"--threads={threads}",
+        ]
+    if server == "waitress":
+        # WSGI, one thread per in-flight request
+        command = f"waitress-serve --listen={host}:{port} --threads={threads} wsgi:app"
+    elif server == "uvicorn":
+        # ASGI, all requests served from a single event loop
+        if workers > 1:
+            raise typer.BadParameter(
+                "--workers sets waitress threads, uvicorn serves requests from a single event loop"
+            )
+        command = f"uvicorn asgi:app --host {host} --port {port}"
+    else:
+        raise typer.BadParameter(f"Unknown server {server}, choose from {SERVERS}")
+    return command.split(" ")
+
+
+def run_server(
+    host: str, port: int, workers: int, server: str = "waitress", processes: int = 1, supervised: bool = False
+):
     print("Close server with Ctrl+C in terminal.")
-    run(
-        f"waitress-serve --listen={host}:{port} --threads={workers} wsgi:app".split(" ")
-    )
+    run(server_command(host, port, workers, server, processes, supervised))
 
 
 app = typer.Typer()
@@ -80,16 +126,46 @@ def start(
     port: int = typer.Option(default=5000),
     workers: int = typer.Option(
         default=1,
-        help="Number of workers to run the server with.",
+        help="Number of workers to run the server with (waitress threads, uvicorn runs a single event loop).",
+    ),
+    server: str = typer.Option(
+        default="waitress",
+        help="Server to run: waitress (WSGI) or uvicorn (ASGI, single event loop).",
+    ),
+    processes: int = typer.Option(
+        default=1,
+        help="Number of prefork worker processes (waitress only), each running --workers threads.",
+    ),
+    supervised: bool = typer.Option(
+        default=False,
+        help="Run under a supervisor (waitress only), allowing zero-downtime reloads with `tvwb.py reload`.",
     ),
 ):
+    if server not in SERVERS:
+        raise typer.BadParameter(f"Unknown server {server}, choose from {SERVERS}")
+
     if open_gui:
         clear_gui_key()
     else:
         generate_gui_key()
 
     print_gui_info(open_gui, host, port)
-    run_server(host, port, workers)
+    run_server(host, port, workers, server, processes, supervised)
+
+
+@app.command("reload")
+def reload():
+    """
+    Reloads a server started with --supervised: new workers (with the current code and settings) are warmed up
+    and serving before the old ones finish their in-flight requests and exit.
+    """
+    from utils.supervisor import request_reload
+
+    if request_reload():
+        logger.info("Reload requested")
+    else:
+        logger.error("No supervised server running (start it with --supervised)")
+        raise typer.Exit(code=1)
 
 
 @app.command("action:create")
@@ -100,6 +176,11 @@ def create_action(
         prompt="Register action?",
         help="Automatically register this event upon creation.",
     ),
+    is_async: bool = typer.Option(
+        False,
+        "--async",
+        help="Create an async action (async def run), run on the dispatcher's event loop.",
+    ),
 ):
     """
     Creates a new action.
@@ -107,8 +188,9 @@ def create_action(
     logger.info(f"Creating new action --->\t{name}")
 
     custom_name = CustomName(name)
+    template = "async_action_template.py" if is_async else "action_template.py"
     copy_from_template(
-        source="components/actions/base/template/action_template.py",
+        source=f"components/actions/base/template/{template}",
         target=f"components/actions/{custom_name.snake_case()}.py",
         tokens=["_TemplateAction_", "TemplateActionClass", "template_action"],
         replacements=[
@@ -137,12 +219,21 @@ def add_action_to_settings(name: str):
 
 
 @app.command("action:link")
-def action_link(action_name: str, event_name: str):
+def action_link(
+    action_name: str,
+    event_name: str,
+    after: List[str] = typer.Option(
+        None,
+        "--after",
+        help="Action (linked to the same event) that must complete first, can be repeated.",
+    ),
+):
     """
     Links an action to an event.
+    Actions without dependencies between them run concurrently.
     """
     logger.info(f"Setting {event_name} to trigger --->\t{action_name}")
-    link_action_to_event(action_name, event_name)
+    link_action_to_event(action_name, event_name, after=after)
 
 
 @app.command("action:unlink")
@@ -208,6 +299,86 @@ def register_event(name: str):
         logger.error(e)
 
 
+@app.command("bench")
+def bench(
+    event: str = typer.Option(
+        default="WebhookReceived", help="Event to send alerts to."
+    ),
+    requests: int = typer.Option(
+        500, "--requests", "-n", help="Total number of alerts to send."
+    ),
+    concurrency: int = typer.Option(
+        10, "--concurrency", "-c", help="Number of concurrent connections."
+    ),
+    rate: float = typer.Option(
+        0, help="Target alerts per second, 0 sends as fast as possible."
+    ),
+    content_type: str = typer.Option(default="json", help="Alert body: json or text."),
+    server: str = typer.Option(default="waitress", help="Server to bench."),
+    workers: int = typer.Option(
+        default=None, help="Number of server workers (waitress threads, default 4, uvicorn runs a single event loop)."
+    ),
+    processes: int = typer.Option(default=1, help="Number of prefork worker processes."),
+    host: str = typer.Option(default="127.0.0.1"),
+    port: int = typer.Option(default=5055),
+    url: str = typer.Option(
+        default=None,
+        help="Bench an already running server instead of starting a stub server.",
+    ),
+    output: str = typer.Option(
+        default="bench/results.json", help="File to save results to."
+    ),
+):
+    """
+    Fires alerts at /webhook and reports latency percentiles, throughput and errors.
+    Unless --url is given, the app is started with broker integrations disabled (stub brokers).
+    """
+    from commons import VERSION_NUMBER
+    from utils.bench import bench as run_bench, save_results
+
+    if content_type not in ["json", "text"]:
+        raise typer.BadParameter("content-type must be json or text")
+
+    if workers is None:
+        workers = 4 if server == "waitress" else 1
+
+    key = f'{event}:{md5(f"{event}{UNIQUE_KEY}".encode()).hexdigest()[:6]}'
+    logger.info(
+        f"Benching {event}: {requests} alerts, concurrency {concurrency}, rate {rate or 'unlimited'}"
+    )
+    results = run_bench(
+        command=server_command(host, port, workers, server, processes),
+        host=host,
+        port=port,
+        key=key,
+        requests=requests,
+        concurrency=concurrency,
+        rate=rate,
+        content_type=content_type,
+        url=url,
+    )
+    results["version"] = VERSION_NUMBER
+    results["params"] = {
+        "event": event,
+        "concurrency": concurrency,
+        "rate": rate,
+        "content_type": content_type,
+        "server": None if url else server,
+        "workers": None if url else workers,
+        "processes": None if url else processes,
+    }
+    save_results(results, output)
+
+    latency = results["latency_ms"]
+    print(
+        f"\n\t{results['completed']}/{requests} completed in {results['duration_seconds']}s"
+        f" ({results['throughput_rps']} req/s), {results['errors']} error(s)"
+    )
+    print(
+        f"\tlatency ms  p50={latency['p50']}  p95={latency['p95']}  p99={latency['p99']}  max={latency['max']}\n"
+    )
+
+
 @app.command("util:test-nt-order")
 def test_nt_order(
     symbol: str = "MNQ 12-25",
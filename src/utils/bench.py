@@ -0,0 +1,226 @@
+import http.client
+import itertools
+import json
+import math
+import os
+import shutil
+import socket
+import subprocess
+import tempfile
+import threading
+import time
+from datetime import datetime
+from urllib.parse import urlsplit
+
+from utils.log import get_logger
+
+logger = get_logger(__name__)
+
+
+def percentile(sorted_values, pct):
+    """
+    Nearest-rank percentile
+    :param sorted_values: sorted list of values
+    :param pct: percentile, 0-100
+    :return: value or None if empty
+    """
+    if not sorted_values:
+        return None
+    rank = math.ceil(pct / 100 * len(sorted_values))
+    return sorted_values[max(0, min(len(sorted_values), rank) - 1)]
+
+
+def build_body(key, seq, content_type):
+    """
+    Builds a webhook body that satisfies the fields of the bundled order events
+    :param key: event key
+    :param seq: request number, keeps payloads unique
+    :param content_type: json or text
+    :return: (Content-Type header, bytes)
+    """
+    data = {
+        'key': key,
+        'symbol': 'BENCH',
+        'order_type': 'buy',
+        'magic': 1,
+        'volume': 0.01,
+        'quantity': 1,
+        'seq': seq,
+    }
+    if content_type == 'text':
+        return 'text/plain', ','.join(f'{k}={v}' for k, v in data.items()).encode()
+    return 'application/json', json.dumps(data).encode()
+
+
+def wait_until_listening(host, port, timeout=30.0):
+    """
+    Waits for a server to accept connections
+    :return: bool
+    """
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection((host, port), timeout=0.5):
+                return True
+        except OSError:
+            time.sleep(0.1)
+    return False
+
+
+def start_stub_server(command, host, port, directory):
+    """
+    Starts the app with broker integrations disabled, so alerts never reach a real broker
+    :param command: server command, i.e. from tvwb.server_command()
+    :param directory: empty directory of this run, for the stub server's GUI log, write-ahead log and journal
+    :return: Popen
+    """
+    # the bench alerts are never shown, replayed nor audited by the real app, nor replayed into the next bench
+    log_path = os.path.join(directory, 'log.log')
+    wal_path = os.path.join(directory, 'wal.log')
+    journal_path = os.path.join(directory, 'journal.db')
+    env = dict(os.environ, MT5_ENABLED='false', NT_ENABLED='false', DEDUPE_WINDOW='0',
+               RATE_LIMIT_PER_KEY='0', RATE_LIMIT_GLOBAL='0', LOG_LOCATION=log_path, WAL_PATH=wal_path,
+               JOURNAL_PATH=journal_path)
+    logger.info(f'Starting stub server --->\t{" ".join(command)}')
+    process = subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    if not wait_until_listening(host, port):
+        process.terminate()
+        raise RuntimeError(f'Server did not start listening on {host}:{port}')
+    return process
+
+
+def fetch_json(url, path):
+    parts = urlsplit(url)
+    connection = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=5)
+    try:
+        connection.request('GET', path)
+        response = connection.getresponse()
+        return json.loads(response.read()) if response.status == 200 else None
+    except (OSError, ValueError):
+        return None
+    finally:
+        connection.close()
+
+
+def run_load(url, key, requests, concurrency, rate, content_type):
+    """
+    Fires alerts at /webhook
+    :param url: base url of the server
+    :param key: event key
+    :param requests: total number of requests
+    :param concurrency: number of concurrent connections
+    :param rate: target requests per second, 0 for as fast as possible
+    :param content_type: json or text
+    :return: dict of results
+    """
+    parts = urlsplit(url)
+    path = parts.path.rstrip('/') + '/webhook'
+    counter = itertools.count()
+    lock = threading.Lock()
+    latencies = []
+    statuses = {}
+    errors = {}
+
+    start = time.perf_counter()
+
+    def worker():
+        connection = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=30)
+        while True:
+            with lock:
+                seq = next(counter)
+            if seq >= requests:
+                break
+
+            # with a target rate, latency is measured from the scheduled send time (no coordinated omission)
+            scheduled = start + seq / rate if rate else time.perf_counter()
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+
+            header, body = build_body(key, seq, content_type)
+            try:
+                connection.request('POST', path, body=body, headers={'Content-Type': header})
+                response = connection.getresponse()
+                response.read()
+                status = response.status
+            except (OSError, http.client.HTTPException) as e:
+                connection.close()
+                connection = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=30)
+                with lock:
+                    errors[type(e).__name__] = errors.get(type(e).__name__, 0) + 1
+                continue
+
+            latency = time.perf_counter() - scheduled
+            with lock:
+                latencies.append(latency)
+                statuses[status] = statuses.get(status, 0) + 1
+                if status >= 300:
+                    errors[str(status)] = errors.get(str(status), 0) + 1
+        connection.close()
+
+    threads = [threading.Thread(target=worker, name=f'bench-{i}') for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    duration = time.perf_counter() - start
+
+    latencies.sort()
+    ms = lambda value: round(value * 1000, 3) if value is not None else None
+    completed = len(latencies)
+    return {
+        'requests': requests,
+        'completed': completed,
+        'errors': sum(errors.values()),
+        'errors_by_type': errors,
+        'statuses': {str(k): v for k, v in sorted(statuses.items())},
+        'duration_seconds': round(duration, 3),
+        'throughput_rps': round(completed / duration, 2) if duration else 0.0,
+        'latency_ms': {
+            'mean': ms(sum(latencies) / completed) if completed else None,
+            'p50': ms(percentile(latencies, 50)),
+            'p95': ms(percentile(latencies, 95)),
+            'p99': ms(percentile(latencies, 99)),
+            'max': ms(latencies[-1]) if latencies else None,
+        },
+    }
+
+
+def save_results(results, output):
+    """
+    Saves bench results to a JSON file
+    :param results: dict
+    :param output: file path
+    """
+    directory = os.path.dirname(output)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(output, 'w') as output_file:
+        json.dump(results, output_file, indent=2)
+    logger.info(f'Bench results saved --->\t{output}')
+
+
+def bench(command, host, port, key, requests, concurrency, rate, content_type, url=None):
+    """
+    Runs a bench against a stub server (or an already running server if url is given)
+    :param command: server command used to start the stub server
+    :return: dict of results
+    """
+    process = directory = None
+    try:
+        if url is None:
+            url = f'http://{host}:{port}'
+            directory = tempfile.mkdtemp(prefix='tvwb-bench-')
+            process = start_stub_server(command, host, port, directory)
+        results = run_load(url, key, requests, concurrency, rate, content_type)
+        results['server_stats'] = fetch_json(url, '/dispatch/stats')
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=10)
+        if directory is not None:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    results['url'] = url
+    results['timestamp'] = datetime.now().isoformat(timespec='seconds')
+    return results
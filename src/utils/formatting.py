@@ -1,5 +1,9 @@
 import re
 
+from utils.log import get_logger
+
+logger = get_logger(__name__)
+
 
 def snake_case(text):
     # Gère les séquences de majuscules/chiffres comme un seul mot
@@ -10,7 +14,7 @@ def snake_case(text):
 def _convert_to_float(value):
     try:
         return float(value)
-    except ValueError:
+    except (TypeError, ValueError):
         logger.error(f"Failed to convert {value} to float")
         return None
 
@@ -18,6 +22,6 @@ def _convert_to_float(value):
 def _convert_to_int(value):
     try:
         return int(value)
-    except ValueError:
+    except (TypeError, ValueError):
         logger.error(f"Failed to convert {value} to int")
         return None
@@ -178,8 +178,11 @@ def add_event(event_name):
     build_settings(events=events)
 
 
-def link_action_to_event(action_name, event_name):
-    """Link action to event in settings.py"""
+def link_action_to_event(action_name, event_name, after=None):
+    """
+    Link action to event in settings.py
+    :param after: names of actions (linked to the same event) the action runs after
+    """
 
     try:
         from settings import REGISTERED_LINKS
@@ -187,10 +190,12 @@ def link_action_to_event(action_name, event_name):
         logger.error('Could not import REGISTERED_LINKS from settings.py')
         return
 
-    links = REGISTERED_LINKS + [(action_name, event_name)]
+    new_link = (action_name, event_name, tuple(after)) if after else (action_name, event_name)
 
-    # use set to remove duplicates
-    links = list(set(links))
+    # replace an existing link of the action to the event in place, links keep their order
+    links = [new_link if tuple(link[:2]) == (action_name, event_name) else link for link in REGISTERED_LINKS]
+    if new_link not in links:
+        links.append(new_link)
 
     build_settings(links=links)
 
@@ -204,11 +209,17 @@ def unlink_action_to_event(action_name, event_name):
         logger.error('Could not import REGISTERED_LINKS from settings.py')
         return
 
-    links = REGISTERED_LINKS
+    links = [link for link in REGISTERED_LINKS if tuple(link[:2]) != (action_name, event_name)]
 
-    if (action_name, event_name) in links:
-        links.remove((action_name, event_name))
-    else:
+    if len(links) == len(REGISTERED_LINKS):
         logger.warning(f'Link ({action_name}, {event_name}) not found in settings.py')
 
+    # actions running after the unlinked one no longer wait for it
+    links = [
+        (*link[:2], tuple(name for name in link[2] if name != action_name))
+        if len(link) > 2 and link[1] == event_name else link
+        for link in links
+    ]
+    links = [link[:2] if len(link) > 2 and not link[2] else link for link in links]
+
     build_settings(links=links)
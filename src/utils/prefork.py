@@ -0,0 +1,248 @@
+# prefork server: imports and registers the app once, then forks waitress workers sharing one listening socket
+import argparse
+import os
+import shutil
+import signal
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+from commons import DRAIN_TIMEOUT
+from utils.log import get_logger
+
+logger = get_logger(__name__)
+
+# a worker dying sooner than this after being forked is not restarted again right away
+RESPAWN_BACKOFF = 1.0
+
+# printed by each worker once it serves requests, read by the supervisor (utils/supervisor.py)
+READY_LINE = 'TVWB-WORKER-READY'
+
+# workers take over the write-ahead logs of stopped processes (i.e. a drained generation) this often (seconds)
+ADOPT_INTERVAL = 5.0
+
+# signal asking a worker to stop accepting, finish its requests and alerts, then exit
+DRAIN_SIGNAL = signal.SIGBREAK if hasattr(signal, 'SIGBREAK') else signal.SIGTERM
+
+
+def share_state():
+    """
+    Moves the runtime state every worker must agree on to shared memory:
+    event active flags, duplicate alert windows, rate limit buckets and shard locks.
+    Metrics are summed over the workers from per worker snapshots, in a temporary directory.
+    Coalescing windows, the live log stream subscribers, the write-ahead log and the journal writer stay per worker.
+    Must be called after registration and before forking.
+    """
+    from components.dispatch.dedupe import dedupe
+    from components.dispatch.dispatcher import dispatcher
+    from components.dispatch.rate_limit import rate_limiter
+    from components.events.base.event import em
+    from components.metrics.metrics import metrics
+
+    for event in em.get_all():
+        event.share()
+    rate_limiter.share(em.get_all())
+    dedupe.share()
+    dispatcher.share()
+    metrics.share(tempfile.mkdtemp(prefix='tvwb-metrics-'))
+
+
+def listen(host: str, port: int, backlog: int = 1024):
+    """
+    Opens the listening socket shared by every worker
+    :return: socket
+    """
+    family = socket.AF_INET6 if ':' in host else socket.AF_INET
+    sock = socket.create_server((host, port), family=family, backlog=backlog)
+    sock.setblocking(False)
+    return sock
+
+
+def inherit(fd: str):
+    """
+    Gets the listening socket handed over by the supervisor
+    :param fd: file descriptor number, or 'stdin' when the socket is shared through stdin (Windows)
+    :return: socket
+    """
+    if fd == 'stdin':
+        sock = socket.fromshare(bytes.fromhex(sys.stdin.readline().strip()))
+    else:
+        sock = socket.socket(fileno=int(fd))
+    sock.setblocking(False)
+    return sock
+
+
+def _in_flight(server):
+    # requests being received, queued, run or sent by this worker
+    tasks = server.task_dispatcher
+    if tasks.queue or tasks.active_count:
+        return True
+    return any(channel.requests or channel.request is not None or channel.total_outbufs_len
+               for channel in list(server.active_channels.values()))
+
+
+def run_worker(app, sock, threads: int, ready: bool = False):
+    """
+    Serves the app from a worker until it is asked to drain: replays the write-ahead log, warms broker connections,
+    then serves. On DRAIN_SIGNAL (or Ctrl+C) it stops accepting (the socket stays open for the other workers),
+    finishes in-flight requests and accepted alerts (up to DRAIN_TIMEOUT) and exits.
+    :param ready: print READY_LINE once serving, for the supervisor
+    """
+    import handlers
+    from components.metrics.metrics import metrics, PUBLISH_INTERVAL
+    from waitress.server import create_server
+
+    # not the handlers of the prefork parent
+    signal.signal(DRAIN_SIGNAL, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    try:
+        handlers.replay_wal()
+        handlers.warm_up()
+        server = create_server(app, sockets=[sock], threads=threads)
+    except BaseException:
+        logger.exception('Worker failed to start')
+        os._exit(1)
+
+    def drain():
+        server.accepting = False
+        server.pull_trigger()
+        # live log streams would otherwise stay in flight until the deadline
+        handlers.end_log_streams()
+        deadline = time.monotonic() + DRAIN_TIMEOUT
+        while _in_flight(server) and time.monotonic() < deadline:
+            time.sleep(0.05)
+        drained = handlers.drain(max(0.0, deadline - time.monotonic()))
+        logger.info(f'WORKER DRAINED --->\tpid {os.getpid()}' + ('' if drained else ', alerts left to replay'))
+        # the counters of this worker keep counting once it is gone
+        metrics.publish()
+        os._exit(0)
+
+    def adopt():
+        while True:
+            time.sleep(ADOPT_INTERVAL)
+            try:
+                handlers.adopt_wal()
+            except Exception as e:
+                logger.exception(f'Write-ahead log adoption failed: {e}')
+
+    def publish():
+        while True:
+            try:
+                metrics.publish()
+            except Exception as e:
+                logger.exception(f'Metrics snapshot failed: {e}')
+            time.sleep(PUBLISH_INTERVAL)
+
+    draining = threading.Event()
+
+    def start_drain(signum, frame):
+        # Ctrl+C reaches every worker as well as their parent, which also asks them to drain
+        if not draining.is_set():
+            draining.set()
+            threading.Thread(target=drain, name='drain', daemon=True).start()
+
+    signal.signal(DRAIN_SIGNAL, start_drain)
+    signal.signal(signal.SIGINT, start_drain)
+    threading.Thread(target=adopt, name='wal-adopt', daemon=True).start()
+    if metrics.directory is not None:
+        threading.Thread(target=publish, name='metrics-publish', daemon=True).start()
+
+    if ready:
+        print(READY_LINE, os.getpid(), flush=True)
+    try:
+        server.run()
+    finally:
+        os._exit(0)
+
+
+def serve_prefork(host: str, port: int, processes: int, threads: int, fd: str = None, ready: bool = False):
+    """
+    Forks processes workers serving the WSGI app, and restarts any that die
+    :param host: host to listen on
+    :param port: port to listen on
+    :param processes: number of worker processes, 1 serves from this process without forking
+    :param threads: waitress threads per worker
+    :param fd: listening socket handed over by the supervisor, see inherit()
+    :param ready: workers print READY_LINE once serving
+    """
+    if processes > 1 and not hasattr(os, 'fork'):
+        raise RuntimeError('Prefork workers need os.fork (Linux or macOS)')
+
+    # import (and register actions, events, links) once, workers inherit it all
+    # (main rather than wsgi, each worker replays the write-ahead log itself)
+    from main import app
+    from components.metrics.metrics import metrics
+
+    sock = inherit(fd) if fd else listen(host, port)
+    if processes == 1:
+        run_worker(app, sock, threads, ready)
+        return
+
+    share_state()
+    workers = {}  # pid -> forked at
+    stopping = False
+
+    def fork():
+        pid = os.fork()
+        if pid == 0:
+            run_worker(app, sock, threads, ready)
+        workers[pid] = time.monotonic()
+        logger.info(f'PREFORK WORKER STARTED --->\tpid {pid}')
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(workers):
+            try:
+                os.kill(pid, DRAIN_SIGNAL)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    for _ in range(processes):
+        fork()
+    logger.info(f'PREFORK SERVING --->\thttp://{host}:{port}, {processes} worker(s) x {threads} thread(s)')
+
+    while workers:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        forked_at = workers.pop(pid, None)
+        if forked_at is None:
+            continue
+        # what it was doing is over, what it did still counts
+        metrics.retire(pid)
+        if stopping:
+            continue
+
+        logger.warning(f'PREFORK WORKER EXITED --->\tpid {pid}, status {status}, restarting')
+        if time.monotonic() - forked_at < RESPAWN_BACKOFF:
+            time.sleep(RESPAWN_BACKOFF)
+        fork()
+
+    sock.close()
+    shutil.rmtree(metrics.directory, ignore_errors=True)
+    logger.info('PREFORK STOPPED')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve the app from prefork workers')
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--processes', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--fd', default=None, help='listening socket handed over by the supervisor')
+    parser.add_argument('--ready', action='store_true', help='print a line once each worker serves requests')
+    args = parser.parse_args()
+    serve_prefork(args.host, args.port, args.processes, args.threads, args.fd, args.ready)
+
+
+if __name__ == '__main__':
+    main()
@@ -65,14 +65,34 @@ def register_event(event_name: str):
 
 
 def register_link(link: tuple, event_manager, action_manager):
+    """
+    Links an action to an event.
+    :param link: (action name, event name) or (action name, event name, (names of actions it runs after,))
+    :return: bool
+    """
     try:
         action = action_manager.get(link[0])
         event = event_manager.get(link[1])
-        event.add_action(action)
-        logger.info(f'Link "{link[0]} -> {link[1]}" registered successfully!')
+        after = tuple(link[2]) if len(link) > 2 else ()
+        event.add_action(action, after=after)
+        logger.info(f'Link "{link[0]} -> {link[1]}"{f" (after {after})" if after else ""} registered successfully!')
         return True
     except Exception as e:
         logger.error(f'Link "{link[0]} -> {link[1]}" failed to register!')
         logger.error(e)
         # print stack trace
         traceback.print_exc()
+
+
+def build_action_graphs(event_manager):
+    """
+    Builds the action dependency graph of every event, once links are registered.
+    Events whose dependencies cannot be satisfied are deactivated rather than running actions out of order.
+    :param event_manager: EventManager()
+    """
+    for event in event_manager.get_all():
+        try:
+            event.build_graph()
+        except ValueError as e:
+            event.active = False
+            logger.error(f'Event "{event.name}" deactivated, its action dependencies are invalid: {e}')
@@ -0,0 +1,198 @@
+# supervisor: owns the listening socket and runs generations of workers on it. A reload starts a new generation,
+# waits until its workers are warmed up and serving, then drains the old one: the socket never stops listening.
+import argparse
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+from commons import READY_TIMEOUT, DRAIN_TIMEOUT
+from utils.log import get_logger
+from utils.prefork import listen, READY_LINE
+
+logger = get_logger(__name__)
+
+# pid of the running supervisor, read by `tvwb.py reload`
+PID_FILE = '.supervisor.pid'
+# created by `tvwb.py reload` where there is no SIGHUP (Windows), the supervisor reloads and removes it
+RELOAD_FILE = '.supervisor.reload'
+
+# a drained generation still running this long after DRAIN_TIMEOUT is killed
+KILL_GRACE = 5.0
+
+
+class Generation:
+    """
+    A generation of workers (a utils.prefork process) serving the listening socket handed over by the supervisor
+    """
+
+    def __init__(self, number: int, sock, processes: int, threads: int):
+        self.number = number
+        self.processes = processes
+        self.ready = threading.Event()
+        self._ready_workers = set()
+
+        command = [sys.executable, '-m', 'utils.prefork', f'--processes={processes}', f'--threads={threads}', '--ready']
+        if os.name == 'nt':
+            # no fd inheritance, the socket is shared through stdin, and drained with CTRL_BREAK_EVENT
+            command.append('--fd=stdin')
+            options = {'creationflags': subprocess.CREATE_NEW_PROCESS_GROUP}
+        else:
+            command.append(f'--fd={sock.fileno()}')
+            options = {'pass_fds': (sock.fileno(),)}
+        self.process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True, **options)
+        if os.name == 'nt':
+            self.process.stdin.write(sock.share(self.process.pid).hex() + '\n')
+            self.process.stdin.flush()
+
+        threading.Thread(target=self._read, name=f'generation-{number}', daemon=True).start()
+        logger.info(f'GENERATION STARTED --->\t#{number}, pid {self.process.pid}, {processes} worker(s)')
+
+    def _read(self):
+        # workers report ready on stdout, anything else (i.e. print() in actions) is passed through
+        for line in self.process.stdout:
+            if line.startswith(READY_LINE):
+                self._ready_workers.add(line.split()[-1])
+                if len(self._ready_workers) >= self.processes:
+                    self.ready.set()
+            else:
+                sys.stdout.write(line)
+                sys.stdout.flush()
+
+    @property
+    def alive(self):
+        return self.process.poll() is None
+
+    def wait_ready(self, timeout: float) -> bool:
+        """
+        Waits until every worker replayed its write-ahead log, warmed up its broker connections and serves
+        :return: False if the generation exited or was not ready in time
+        """
+        deadline = time.monotonic() + timeout
+        while not self.ready.wait(0.1):
+            if not self.alive or time.monotonic() >= deadline:
+                return False
+        return True
+
+    def drain(self):
+        """
+        Asks the workers to stop accepting, finish in-flight requests and accepted alerts, then exit
+        """
+        if self.alive:
+            logger.info(f'GENERATION DRAINING --->\t#{self.number}')
+            self.process.send_signal(signal.CTRL_BREAK_EVENT if os.name == 'nt' else signal.SIGTERM)
+
+    def stop(self, timeout: float = DRAIN_TIMEOUT + KILL_GRACE):
+        """
+        Drains the generation, killing it if it is still running after timeout seconds
+        """
+        self.drain()
+        try:
+            self.process.wait(timeout)
+        except subprocess.TimeoutExpired:
+            logger.error(f'GENERATION KILLED --->\t#{self.number} did not drain in {timeout}s')
+            self.process.kill()
+            self.process.wait()
+        logger.info(f'GENERATION STOPPED --->\t#{self.number}')
+
+
+def supervise(host: str, port: int, processes: int, threads: int):
+    """
+    Serves the app from successive worker generations until stopped, reloading on SIGHUP (or RELOAD_FILE)
+    :param host: host to listen on
+    :param port: port to listen on
+    :param processes: worker processes per generation
+    :param threads: waitress threads per worker
+    """
+    sock = listen(host, port)
+    reload_requested = threading.Event()
+    stopping = threading.Event()
+
+    if hasattr(signal, 'SIGHUP'):
+        signal.signal(signal.SIGHUP, lambda signum, frame: reload_requested.set())
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopping.set())
+    signal.signal(signal.SIGINT, lambda signum, frame: stopping.set())
+
+    with open(PID_FILE, 'w') as pid_file:
+        pid_file.write(str(os.getpid()))
+
+    generation = Generation(1, sock, processes, threads)
+    if not generation.wait_ready(READY_TIMEOUT):
+        generation.stop()
+        raise RuntimeError('Workers did not start, see the errors above')
+    logger.info(f'SUPERVISOR SERVING --->\thttp://{host}:{port}, generation #{generation.number}')
+
+    try:
+        while not stopping.wait(0.2):
+            if os.path.exists(RELOAD_FILE):
+                os.remove(RELOAD_FILE)
+                reload_requested.set()
+
+            if reload_requested.is_set():
+                reload_requested.clear()
+                generation = reload(generation, sock, processes, threads)
+            elif not generation.alive:
+                # the old generation (if any) is gone, nothing else is accepting: replace it right away
+                logger.error(f'GENERATION EXITED --->\t#{generation.number}, status {generation.process.returncode}')
+                generation = Generation(generation.number + 1, sock, processes, threads)
+    finally:
+        generation.stop()
+        sock.close()
+        try:
+            os.remove(PID_FILE)
+        except OSError:
+            pass
+        logger.info('SUPERVISOR STOPPED')
+
+
+def reload(current: Generation, sock, processes: int, threads: int) -> Generation:
+    """
+    Starts a new generation, and drains the current one once the new one is ready
+    :return: the generation now serving
+    """
+    new = Generation(current.number + 1, sock, processes, threads)
+    if not new.wait_ready(READY_TIMEOUT):
+        logger.error(f'RELOAD FAILED --->\tgeneration #{new.number} not ready, #{current.number} keeps serving')
+        new.stop()
+        return current
+
+    # both generations accept from the same socket until the old one stops accepting, no connection is refused
+    threading.Thread(target=current.stop, name=f'drain-{current.number}', daemon=True).start()
+    logger.info(f'RELOADED --->\tgeneration #{new.number} serving, #{current.number} draining')
+    return new
+
+
+def request_reload():
+    """
+    Asks the running supervisor to reload
+    :return: False if no supervisor is running
+    """
+    try:
+        with open(PID_FILE, 'r') as pid_file:
+            pid = int(pid_file.read().strip())
+    except (FileNotFoundError, ValueError):
+        return False
+    if hasattr(signal, 'SIGHUP'):
+        try:
+            os.kill(pid, signal.SIGHUP)
+        except ProcessLookupError:
+            return False
+    else:
+        open(RELOAD_FILE, 'w').close()
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve the app from supervised worker generations')
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--processes', type=int, default=1)
+    parser.add_argument('--threads', type=int, default=4)
+    args = parser.parse_args()
+    supervise(args.host, args.port, args.processes, args.threads)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,8 @@
+import handlers
 from main import app
 
+# trigger again the alerts accepted before a restart whose actions never ran
+handlers.replay_wal()
+
 if __name__ == '__main__':
-    app.run()
\ No newline at end of file
+    app.run()